@@ -10,21 +10,21 @@ from typing import (
     TypedDict,
     Set,
     AsyncGenerator,
+    Awaitable,
+    Callable,
 )
 from itertools import combinations
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_classic.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser, JsonOutputParser
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langchain_core.language_models.chat_models import (
     BaseChatModel,
 )  # Import BaseChatModel
-from langchain_openai import ChatOpenAI  # Import ChatOpenAI
 from langchain_core.documents import Document
+from langchain_core.runnables import Runnable
 from datetime import datetime
 import logging
-from cachetools import TTLCache
 import json
 from asyncio import Lock, Event
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -33,10 +33,9 @@ from langchain_classic.chains.summarize import load_summarize_chain
 from bs4 import BeautifulSoup  # Added import
 from contextlib import asynccontextmanager
 import asyncio
-import re
+import time
 
 # Removed SQLiteCache import
-from langchain_classic.output_parsers import OutputFixingParser
 from pydantic import BaseModel, Field, ValidationError
 from datetime import timezone, timedelta
 from api_key_manager import ApiKeyManager
@@ -47,7 +46,22 @@ from database import (
     CharacterRelationship, Event, Location, EventConnection, LocationConnection,
     KnowledgeBaseItem # Added
 )
-from vector_store import VectorStore
+from vector_store import VectorStore, CHUNKED_CONTENT_TYPES, normalize_entity_name, point_key
+from vector_reconcile import ReconcilePlan, RECONCILE_POINT_FIELDS
+from embedding_cache import content_hash
+from kb_write_queue import kb_write_queue
+from token_estimator import token_estimator
+from llm_clients import llm_clients, route_model
+from gemini_cache import gemini_caches
+from structured_output import structured_output, StructuredOutputError
+from prompt_segments import (
+    SegmentedPrompt,
+    TIER_STATIC,
+    TIER_PROJECT,
+    TIER_BATCH,
+    TIER_CALL,
+    prompt_cache_provider,
+)
 from graph_manager import GraphManager  # Added import
 from models import (
     ChapterValidation,
@@ -66,8 +80,12 @@ from models import (
     EventConnectionBase,
     EventConnectionAnalysis,
     CodexExtraction,
+    CodexItemCreate,
     ProactiveSuggestionsResponse,
     ProactiveAssistRequest,
+    ExtractedLocationList,
+    ExtractedEventList,
+    LocationConnectionSuggestionList,
 )
 import io
 
@@ -85,9 +103,81 @@ PROCESS_TYPES = {
     "LOCATIONS": "locations",
     "EVENTS": "events",
 }
-OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
-SITE_URL = "https://github.com/LotusSerene/scrollwise-ai"
-SITE_NAME = "ScrollWise AI"
+
+# Stored chapter summaries (see AgentManager.summarize_chapters)
+SUMMARY_LEVEL_CHAPTER = "chapter"
+SUMMARY_LEVEL_ARC = "arc"  # A run of SUMMARY_ARC_SIZE chapters, stored under its first chapter
+SUMMARY_LEVEL_BOOK = "book"  # All arcs but the most recent ones, stored under the first chapter
+SUMMARY_CONCURRENCY = 3
+SUMMARY_CHAPTER_TOKENS = 2500  # Chapters longer than this are summarized; shorter ones are used as-is
+SUMMARY_ARC_SIZE = 10
+SUMMARY_RECENT_ARCS = 3  # Arcs kept out of the book summary so recent events stay detailed
+
+# Vector store reconciliation (DB rows vs. indexed points)
+RECONCILE_PAGE_SIZE = 500
+RECONCILE_MAX_REPAIRS = 200  # Items re-embedded per pass; the rest wait for the next one
+RECONCILE_GRACE_SECONDS = 300  # Rows/points younger than this may still have a write in flight
+# Point types owned by chapters/codex items; KB item types present in the DB are added per pass
+RECONCILE_OWNED_TYPES = {"chapter", "character", "worldbuilding", "item", "lore", "faction", "uploaded_file"}
+# Types also written for other tables (events, locations, relationships, backstories); never treated as orphans
+RECONCILE_SHARED_TYPES = {"event", "location", "relationship", "character_backstory"}
+RECONCILE_PRESENCE_ONLY_TYPES = {"uploaded_file"}
+
+# Streamed LLM text is sent as one "token" event per this many characters or seconds,
+# whichever comes first, so a run's events fit in the generation event history
+TOKEN_EVENT_MIN_CHARS = 400
+TOKEN_EVENT_MAX_SECONDS = 0.5
+
+# Smallest chapter prompt prefix put in a Gemini context cache, counted by the model's tokenizer
+# (the API minimum for Flash models; models with a higher minimum fail creation and fall back
+# to sending the prefix)
+GEMINI_CACHE_MIN_TOKENS = 1024
+
+# Fixed part of the chapter prompt. Keep per-request values out of it so it stays a
+# cacheable prefix; they go in the later segments built by _create_chapter_prompt.
+CHAPTER_PROMPT_RULES = """You are a skilled author writing a chapter for a novel. Your goal is to write in a style that is engaging, natural, and human-like. Adhere STRICTLY to all requirements.
+
+**HUMAN-LIKE WRITING GUIDELINES (MANDATORY):**
+*   Clarity and Simplicity: Prioritize clear communication. Use straightforward language and sentence structures.
+*   Natural Vocabulary: Employ common, everyday words. Avoid overly complex, academic, or obscure vocabulary.
+*   Engaging Tone: Write in a way that captivates the reader. Make the prose flow naturally and conversationally.
+*   Avoid AI Tropes: Do not use overly formal language, excessive adverbs, or repetitive sentence beginnings that can make writing sound robotic.
+
+**HOW TO USE THE MATERIAL BELOW:**
+The PROJECT DESCRIPTION, WRITING STYLE, STYLE GUIDE and OVERALL PLOT describe the whole work. The 'CONTEXT' section includes:
+1.  Previously generated chapters in this current batch - MOST IMPORTANT for maintaining direct narrative continuity
+2.  Relevant information from older chapters and the project's knowledge base.
+3.  The specific structural placement for *this* chapter (e.g., 'Current Structural Context for this Chapter: Act I > Stage 1 > Substage A').
+4.  The **FULL PROJECT STRUCTURE**, which lists all Acts, Stages, and Substages, along with any chapters currently linked to them.
+Use this comprehensive context to understand the chapter's placement within the larger narrative arc and to ensure thematic and plot consistency. The chapter to write, its plot focus, additional instructions and word count target are given in the user message; the core action of the chapter should revolve around that plot focus.
+
+**NARRATIVE CONTINUITY REQUIREMENTS (CRITICAL):**
+1. Your chapter MUST coherently continue the storyline from any previous chapters in the current batch.
+2. Characters, settings, and plot elements should maintain precise consistency with previous chapters.
+3. Respect the chronological flow of events established in previous chapters.
+4. Avoid contradicting any events, dialogue or character decisions from previous chapters.
+5. Pick up naturally from the ending of the most recent chapter if applicable.
+
+**WRITING REQUIREMENTS (MANDATORY):**
+1.  Writing Style: Apply the WRITING STYLE METICULOUSLY to every sentence, keeping the Human-Like Writing Guidelines in mind.
+2.  Style Guide: Follow the STYLE GUIDE EXACTLY, ensuring it aligns with the Human-Like Writing Guidelines.
+3.  Additional Instructions: Incorporate the additional instructions precisely.
+4.  Word Count: Aim for the approximate word count target naturally.
+
+**FORMATTING (MANDATORY):**
+*   Use HTML `<p>` tags for paragraphs. Ensure proper paragraph separation.
+*   Inside `<p>` tags, format dialogue correctly (e.g., using quotation marks).
+*   Use HTML `<h3>***</h3>` for major scene breaks if appropriate.
+
+**CRITICAL RULES:**
+*   NEVER write the word "Codex".
+*   Follow the specified Writing Style and Style Guide WITHOUT FAIL.
+*   Stay EXACTLY true to the Plot/Setting focus provided for this chapter.
+*   Maintain PERFECT continuity with previous chapters in this generation batch.
+*   Incorporate ALL requirements.
+*   If specific sentence structures or endings are required, apply them CONSISTENTLY.
+
+Start directly with the first `<p>` tag. Do not include a chapter heading like "Chapter X: Title" or wrap the entire output in other tags like `<html>` or `<body>`."""
 
 
 # --- LangGraph State ---
@@ -118,6 +208,7 @@ class ChapterGenerationState(TypedDict):
     check_llm: BaseChatModel  # Use BaseChatModel type hint
     vector_store: VectorStore
     summarize_chain: Any  # Type hint could be improved
+    on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]]  # Progress/token sink (streaming mode)
 
     # Intermediate results
     context: Optional[str] = None
@@ -146,8 +237,8 @@ class ChapterGenerationState(TypedDict):
 
 
 class AgentManager:
-    _llm_cache = TTLCache(maxsize=100, ttl=3600)  # Class-level cache for LLM instances
     _graph_cache = {}  # Cache for compiled graphs per project
+    _summary_inflight: Dict[tuple, asyncio.Future] = {}  # (chapter_id, content_hash, level) -> pending summary
 
     def __init__(self, user_id: str, project_id: str, api_key_manager: ApiKeyManager):
         self.logger = logging.getLogger(__name__)
@@ -168,6 +259,8 @@ class AgentManager:
         self._lock = Lock()  # Lock for managing shared resources like caches
         self.chapter_generation_graph = None  # Compiled LangGraph
         self.last_accessed = datetime.now(timezone.utc)  # Track last access time
+        self.write_queue_key = (user_id, project_id)
+        self._index_task: Optional[asyncio.Task] = None  # Background migration / initial fill
 
     @classmethod
     async def create(
@@ -244,24 +337,16 @@ class AgentManager:
             self.check_llm = await self._get_llm(self.model_settings["checkLLM"])
 
             # Initialize Vector Store (using Gemini embeddings key)
-            self.vector_store = VectorStore(
+            self.vector_store = await VectorStore.create(
                 self.user_id,
                 self.project_id,
                 self.api_key,  # Use Gemini key for embeddings
                 self.model_settings["embeddingsModel"],
+                embedding_dimensions=self.model_settings["embeddingDimensions"],
+                dense_rescoring=self.model_settings["denseRescoring"],
             )
-            
-            # Check for migration OR empty collection (indicating failed previous migration or new project)
-            # Safe to run even for empty projects as it just checks DB and adds nothing if DB is empty
-            needs_migration = getattr(self.vector_store, "needs_migration", False)
-            doc_count = await self.vector_store.get_count()
-            
-            if needs_migration or doc_count == 0:
-                reason = "schema migration" if needs_migration else "empty collection"
-                self.logger.info(f"Project {self.project_id} requires vector store update ({reason}). Starting reindexing...")
-                await self._perform_vector_migration()
-                self.logger.info(f"Project {self.project_id} migration/reindexing completed.")
-            
+            self.vector_store.before_read = self.flush_pending_knowledge_base_updates
+
             self.vector_store.set_llm(self.llm)  # Pass main LLM if needed by VS
 
             # Initialize Summarize Chain (using the appropriate LLM instance)
@@ -272,6 +357,10 @@ class AgentManager:
             # Build and compile the chapter generation graph
             self.chapter_generation_graph = self._build_chapter_generation_graph()
 
+            # Migration and initial fill run after the manager is usable, so endpoints
+            # aren't held up by a full reindex
+            self._index_task = asyncio.create_task(self._build_vector_index())
+
             self.logger.info(
                 f"AgentManager Initialized for User: {self.user_id[:8]}, Project: {self.project_id[:8]}"
             )
@@ -280,127 +369,476 @@ class AgentManager:
             self.logger.error(f"Failed to initialize AgentManager: {e}", exc_info=True)
             raise  # Re-raise exception to indicate initialization failure
 
+    @property
+    def indexing(self) -> bool:
+        """Whether a background migration or initial fill of the vector store is running."""
+        return self._index_task is not None and not self._index_task.done()
+
+    async def stop_indexing(self):
+        """
+        Cancels a running background migration or fill, e.g. before a snapshot import
+        replaces the index anyway. An interrupted reindex resumes from its checkpoint.
+        """
+        if self._index_task is not None and not self._index_task.done():
+            self._index_task.cancel()
+            try:
+                await self._index_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _build_vector_index(self):
+        """
+        Brings the vector store up to date in the background after initialize.
+
+        A schema change needs a full rebuild into a shadow collection; until it is
+        swapped in, searches run against the live collection (sparse only if its
+        dense layout is outdated) and progress shows in qdrant_registry.reindex_status().
+        Edits made during the rebuild land in the replaced collection, so a reconcile
+        pass that includes recently changed rows re-applies them once the rebuild is
+        swapped in. An empty collection (new project or lost index) is filled by the
+        reconciler, which only embeds what the DB has. Any other drift is repaired by
+        the periodic reconcile pass.
+        """
+        try:
+            if getattr(self.vector_store, "needs_migration", False):
+                self.logger.info(
+                    f"Project {self.project_id} requires vector store update (schema migration). "
+                    "Reindexing in the background..."
+                )
+                await self._perform_vector_migration()
+                await self.reconcile_vector_store(max_repairs=None, include_recent=True)
+                self.logger.info(f"Project {self.project_id} migration/reindexing completed.")
+            elif await self.vector_store.get_count() == 0:
+                await self.reconcile_vector_store(max_repairs=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The reindex resumes from its checkpoint on the next initialize, and the
+            # periodic reconcile pass retries an incomplete fill
+            self.logger.error(
+                f"Background indexing failed for project {self.project_id}: {e}", exc_info=True
+            )
+
     async def _perform_vector_migration(self):
         """
         Fetches all project data and re-indexes it into the vector store.
         Used when a schema migration is detected.
+
+        The rebuild goes into a shadow collection that is swapped in when complete,
+        so the current index stays searchable and an interrupted run resumes from
+        its last checkpoint on the next initialize. Presence-only items (uploaded
+        files, of which the DB only keeps a preview) are rebuilt from the full text
+        held by their point in the live collection.
         """
         try:
-            async with db_instance.Session() as session:
-                # 1. Fetch Codex Items
-                codex_items_result = await session.execute(
-                    select(CodexItem).where(
-                        CodexItem.user_id == self.user_id,
-                        CodexItem.project_id == self.project_id
-                    )
+            items = []
+            async for page in self._iter_index_items():
+                items.extend(page)
+            live_texts = await self._live_index_texts(
+                [item for item in items if item.get("presence_only")]
+            )
+
+            texts = []
+            metadatas = []
+            ids = []
+            for item in items:
+                texts.append(live_texts.get(item["db_id"], item["text"]))
+                metadatas.append(item["metadata"])
+                ids.append(item["point_id"])
+
+            # Rebuild into a shadow collection (long-form types go through the chunked index)
+            if texts or getattr(self.vector_store, "needs_migration", False):
+                progress = await self.vector_store.reindex(texts, metadatas, ids)
+                self.logger.info(
+                    f"Migrated {len(texts)} items for project {self.project_id} "
+                    f"({progress.get('skipped', 0)} resumed from checkpoint)."
                 )
-                codex_items = codex_items_result.scalars().all()
-                
-                # 2. Fetch Chapters
-                chapters_result = await session.execute(
-                    select(Chapter).where(
-                        Chapter.user_id == self.user_id,
-                        Chapter.project_id == self.project_id
-                    )
+            else:
+                self.logger.info(f"No items to migrate for project {self.project_id}.")
+
+        except Exception as e:
+            self.logger.error(f"Error during vector migration: {e}")
+            raise
+
+    async def _live_index_texts(self, items: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Full text of each item's point (the chunked parent, or a legacy unchunked point)
+        in the current collection, keyed by DB ID. Items without a point are left out.
+        """
+        if not items:
+            return {}
+        rows = await self.vector_store.scan_payload(
+            ["id", "page_content"],
+            filter={"type": {"$in": sorted({item["type"] for item in items})}},
+        )
+        rows_by_id = {row["point_id"]: row for row in rows}
+        rows_by_payload_id = {str(row["id"]): row for row in rows if row.get("id") is not None}
+        texts = {}
+        for item in items:
+            row = (
+                rows_by_id.get(point_key(item["point_id"]))
+                or rows_by_id.get(point_key(item["db_id"]))
+                or rows_by_payload_id.get(str(item["db_id"]))
+            )
+            if row and row.get("page_content"):
+                texts[item["db_id"]] = row["page_content"]
+            else:
+                self.logger.warning(
+                    f"No indexed content for {item['type']} {item['db_id']}; "
+                    "reindexing its stored preview instead"
                 )
-                chapters = chapters_result.scalars().all()
+        return texts
+
+    def _chapter_index_item(self, chapter: Chapter) -> Optional[Dict[str, Any]]:
+        if not chapter.content:
+            return None
+        return {
+            "source": "chapter",
+            "db_id": chapter.id,
+            "embedding_id": chapter.embedding_id,
+            "point_id": chapter.embedding_id or chapter.id,
+            "type": "chapter",
+            "text": chapter.content,
+            "metadata": {
+                "id": chapter.id,
+                "type": "chapter",
+                "title": chapter.title,
+                "chapter_number": chapter.chapter_number,
+                "structure_item_id": chapter.structure_item_id,
+                "project_id": self.project_id,
+                "user_id": self.user_id,
+            },
+            "modified_at": chapter.updated_at or chapter.created_at,
+        }
+
+    def _codex_index_item(self, item: CodexItem) -> Optional[Dict[str, Any]]:
+        if not item.description:
+            return None
+        return {
+            "source": "codex",
+            "db_id": item.id,
+            "embedding_id": item.embedding_id,
+            "point_id": item.embedding_id or item.id,
+            "type": item.type,
+            "text": item.description,
+            "metadata": {
+                "id": item.id,
+                "type": item.type,
+                "name": item.name,
+                "subtype": item.subtype,
+                "project_id": self.project_id,
+                "user_id": self.user_id,
+            },
+            "modified_at": item.updated_at or item.created_at,
+        }
+
+    def _kb_index_item(self, kb_item: KnowledgeBaseItem) -> Optional[Dict[str, Any]]:
+        if not kb_item.content:
+            return None
+        metadata = dict(kb_item.item_metadata or {})
+        payload_id = metadata.get("id")
+        metadata["id"] = kb_item.id
+        metadata["type"] = kb_item.type
+        metadata["project_id"] = self.project_id
+        metadata["user_id"] = self.user_id
+        metadata["source"] = kb_item.source
+        return {
+            "source": "knowledge_base",
+            "db_id": kb_item.id,
+            "embedding_id": kb_item.embedding_id,
+            "point_id": kb_item.embedding_id or kb_item.id,
+            "alias_id": payload_id,
+            "type": kb_item.type,
+            "text": kb_item.content,
+            "metadata": metadata,
+            # The DB only keeps a preview of uploaded files, so it can't be re-embedded from here
+            "presence_only": kb_item.type in RECONCILE_PRESENCE_ONLY_TYPES,
+            "modified_at": kb_item.created_at,
+        }
 
-                # 3. Fetch Knowledge Base Items
-                kb_items_result = await session.execute(
-                    select(KnowledgeBaseItem).where(
-                        KnowledgeBaseItem.user_id == self.user_id,
-                        KnowledgeBaseItem.project_id == self.project_id
+    async def _iter_index_items(self, page_size: int = RECONCILE_PAGE_SIZE):
+        """
+        Yields the project's indexable DB rows in pages, as dicts with the point ID,
+        canonical text and payload metadata. The canonical text is exactly what the
+        server's write paths embed (chapter content, codex description, KB content),
+        so an up-to-date point carries its content_hash.
+        """
+        sources = (
+            (Chapter, self._chapter_index_item),
+            (CodexItem, self._codex_index_item),
+            (KnowledgeBaseItem, self._kb_index_item),
+        )
+        for model, to_item in sources:
+            offset = 0
+            while True:
+                async with db_instance.Session() as session:
+                    result = await session.execute(
+                        select(model)
+                        .where(
+                            model.user_id == self.user_id,
+                            model.project_id == self.project_id,
+                        )
+                        .order_by(model.id)
+                        .offset(offset)
+                        .limit(page_size)
                     )
+                    rows = result.scalars().all()
+                if not rows:
+                    break
+                yield [item for item in map(to_item, rows) if item is not None]
+                if len(rows) < page_size:
+                    break
+                offset += len(rows)
+
+    async def _known_entity_ids(self) -> Set[str]:
+        """IDs of rows from tables whose points are written outside the reconciled types."""
+        known = set()
+        async with db_instance.Session() as session:
+            for model in (
+                Event,
+                Location,
+                CharacterRelationship,
+                EventConnection,
+                LocationConnection,
+            ):
+                result = await session.execute(
+                    select(model.id).where(model.project_id == self.project_id)
                 )
-                kb_items = kb_items_result.scalars().all()
-
-                # Recreate Collection
-                self.vector_store.recreate_collection()
-
-                texts = []
-                metadatas = []
-                ids = []
-
-                # Process Codex Items
-                for item in codex_items:
-                    text_content = f"{item.name}: {item.description}"
-                    if item.backstory:
-                        text_content += f"\nBackstory: {item.backstory}"
-                    
-                    metadata = {
-                        "id": item.id,
-                        "type": item.type,
-                        "name": item.name,
-                        "project_id": self.project_id,
-                        "user_id": self.user_id,
-                        "subtype": item.subtype
-                    }
-                    
-                    texts.append(text_content)
-                    metadatas.append(metadata)
-                    ids.append(item.id)
-
-                # Process Chapters
-                for chapter in chapters:
-                    if not chapter.content:
-                        continue
-                        
-                    text_content = f"Chapter {chapter.chapter_number}: {chapter.title}\n{chapter.content}"
-                    
-                    metadata = {
-                        "id": chapter.id,
-                        "type": "chapter",
-                        "title": chapter.title,
-                        "chapter_number": chapter.chapter_number,
-                        "project_id": self.project_id,
-                        "user_id": self.user_id
-                    }
-                    
-                    texts.append(text_content)
-                    metadatas.append(metadata)
-                    ids.append(chapter.id)
-
-                # Process KB Items
-                for kb_item in kb_items:
-                    if not kb_item.content:
-                        continue
-
-                    metadata = kb_item.item_metadata or {}
-                    metadata["id"] = kb_item.id
-                    metadata["type"] = kb_item.type
-                    metadata["project_id"] = self.project_id
-                    metadata["user_id"] = self.user_id
-                    metadata["source"] = kb_item.source
-                    
-                    texts.append(kb_item.content)
-                    metadatas.append(metadata)
-                    ids.append(kb_item.id)
-
-                # Add to VectorStore
-                if texts:
-                    await self.vector_store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
-                    self.logger.info(f"Migrated {len(texts)} items for project {self.project_id}.")
-                else:
-                    self.logger.info(f"No items to migrate for project {self.project_id}.")
+                known.update(str(row_id) for row_id in result.scalars().all())
+        return known
 
+    async def reconcile_vector_store(
+        self,
+        max_repairs: Optional[int] = RECONCILE_MAX_REPAIRS,
+        include_recent: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Diffs the project's DB rows against the points in its collection and repairs the drift.
+
+        Points are read page by page with a payload-only scroll into a compact index (IDs,
+        types and content hashes, no vectors or text) and DB rows are read in bounded
+        pages; ReconcilePlan makes the decisions. Only rows whose point is
+        missing or whose content_hash differs are re-embedded, duplicate points for the
+        same row are removed, and points of reconciled types that no row refers to are
+        deleted. Rows and points touched within RECONCILE_GRACE_SECONDS are left for the
+        next pass so in-flight writes are never mistaken for drift; include_recent repairs
+        recently changed rows too (re-embedding a row is idempotent), which is needed right
+        after a reindex swap. At most max_repairs items are re-embedded per pass (None for
+        no limit); the rest are reported as deferred.
+        """
+        started = time.perf_counter()
+        vector_store = self.vector_store
+        await vector_store.backfill_content_hashes()
+        plan = ReconcilePlan(
+            RECONCILE_OWNED_TYPES,
+            RECONCILE_SHARED_TYPES,
+            await self._known_entity_ids(),
+            RECONCILE_GRACE_SECONDS,
+            include_recent=include_recent,
+        )
+        async for page in vector_store.iter_payload(RECONCILE_POINT_FIELDS):
+            plan.add_points(page)
+        async for page in self._iter_index_items():
+            plan.add_items(page)
+        missing, stale = plan.missing, plan.stale
+        duplicates, orphans = plan.duplicates, plan.orphans()
+        embedding_id_fixes = plan.embedding_id_fixes
+
+        budget = len(missing) + len(stale) if max_repairs is None else max_repairs
+        to_add = missing[:budget]
+        to_refresh = stale[: max(budget - len(to_add), 0)]
+        repaired, error = 0, None
+        try:
+            await vector_store.delete_points(duplicates + orphans)
+            plain = [item for item in to_add if item["type"] not in CHUNKED_CONTENT_TYPES]
+            chunked = [item for item in to_add if item["type"] in CHUNKED_CONTENT_TYPES]
+            if plain:
+                await vector_store.add_texts(
+                    [item["text"] for item in plain],
+                    [dict(item["metadata"]) for item in plain],
+                    ids=[point_key(item["point_id"]) for item in plain],
+                )
+            if chunked:
+                await vector_store.add_chunked_documents(
+                    [item["text"] for item in chunked],
+                    [dict(item["metadata"]) for item in chunked],
+                    ids=[point_key(item["point_id"]) for item in chunked],
+                )
+            repaired += len(to_add)
+            for item, point_id in to_refresh:
+                await vector_store.update_in_knowledge_base(point_id, item["text"], {})
+                repaired += 1
+            await self._write_back_embedding_ids(embedding_id_fixes)
         except Exception as e:
-            self.logger.error(f"Error during vector migration: {e}")
-            raise
+            error = str(e)
+            self.logger.error(
+                f"Vector store reconcile for project {self.project_id} failed after "
+                f"{repaired} repairs: {e}",
+                exc_info=True,
+            )
+
+        report = {
+            "db_rows": plan.db_rows,
+            "points": len(plan.points),
+            "missing": len(missing),
+            "stale": len(stale),
+            "orphans": len(orphans),
+            "duplicates": len(duplicates),
+            "unrecoverable": plan.unrecoverable,
+            "repaired": repaired,
+            "deferred": len(missing) + len(stale) - len(to_add) - len(to_refresh),
+            "error": error,
+            "seconds": round(time.perf_counter() - started, 3),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        drift = report["missing"] + report["stale"] + report["orphans"] + report["duplicates"]
+        if drift:
+            self.logger.info(f"Reconciled vector store for project {self.project_id}: {report}")
+        return report
+
+    async def _write_back_embedding_ids(self, fixes: List[tuple]):
+        """Points the DB rows at the point IDs the reconciler wrote or adopted for them."""
+        for item, point_id in fixes:
+            if item["source"] == "chapter":
+                await db_instance.update_chapter_embedding_id(item["db_id"], point_id)
+            elif item["source"] == "codex":
+                await db_instance.update_codex_item_embedding_id(item["db_id"], point_id)
+            else:
+                await db_instance.update_knowledge_base_item_embedding_id(
+                    item["db_id"], point_id, self.user_id, self.project_id
+                )
+
+    async def summarize_chapters(
+        self, items: List[Tuple[str, str, str]], stored: Optional[Dict[tuple, str]] = None
+    ) -> List[Optional[str]]:
+        """
+        Summaries for (chapter_id, text, level) items, in input order (None where one failed).
+
+        Summaries are stored per (chapter id, content hash, level), so text that was
+        summarized before is never sent to the summarize chain again; only new or edited
+        text is summarized (a few at a time) and stored for next time. Concurrent
+        requests for the same text share one chain call.
+        """
+        if not items:
+            return []
+        if stored is None:
+            stored = await db_instance.get_chapter_summaries(self.user_id, self.project_id)
+        slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+        model = self.model_settings.get("mainLLM") if self.model_settings else None
+
+        async def summarize(chapter_id: str, text: str, level: str) -> Optional[str]:
+            key = (chapter_id, content_hash(text), level)
+            if key in stored:
+                return stored[key]
+            pending = AgentManager._summary_inflight.get(key)
+            if pending is not None:
+                return await asyncio.shield(pending)
+            future = loop.create_future()
+            AgentManager._summary_inflight[key] = future
+            summary = None
+            try:
+                async with slots:
+                    result = await self.summarize_chain.ainvoke(
+                        {"input_documents": [Document(page_content=text)]}
+                    )
+                summary = result.get("output_text")
+                if summary:
+                    await db_instance.save_chapter_summary(
+                        chapter_id, self.user_id, self.project_id, level, key[1], summary, model
+                    )
+            except Exception as e:
+                self.logger.warning(f"Could not summarize {level} {chapter_id}: {e}")
+            finally:
+                future.set_result(summary)
+                AgentManager._summary_inflight.pop(key, None)
+            return summary
+
+        return list(await asyncio.gather(*(summarize(*item) for item in items)))
+
+    async def summarize_manuscript(self, chapters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Chapter -> arc -> book summary tree for chapters (sorted by chapter number).
+
+        Chapters longer than SUMMARY_CHAPTER_TOKENS are summarized on their own; shorter
+        ones stand for themselves. Each run of SUMMARY_ARC_SIZE chapters is summarized
+        from those chapter texts into an arc, and all arcs except the last
+        SUMMARY_RECENT_ARCS are summarized into one book node. Every node is stored under
+        the hash of its input, so an edit re-summarizes only the chapter and the nodes
+        above it, and an unchanged manuscript costs no summarize calls at all.
+
+        Returns {"arcs": [(first_number, last_number, summary)], "book": summary or None,
+        "book_arcs": number of arcs covered by the book}.
+        """
+        tree = {"arcs": [], "book": None, "book_arcs": 0}
+        if not chapters:
+            return tree
+        stored = await db_instance.get_chapter_summaries(self.user_id, self.project_id)
+
+        long_chapters = [
+            ch
+            for ch in chapters
+            if self.estimate_token_count(ch.get("content", "")) > SUMMARY_CHAPTER_TOKENS
+        ]
+        chapter_summaries = await self.summarize_chapters(
+            [(ch["id"], ch.get("content", ""), SUMMARY_LEVEL_CHAPTER) for ch in long_chapters],
+            stored,
+        )
+        summary_by_id = dict(zip((ch["id"] for ch in long_chapters), chapter_summaries))
+
+        def chapter_text(ch: Dict[str, Any]) -> str:
+            if ch["id"] in summary_by_id:
+                return summary_by_id[ch["id"]] or ch.get("content", "")[:2100]
+            return ch.get("content", "")
+
+        arcs = [
+            chapters[i : i + SUMMARY_ARC_SIZE] for i in range(0, len(chapters), SUMMARY_ARC_SIZE)
+        ]
+        arc_summaries = await self.summarize_chapters(
+            [
+                (
+                    arc[0]["id"],
+                    "\n\n---\n\n".join(
+                        f"Chapter {ch.get('chapter_number')}: {ch.get('title', '')}\n{chapter_text(ch)}"
+                        for ch in arc
+                    ),
+                    SUMMARY_LEVEL_ARC,
+                )
+                for arc in arcs
+            ],
+            stored,
+        )
+        tree["arcs"] = [
+            (arc[0].get("chapter_number", "?"), arc[-1].get("chapter_number", "?"), summary)
+            for arc, summary in zip(arcs, arc_summaries)
+        ]
+
+        folded = tree["arcs"][:-SUMMARY_RECENT_ARCS]
+        # A book node built on a missing arc would be stored and reused; list the arcs instead
+        if len(folded) > 1 and all(summary for _, _, summary in folded):
+            book_text = "\n\n---\n\n".join(
+                f"Chapters {first}-{last}:\n{summary}" for first, last, summary in folded
+            )
+            [book] = await self.summarize_chapters(
+                [(chapters[0]["id"], book_text, SUMMARY_LEVEL_BOOK)], stored
+            )
+            if book:
+                tree["book"] = book
+                tree["book_arcs"] = len(folded)
+        return tree
 
     async def close(self):
         """Cleans up resources like vector store connections."""
         self.logger.info(
             f"Closing AgentManager for User: {self.user_id[:8]}, Project: {self.project_id[:8]}"
         )
-        # Clear LLM cache entries specific to this manager if needed (though TTLCache handles expiry)
-        # self._llm_cache.clear() # Or selectively remove keys
+
+        await self.stop_indexing()
 
         if self.vector_store:
             try:
-                # Process any pending batched items before closing (if batching implemented)
-                # if hasattr(self, '_embedding_batch') and self._embedding_batch:
-                #    self.logger.info(f"Processing pending items before closing")
-                #    await self._process_embedding_batch() # Assuming this method exists
+                # Write queued (debounced) edits while this store can still take them
+                await self.flush_pending_knowledge_base_updates()
 
                 if hasattr(self.vector_store, "close") and callable(
                     self.vector_store.close
@@ -419,64 +857,6 @@ class AgentManager:
             f"AgentManager closed for User: {self.user_id[:8]}, Project: {self.project_id[:8]}"
         )
 
-    async def _get_or_create_gemini_cache(
-        self,
-        cache_name: str,
-        system_instruction: str,
-        contents: List[str] = None,
-        ttl_minutes: int = 60,
-    ) -> str:
-        """
-        Creates or retrieves a Gemini context cache using google-genai SDK.
-        Returns the cache name (resource name).
-        """
-        try:
-            from google import genai
-            from google.genai import types
-            
-            # Use the API key stored in the instance
-            client = genai.Client(api_key=self.api_key)
-
-            # List caches to find one with the matching display_name
-            # Note: The new SDK listing might be synchronous or async depending on client configuration.
-            # Assuming standard sync usage for now as per common migration patterns, or wrapping if needed.
-            
-            existing_cache = None
-            # Using the list method which returns an iterable
-            for c in client.caches.list():
-                if c.display_name == cache_name:
-                    existing_cache = c
-                    break
-
-            if existing_cache:
-                self.logger.info(f"Found existing Gemini cache: {existing_cache.name}")
-                # Update TTL
-                client.caches.update(
-                    name=existing_cache.name,
-                    config=types.UpdateCachedContentConfig(
-                        ttl=f"{ttl_minutes * 60}s" # TTL in seconds as string with 's' suffix
-                    )
-                )
-                return existing_cache.name
-
-            self.logger.info(f"Creating new Gemini cache: {cache_name}")
-            
-            # Create the cache
-            cached_content = client.caches.create(
-                model="models/gemini-flash-latest",
-                config=types.CreateCachedContentConfig(
-                    display_name=cache_name,
-                    system_instruction=system_instruction,
-                    contents=[types.Content(parts=[types.Part(text=c)]) for c in contents] if contents else [],
-                    ttl=f"{ttl_minutes * 60}s",
-                )
-            )
-            return cached_content.name
-
-        except Exception as e:
-            self.logger.error(f"Error creating Gemini cache: {e}")
-            return None
-
     def _apply_anthropic_caching(self, messages: List[BaseMessage]) -> List[BaseMessage]:
         """
         Applies Anthropic's cache_control to the system message or the last large user message.
@@ -509,144 +889,32 @@ class AgentManager:
     @retry(
         stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10)
     )
-    async def _get_llm(
-        self, model_name: str, cached_content_name: Optional[str] = None
-    ) -> BaseChatModel:  # Return BaseChatModel
-        """Gets or creates a LangChain ChatModel instance (Gemini or OpenRouter) with caching."""
-        
-        cache_key = f"{model_name}_{cached_content_name}" if cached_content_name else model_name
-        
-        async with self._lock:  # Protect access to the class-level cache
-            if cache_key in self._llm_cache:
-                self.logger.debug(f"LLM Cache HIT for model: {model_name} (Key: {cache_key})")
-                return self._llm_cache[cache_key]
-
-            self.logger.debug(
-                f"LLM Cache MISS for model: {model_name} (Key: {cache_key}). Creating new instance."
+    async def _get_llm(self, model_name: str) -> BaseChatModel:  # Return BaseChatModel
+        """Gets the shared LangChain ChatModel instance for a model setting and this user's key."""
+        provider, _ = route_model(model_name)
+        api_key = {
+            "openrouter": self.openrouter_api_key,
+            "anthropic": self.anthropic_api_key,
+            "openai": self.openai_api_key,
+            "gemini": self.api_key,
+        }[provider]
+        try:
+            return llm_clients.get(
+                model_name,
+                api_key,
+                float(self.model_settings.get("temperature", 0.7)),
             )
-
-            try:
-                llm_instance: BaseChatModel
-
-                # Check for OpenRouter prefix (e.g., "openrouter/openai/gpt-4o")
-                if model_name.startswith("openrouter/"):
-                    if not self.openrouter_api_key:
-                        self.logger.error(
-                            f"Attempted to use OpenRouter model '{model_name}' but OpenRouter API key is not set."
-                        )
-                        raise ValueError(
-                            "OpenRouter API key is required for this model but not configured."
-                        )
-
-                    # Extract the actual model identifier (e.g., "openai/gpt-4o")
-                    openrouter_model_id = model_name.split("openrouter/", 1)[1]
-
-                    self.logger.info(
-                        f"Initializing ChatOpenAI for OpenRouter model: {openrouter_model_id}"
-                    )
-                    # Configure ChatOpenAI for OpenRouter
-                    llm_instance = ChatOpenAI(
-                        model=openrouter_model_id,
-                        openai_api_key=self.openrouter_api_key,
-                        openai_api_base=OPENROUTER_API_BASE,
-                        temperature=float(self.model_settings.get("temperature", 0.7)),
-                        # max_tokens: ChatOpenAI might infer or have defaults. Can be set if needed.
-                        # max_retries=2, # Example option
-                        default_headers={  # Add required OpenRouter headers
-                            "HTTP-Referer": SITE_URL,
-                            "X-Title": SITE_NAME,
-                        },
-                        # Streaming is typically enabled by default or controlled by invoke/stream method
-                    )
-                    self.logger.info(
-                        f"ChatOpenAI instance created for OpenRouter model: {openrouter_model_id}"
-                    )
-
-                # Check for Anthropic prefix (e.g., "anthropic/claude-3-opus-20240229")
-                elif model_name.startswith("anthropic/"):
-                    if not self.anthropic_api_key:
-                        self.logger.error(
-                            f"Attempted to use Anthropic model '{model_name}' but Anthropic API key is not set."
-                        )
-                        raise ValueError(
-                            "Anthropic API key is required for this model but not configured."
-                        )
-
-                    anthropic_model_id = model_name.split("anthropic/", 1)[1]
-                    self.logger.info(
-                        f"Initializing ChatAnthropic for model: {anthropic_model_id}"
-                    )
-                    from langchain_anthropic import ChatAnthropic
-
-                    llm_instance = ChatAnthropic(
-                        model=anthropic_model_id,
-                        anthropic_api_key=self.anthropic_api_key,
-                        temperature=float(self.model_settings.get("temperature", 0.7)),
-                    )
-                    self.logger.info(
-                        f"ChatAnthropic instance created for model: {anthropic_model_id}"
-                    )
-
-                # Check for direct OpenAI prefix (e.g., "openai/gpt-4o")
-                elif model_name.startswith("openai/"):
-                    if not self.openai_api_key:
-                        self.logger.error(
-                            f"Attempted to use direct OpenAI model '{model_name}' but OpenAI API key is not set."
-                        )
-                        raise ValueError(
-                            "OpenAI API key is required for this model but not configured."
-                        )
-
-                    openai_model_id = model_name.split("openai/", 1)[1]
-                    self.logger.info(
-                        f"Initializing ChatOpenAI for direct model: {openai_model_id}"
-                    )
-                    llm_instance = ChatOpenAI(
-                        model=openai_model_id,
-                        openai_api_key=self.openai_api_key,
-                        temperature=float(self.model_settings.get("temperature", 0.7)),
-                    )
-                    self.logger.info(
-                        f"ChatOpenAI instance created for direct model: {openai_model_id}"
-                    )
-
-                # Default to Gemini if no specific prefix matches
-                else:
-                    if not self.api_key:
-                        self.logger.error(
-                            f"Attempted to use Gemini model '{model_name}' but Gemini API key is not set."
-                        )
-                        raise ValueError(
-                            "Gemini API key is required for this model but not configured."
-                        )
-
-                    self.logger.info(f"Initializing ChatGoogleGenerativeAI for model: {model_name}")
-                    llm_instance = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=self.api_key,
-                        temperature=float(self.model_settings.get("temperature", 0.7)),
-                        convert_system_message_to_human=True,
-                        cached_content=cached_content_name,
-                    )
-                    self.logger.info(
-                        f"ChatGoogleGenerativeAI instance created for model: {model_name}"
-                    )
-
-                # Cache the created instance
-                self._llm_cache[cache_key] = llm_instance
-                return llm_instance
-
-            except ValueError as ve:  # Catch specific configuration errors
-                self.logger.error(
-                    f"Configuration error creating LLM instance for {model_name}: {ve}"
-                )
-                raise
-            except Exception as e:
-                self.logger.error(
-                    f"Failed to create LLM instance for {model_name}: {e}",
-                    exc_info=True,
-                )
-                raise  # Re-raise the exception after logging
+        except ValueError as ve:  # Catch specific configuration errors
+            self.logger.error(
+                f"Configuration error creating LLM instance for {model_name}: {ve}"
+            )
+            raise
+        except Exception as e:
+            self.logger.error(
+                f"Failed to create LLM instance for {model_name}: {e}",
+                exc_info=True,
+            )
+            raise  # Re-raise the exception after logging
 
     async def _get_api_key(self) -> str:
         """Gets the primary (Gemini) API key."""  # Updated docstring
@@ -674,6 +942,8 @@ class AgentManager:
                 "extractionLLM": "gemini-1.5-flash-latest",
                 "knowledgeBaseQueryLLM": "gemini-1.5-flash-latest",
                 "temperature": 0.7,
+                "embeddingDimensions": None,
+                "denseRescoring": False,
             }
             # Ensure loaded settings overwrite defaults
             final_settings = {**defaults}  # Start with defaults
@@ -704,17 +974,13 @@ class AgentManager:
         # Note: Consider external caching (Redis/Memcached) for performance in production.
 
     def estimate_token_count(self, text: str) -> int:
-        """Estimates token count using the main LLM."""
-        if not text or not isinstance(text, str):
-            return 0
-        try:
-            # Use the initialized main LLM instance
-            return self.llm.get_num_tokens(text)
-        except Exception as e:
-            self.logger.warning(
-                f"Could not estimate token count: {e}. Using word count approximation."
-            )
-            return len(text.split())  # Fallback approximation
+        """
+        Estimates the token count for the main LLM locally (no count-tokens API call).
+        Exact tiktoken counts are memoized by content hash so repeated context builds
+        don't re-tokenize chapters; other providers use a chars-per-token estimate.
+        """
+        main_llm = self.model_settings.get("mainLLM") if self.model_settings else None
+        return token_estimator.count(text, main_llm)
 
     def _format_project_structure(
         self,
@@ -885,13 +1151,7 @@ class AgentManager:
 
     def _normalize_name(self, name: str) -> str:
         """Standardize name for comparison by removing extra spaces, punctuation and converting to lowercase."""
-        if not name or not isinstance(name, str):
-            return ""
-        # Remove punctuation, convert to lowercase, and collapse whitespace.
-        name = name.lower()
-        name = re.sub(r"[^\w\s-]", "", name)  # Allow words, spaces, hyphens
-        name = re.sub(r"\s+", " ", name).strip()
-        return name
+        return normalize_entity_name(name)
 
     # --- LangGraph Nodes ---
 
@@ -1090,19 +1350,30 @@ class AgentManager:
                             self.logger.info(
                                 "Including all chapters with individual processing"
                             )
+                            long_chapters = [
+                                ch
+                                for ch, ch_tokens in chapter_token_estimates
+                                if ch_tokens > SUMMARY_CHAPTER_TOKENS
+                            ]
+                            summaries = await self.summarize_chapters(
+                                [
+                                    (ch["id"], ch.get("content", ""), SUMMARY_LEVEL_CHAPTER)
+                                    for ch in long_chapters
+                                ]
+                            )
+                            summary_by_id = {
+                                ch["id"]: summary
+                                for ch, summary in zip(long_chapters, summaries)
+                            }
                             for ch, ch_tokens in chapter_token_estimates:
                                 chap_num = ch.get("chapter_number", "N/A")
                                 chap_title = ch.get("title", f"Chapter {chap_num}")
                                 content = ch.get("content", "")
 
                                 # Summarize individual chapters if they're long
-                                if ch_tokens > 2500:
-                                    docs_to_summarize = [Document(page_content=content)]
-                                    summary_result = await state[
-                                        "summarize_chain"
-                                    ].ainvoke({"input_documents": docs_to_summarize})
+                                if ch_tokens > SUMMARY_CHAPTER_TOKENS:
                                     context_parts.append(
-                                        f"- Ch {chap_num} ({chap_title}): {summary_result.get('output_text', 'Summary unavailable')}"
+                                        f"- Ch {chap_num} ({chap_title}): {summary_by_id.get(ch['id']) or 'Summary unavailable'}"
                                     )
                                 else:
                                     context_parts.append(
@@ -1118,6 +1389,28 @@ class AgentManager:
                             recent_chapters = previous_chapters_data[-3:]
                             older_chapters = previous_chapters_data[:-3]
 
+                            long_recent = [
+                                ch
+                                for ch in recent_chapters
+                                if self.estimate_token_count(ch.get("content", ""))
+                                > SUMMARY_CHAPTER_TOKENS
+                            ]
+
+                            # Stored summaries are reused; only new or edited text is summarized
+                            recent_summaries, tree = await asyncio.gather(
+                                self.summarize_chapters(
+                                    [
+                                        (ch["id"], ch.get("content", ""), SUMMARY_LEVEL_CHAPTER)
+                                        for ch in long_recent
+                                    ]
+                                ),
+                                self.summarize_manuscript(older_chapters),
+                            )
+                            summary_by_id = {
+                                ch["id"]: summary
+                                for ch, summary in zip(long_recent, recent_summaries)
+                            }
+
                             # Process recent chapters individually (last 3)
                             for ch in recent_chapters:
                                 chap_num = ch.get("chapter_number", "N/A")
@@ -1125,56 +1418,30 @@ class AgentManager:
                                 content = ch.get("content", "")
 
                                 # Summarize individual recent chapters if they're long
-                                if self.estimate_token_count(content) > 2500:
-                                    docs_to_summarize = [Document(page_content=content)]
-                                    summary_result = await state[
-                                        "summarize_chain"
-                                    ].ainvoke({"input_documents": docs_to_summarize})
+                                if ch["id"] in summary_by_id:
                                     context_parts.append(
-                                        f"- Ch {chap_num} ({chap_title}): {summary_result.get('output_text', 'Summary unavailable')}"
+                                        f"- Ch {chap_num} ({chap_title}): {summary_by_id[ch['id']] or 'Summary unavailable'}"
                                     )
                                 else:
                                     context_parts.append(
                                         f"- Ch {chap_num} ({chap_title}): {content[:2100]}..."
                                     )
 
-                            # If we have older chapters, summarize them in batches
-                            if older_chapters:
-                                # Group older chapters into batches of 10
-                                batch_size = 10
-                                chapter_batches = []
-
-                                for i in range(0, len(older_chapters), batch_size):
-                                    chapter_batches.append(
-                                        older_chapters[i : i + batch_size]
-                                    )
-
+                            # Older chapters: the book summary, then the arcs it doesn't cover
+                            if tree["arcs"]:
                                 self.logger.info(
-                                    f"Processing {len(chapter_batches)} batches of older chapters"
+                                    f"Using {len(tree['arcs'])} arc summaries for older chapters "
+                                    f"({tree['book_arcs']} folded into the book summary)"
+                                )
+                            if tree["book"]:
+                                book_end = tree["arcs"][tree["book_arcs"] - 1][1]
+                                context_parts.append(
+                                    f"- Story So Far (Chapters {tree['arcs'][0][0]}-{book_end}): {tree['book']}"
+                                )
+                            for arc_start, arc_end, arc_summary in tree["arcs"][tree["book_arcs"] :]:
+                                context_parts.append(
+                                    f"- Chapters {arc_start}-{arc_end} Summary: {arc_summary or 'Batch summary unavailable'}"
                                 )
-
-                                for batch_idx, batch in enumerate(chapter_batches):
-                                    # Create a combined document for the batch
-                                    batch_start = batch[0].get("chapter_number", "?")
-                                    batch_end = batch[-1].get("chapter_number", "?")
-                                    batch_content = "\n\n---\n\n".join(
-                                        [
-                                            f"Chapter {ch.get('chapter_number')}: {ch.get('title', '')}\n{ch.get('content', '')}"
-                                            for ch in batch
-                                        ]
-                                    )
-
-                                    # Summarize the batch
-                                    docs_to_summarize = [
-                                        Document(page_content=batch_content)
-                                    ]
-                                    batch_summary = await state[
-                                        "summarize_chain"
-                                    ].ainvoke({"input_documents": docs_to_summarize})
-
-                                    context_parts.append(
-                                        f"- Chapters {batch_start}-{batch_end} Summary: {batch_summary.get('output_text', 'Batch summary unavailable')}"
-                                    )
             except Exception as e:
                 self.logger.warning(f"Could not fetch/process previous chapters: {e}")
 
@@ -1192,6 +1459,8 @@ class AgentManager:
                     query_text=query_text,
                     k=20,  # Fetch more potentially relevant items
                     filter=codex_filter,
+                    payload_fields=["type", "name", "title"],
+                    max_snippet_chars=300,
                 )
 
                 relevant_entity_names = []  # Collect names for Graph Context
@@ -1401,124 +1670,139 @@ class AgentManager:
             return {"error": f"Failed to construct context: {e}"}
 
     def _create_chapter_prompt(
-        self, state: ChapterGenerationState  # Accept the full state
-    ) -> ChatPromptTemplate:
-        """Helper to create the chapter generation prompt, incorporating plot segmentation,
-        project description, current act/stage information, and full project structure conditionally.
+        self, state: ChapterGenerationState
+    ) -> Tuple[SegmentedPrompt, str]:
+        """Builds the chapter generation system prompt from segments ordered from most to
+        least stable (fixed rules, project description, this request's plot and style,
+        context), plus the chapter-specific request, so provider prompt caches can reuse
+        the prefix across chapters and requests.
         """
-
-        # Extract relevant fields from state
         instructions = state["instructions"]
-        context = state[
-            "context"
-        ]  # This is the general context (codex, previous chaps, full structure etc)
-        chapter_number = state["chapter_number"]
-        total_chapters = state["total_chapters"]
-        full_plot = state["full_plot"]
         plot_segment = state.get("plot_segment")
-        writing_style = state["writing_style"]
-        style_guide = instructions.get("styleGuide", "")
-        additional_instructions_text = instructions.get(
-            "additionalInstructions", ""
-        )  # Renamed to avoid conflict
-        word_count_target = instructions.get("wordCount", 0)
-        project_description = state.get("project_description")
-        # current_act_stage_info is now part of the main {{context}}
-        # The full project structure is also part of {{context}}
-
-        # Determine the focus plot for the prompt
-        focus_plot_description = plot_segment if plot_segment else full_plot
-        plot_header = (
-            "CURRENT CHAPTER PLOT SEGMENT (Main Focus for this Chapter):"
+        focus_header = (
+            "CURRENT CHAPTER PLOT SEGMENT (Main Focus for this Chapter)"
             if plot_segment
-            else "PLOT/SETTING (Focus for this Chapter):"
+            else "PLOT/SETTING (Focus for this Chapter)"
         )
+        project_description = state.get("project_description")
 
-        # Build optional prompt sections
-        optional_prompt_parts = []
-        if project_description:
-            optional_prompt_parts.append(
-                f"**PROJECT DESCRIPTION (Overall Theme/Goal):**\\n{{project_description}}"
-            )
-        # current_act_stage_info and full_project_structure are now part of {{context}}
+        prompt = SegmentedPrompt()
+        prompt.add("rules", CHAPTER_PROMPT_RULES, TIER_STATIC, cache_breakpoint=True)
+        prompt.add(
+            "project",
+            f"**PROJECT DESCRIPTION (Overall Theme/Goal):**\n{project_description}"
+            if project_description
+            else "",
+            TIER_PROJECT,
+        )
+        prompt.add(
+            "style",
+            f"**WRITING STYLE:**\n{state['writing_style']}\n\n"
+            f"**STYLE GUIDE:**\n{instructions.get('styleGuide', '') or 'None provided.'}",
+            TIER_BATCH,
+        )
+        prompt.add(
+            "plot",
+            f"**OVERALL PLOT (For General Context):**\n{state['full_plot']}",
+            TIER_BATCH,
+            cache_breakpoint=True,
+        )
+        prompt.add(
+            "context",
+            f"**CONTEXT (Previous Chapters, World Info, Project Structure):**\n{state['context']}",
+            TIER_CALL,
+        )
 
-        optional_prompt_section = (
-            "\\n\\n" + "\\n\\n".join(optional_prompt_parts)
-            if optional_prompt_parts
-            else ""
+        chapter_number = state["chapter_number"]
+        request = (
+            f"Write Chapter {chapter_number} of {state['total_chapters']}.\n\n"
+            f"**{focus_header}:**\n{plot_segment or state['full_plot']}\n\n"
+            f"**Additional Instructions:** {instructions.get('additionalInstructions', '') or 'None.'}\n"
+            f"**Approximate Word Count Target:** {instructions.get('wordCount', 0)} words. "
+            "Aim for this length naturally.\n\n"
+            f"Focus *primarily* on the events and progression described in the "
+            f"**{focus_header.split('(')[0].strip()}** above, following all system instructions "
+            f"precisely. Begin writing Chapter {chapter_number} immediately, starting directly "
+            "with the first `<p>` tag."
         )
 
-        system_template = f"""You are a skilled author writing chapter {{chapter_number}} of {{total_chapters}} for a novel. Your goal is to write in a style that is engaging, natural, and human-like. Adhere STRICTLY to all requirements.
-    
-        **HUMAN-LIKE WRITING GUIDELINES (MANDATORY):**
-        *   Clarity and Simplicity: Prioritize clear communication. Use straightforward language and sentence structures.
-        *   Natural Vocabulary: Employ common, everyday words. Avoid overly complex, academic, or obscure vocabulary.
-        *   Engaging Tone: Write in a way that captivates the reader. Make the prose flow naturally and conversationally.
-        *   Avoid AI Tropes: Do not use overly formal language, excessive adverbs, or repetitive sentence beginnings that can make writing sound robotic.
-    {optional_prompt_section}
-        **OVERALL PLOT (For General Context):**
-        {{full_plot}}
-    
-        **{plot_header}**
-        {{focus_plot_description}}
-    
-        **CONTEXT (Previous Chapters, World Info, Project Structure):** 
-        {{context}} 
-        The 'CONTEXT' section above includes:
-        1.  Previously generated chapters in this current batch - MOST IMPORTANT for maintaining direct narrative continuity
-        2.  Relevant information from older chapters and the project's knowledge base.
-        3.  The specific structural placement for *this* chapter (e.g., 'Current Structural Context for this Chapter: Act I > Stage 1 > Substage A').
-        4.  The **FULL PROJECT STRUCTURE**, which lists all Acts, Stages, and Substages, along with any chapters currently linked to them. 
-        Use this comprehensive context to understand the chapter's placement within the larger narrative arc and to ensure thematic and plot consistency.
-    
-        **NARRATIVE CONTINUITY REQUIREMENTS (CRITICAL):**
-        1. Your chapter MUST coherently continue the storyline from any previous chapters in the current batch.
-        2. Characters, settings, and plot elements should maintain precise consistency with previous chapters.
-        3. Respect the chronological flow of events established in previous chapters.
-        4. Avoid contradicting any events, dialogue or character decisions from previous chapters.
-        5. Pick up naturally from the ending of the most recent chapter if applicable.
-
-        **WRITING REQUIREMENTS (MANDATORY):**
-        1.  Writing Style: {{writing_style}} (Apply this style METICULOUSLY to every sentence, keeping the Human-Like Writing Guidelines in mind.)
-        2.  Style Guide: {{style_guide}} (Follow this guide EXACTLY, ensuring it aligns with the Human-Like Writing Guidelines.)
-        3.  Additional Instructions: {{additional_instructions}} (Incorporate these precisely.)
-        4.  Approximate Word Count Target: {{word_count_target}} words. Aim for this length naturally.
-    
-        **TASK:** Write Chapter {{chapter_number}}, focusing *primarily* on fulfilling the events and progression described in the **{plot_header.split('(')[0].strip()}** while maintaining perfect continuity with any previously generated chapters. Use the **OVERALL PLOT**, **PROJECT DESCRIPTION**, and the full **CONTEXT** (especially any previously generated chapters in this batch) to ensure consistency and depth, but the core action of this chapter should revolve around the plot segment/focus provided above.
-    
-        **FORMATTING (MANDATORY):**
-        *   Use HTML `<p>` tags for paragraphs. Ensure proper paragraph separation.
-        *   Inside `<p>` tags, format dialogue correctly (e.g., using quotation marks).
-        *   Use HTML `<h3>***</h3>` for major scene breaks if appropriate.
-    
-        **CRITICAL RULES:**
-        *   NEVER write the word "Codex".
-        *   Follow the specified Writing Style and Style Guide WITHOUT FAIL.
-        *   Stay EXACTLY true to the Plot/Setting focus provided for this chapter.
-        *   Maintain PERFECT continuity with previous chapters in this generation batch.
-        *   Incorporate ALL requirements.
-        *   If specific sentence structures or endings are required, apply them CONSISTENTLY.
-    
-        Begin writing Chapter {{chapter_number}} immediately, starting directly with the first `<p>` tag. Do not include a chapter heading like "Chapter X: Title" or wrap the entire output in other tags like `<html>` or `<body>`.
+        self.logger.debug(f"Chapter {chapter_number} prompt layout: {prompt.layout()}")
+        return prompt, request
+
+    async def _chapter_prompt_call(
+        self, state: ChapterGenerationState
+    ) -> Tuple[Runnable, List[BaseMessage]]:
         """
-        human_template = "Write the chapter following all system instructions precisely, using HTML <p> tags for paragraphs."
-
-        # Check for Anthropic to apply caching
-        llm = state.get("llm")
-        is_anthropic = False
-        if llm and "Anthropic" in llm.__class__.__name__:
-            is_anthropic = True
-
-        if is_anthropic:
-             sys_msg = SystemMessage(content=system_template)
-             sys_msg.additional_kwargs["cache_control"] = {"type": "ephemeral"}
-             return ChatPromptTemplate.from_messages(
-                [sys_msg, ("human", human_template)]
-             )
-
-        return ChatPromptTemplate.from_messages(
-            [("system", system_template), ("human", human_template)]
-        )
+        Chat model and messages for a chapter draft. On Gemini, the rules and project
+        segments are served from a context cache and only the rest of the prompt is sent;
+        if no cache can be had, state["llm"] (the mainLLM client) gets the full prompt.
+        """
+        prompt, request = self._create_chapter_prompt(state)
+        model_name = self.model_settings.get("mainLLM", "")
+        provider, model_id = route_model(model_name)
+        if provider == "gemini":
+            cached, remainder = prompt.split(TIER_PROJECT)
+            cache_name = await gemini_caches.get_or_create(
+                self.api_key,
+                model_id,
+                f"scrollwise-chapter-{self.project_id[:8]}-{model_id}",
+                system_instruction=cached.text(),
+                min_tokens=GEMINI_CACHE_MIN_TOKENS,
+            )
+            if cache_name:
+                # Bound per call so cache rotations keep sharing one client per model
+                llm = state["llm"].bind(cached_content=cache_name)
+                # The cache holds the system instruction, so the remainder goes in as text
+                return llm, remainder.to_messages("other", request)
+        # OpenRouter's Anthropic models are ChatOpenAI instances, so go by the setting
+        return state["llm"], prompt.to_messages(prompt_cache_provider(model_name), request)
+
+    async def _invoke_streaming(
+        self, runnable: Any, inputs: Any, state: ChapterGenerationState, node: str
+    ) -> Any:
+        """
+        runnable.ainvoke(inputs), or in streaming mode runnable.astream(inputs) with the
+        text deltas sent to the state's on_event sink as "token" events, coalesced per
+        TOKEN_EVENT_MIN_CHARS / TOKEN_EVENT_MAX_SECONDS. Returns the same value ainvoke
+        would (chunks are summed).
+        """
+        on_event = state.get("on_event")
+        if on_event is None:
+            return await runnable.ainvoke(inputs)
+
+        pending: List[str] = []
+        pending_chars = 0
+        last_sent = time.monotonic()
+
+        async def send_pending():
+            nonlocal pending_chars, last_sent
+            if pending:
+                await on_event(
+                    "token",
+                    {
+                        "chapter_number": state["chapter_number"],
+                        "node": node,
+                        "text": "".join(pending),
+                    },
+                )
+                pending.clear()
+            pending_chars = 0
+            last_sent = time.monotonic()
+
+        result = None
+        async for chunk in runnable.astream(inputs):
+            text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+            if text and isinstance(text, str):
+                pending.append(text)
+                pending_chars += len(text)
+                if (
+                    pending_chars >= TOKEN_EVENT_MIN_CHARS
+                    or time.monotonic() - last_sent >= TOKEN_EVENT_MAX_SECONDS
+                ):
+                    await send_pending()
+            result = chunk if result is None else result + chunk
+        await send_pending()
+        return result
 
     async def _generate_initial_chapter_node(
         self, state: ChapterGenerationState
@@ -1529,56 +1813,12 @@ class AgentManager:
             return {}  # Skip if error occurred previously
 
         try:
-            llm = state["llm"]
-
-            # Create the prompt using the updated helper, passing the whole state
-            prompt = self._create_chapter_prompt(state=state)
-
-            chain = prompt | llm | StrOutputParser()
-
-            # Prepare the dictionary for invoking the chain
-            # All necessary fields should be in the state and will be picked up by the prompt template
-            # The ChatPromptTemplate will automatically pull the required fields from the state dict.
-            invoke_dict = {
-                **state,  # Pass the whole state, prompt template will pick what it needs
-                "additional_instructions": state["instructions"].get(
-                    "additionalInstructions", ""
-                ),  # Ensure this specific key is available for the prompt
-                "style_guide": state["instructions"].get("styleGuide", ""),
-                "word_count_target": state["instructions"].get("wordCount", 0),
-                "focus_plot_description": state.get("plot_segment")
-                or state["full_plot"],  # Make sure this is directly available
-            }
+            llm, messages = await self._chapter_prompt_call(state)
+            chain = llm | StrOutputParser()
 
-            # llm_response: BaseMessage = await chain.ainvoke(invoke_dict) # Old
-            # The invoke_dict now directly comes from state, which ChatPromptTemplate can use.
-            # Langchain templates will try to find the keys from the input dictionary.
-
-            # The prompt expects: chapter_number, total_chapters, project_description, current_act_stage_info,
-            # full_plot, focus_plot_description, context, writing_style, style_guide, additional_instructions, word_count_target
-
-            # We need to ensure all these are top-level keys in the invoke_dict or accessible via state.
-            # The state already has most of them. Let's ensure the prompt variables match state keys or are added to invoke_dict.
-
-            # Create the specific dictionary for prompt variables
-            prompt_variables = {
-                "chapter_number": state["chapter_number"],
-                "total_chapters": state["total_chapters"],
-                "project_description": state.get("project_description"),
-                "current_act_stage_info": state.get("current_act_stage_info"),
-                "full_plot": state["full_plot"],
-                "focus_plot_description": state.get("plot_segment")
-                or state["full_plot"],
-                "context": state["context"],
-                "writing_style": state["writing_style"],
-                "style_guide": state["instructions"].get("styleGuide", ""),
-                "additional_instructions": state["instructions"].get(
-                    "additionalInstructions", ""
-                ),
-                "word_count_target": state["instructions"].get("wordCount", 0),
-            }
-
-            llm_response_content = await chain.ainvoke(prompt_variables)
+            llm_response_content = await self._invoke_streaming(
+                chain, messages, state, "generate_initial_chapter"
+            )
             # Since we are using StrOutputParser, the response is directly the string content.
             # If we were getting a BaseMessage, it would be: llm_response.content
             chapter_content = llm_response_content
@@ -1666,8 +1906,10 @@ class AgentManager:
             # The LLM will treat this as a continued conversation
             messages_for_llm: List[BaseMessage] = [last_llm_response, human_message]
 
-            current_llm_response: BaseMessage = await llm.ainvoke(messages_for_llm)
-            extension_text = current_llm_response.content
+            current_llm_response: BaseMessage = await self._invoke_streaming(
+                llm, messages_for_llm, state, "extend_chapter"
+            )
+            extension_text = current_llm_response.content if current_llm_response else ""
 
             if not extension_text or not extension_text.strip():
                 self.logger.warning(
@@ -1770,6 +2012,30 @@ class AgentManager:
                 "chapter_title": f"Chapter {state['chapter_number']}",
             }
 
+    def _validate_codex_extraction(self, data: Any) -> CodexExtraction:
+        """Validates extracted items one by one, so one malformed item doesn't discard the batch."""
+        if isinstance(data, dict):
+            raw_items = data.get("new_items") or []
+        else:
+            raw_items = data if isinstance(data, list) else []
+        valid_items = []
+        for raw_item in raw_items:
+            if not isinstance(raw_item, dict):
+                continue
+            try:
+                # Automatic correction of a common LLM error
+                if raw_item.get("type") == "geography":
+                    raw_item["type"] = "location"
+                    self.logger.info(
+                        f"Auto-corrected type 'geography' to 'location' for item '{raw_item.get('name')}'"
+                    )
+                valid_items.append(CodexItemCreate(**raw_item))
+            except ValidationError as ve:
+                self.logger.warning(
+                    f"Skipping invalid item '{raw_item.get('name', 'UNKNOWN')}': {ve}"
+                )
+        return CodexExtraction(new_items=valid_items)
+
     async def _extract_codex_items_node(
         self, state: ChapterGenerationState
     ) -> Dict[str, Any]:
@@ -1796,19 +2062,12 @@ class AgentManager:
             # 1. Fetch from Vector Store
             if vector_store:
                 try:
-                    # Fetch a larger number of existing items from the vector store
-                    vector_store_docs = await vector_store.similarity_search(
-                        query_text="*",  # Broad query
-                        filter={
-                            "type": {"$in": [t.value for t in CodexExtractionTypes]}
-                        },
-                        k=1000,  # Increased fetch limit
+                    # Metadata-only lookup from the store's name index (no similarity search)
+                    existing_names.update(
+                        await vector_store.get_entity_names(
+                            types=[t.value for t in CodexExtractionTypes]
+                        )
                     )
-                    for doc in vector_store_docs:
-                        if doc.metadata.get("name"):
-                            existing_names.add(
-                                self._normalize_name(doc.metadata.get("name"))
-                            )
                 except Exception as e:
                     self.logger.error(
                         f"Error fetching existing items from vector store: {e}"
@@ -1831,7 +2090,6 @@ class AgentManager:
                 f"Compiled {len(existing_names)} unique existing codex item names for filtering."
             )
 
-            parser = PydanticOutputParser(pydantic_object=CodexExtraction)
 
             # --- Strengthened Prompt ---
             prompt = ChatPromptTemplate.from_template(
@@ -1868,7 +2126,9 @@ class AgentManager:
 
             all_new_items_raw = []
             try:
-                llm_response_message = await (prompt | check_llm).ainvoke(
+                extraction = await structured_output.ainvoke(
+                    check_llm,
+                    prompt,
                     {
                         "chapter_content": final_content,
                         "existing_names": (
@@ -1882,66 +2142,12 @@ class AgentManager:
                         "valid_subtypes": ", ".join(
                             [t.value for t in WorldbuildingSubtype]
                         ),
-                        "format_instructions": parser.get_format_instructions(),
-                    }
+                    },
+                    CodexExtraction,
+                    "codex_extraction",
+                    validate=self._validate_codex_extraction,
                 )
-                llm_output_text = llm_response_message.content
-                if isinstance(llm_output_text, list):
-                    llm_output_text = " ".join([str(item) for item in llm_output_text])
-                elif not isinstance(llm_output_text, str):
-                    llm_output_text = str(llm_output_text)
-
-                if (
-                    not llm_output_text
-                    or not llm_output_text.strip()
-                    or llm_output_text.strip().lower() == "null"
-                ):
-                    self.logger.info(
-                        "LLM returned no new items. Defaulting to empty list."
-                    )
-                    validated_result = CodexExtraction(new_items=[])
-                    all_new_items_raw = validated_result.new_items
-                else:
-                    # --- Robust "Row-Level" Parsing ---
-                    # Instead of parsing the whole batch strictly, we parse JSON and then validate items one by one.
-                    try:
-                        # 1. Parse pure JSON first
-                        json_parser = JsonOutputParser()
-                        parsed_json = json_parser.parse(llm_output_text)
-                        
-                        raw_items_list = []
-                        if parsed_json:
-                            raw_items_list = parsed_json.get("new_items", [])
-                        valid_items_buffer = []
-
-                        for raw_item in raw_items_list:
-                            try:
-                                # A. Attempt Automatic Correction of Common LLM Errors
-                                if raw_item.get("type") == "geography":
-                                    raw_item["type"] = "location"
-                                    self.logger.info(f"Auto-corrected type 'geography' to 'location' for item '{raw_item.get('name')}'")
-
-                                # B. Validate Individual Item
-                                # We construct the Pydantic model for a single item
-                                valid_item = ModelCodexItem(**raw_item)
-                                valid_items_buffer.append(valid_item)
-                            
-                            except ValidationError as ve:
-                                self.logger.warning(f"Skipping invalid item '{raw_item.get('name', 'UNKNOWN')}': {ve}")
-                                continue # processing other items
-
-                        all_new_items_raw = valid_items_buffer
-
-                    except Exception as json_error:
-                        self.logger.warning(
-                            f"JSON parsing failed: {json_error}. Attempting fallback to fixing parser."
-                        )
-                        # Fallback: Try the fixing parser for the whole batch if basic JSON fails
-                        fixing_parser = OutputFixingParser.from_llm(
-                            parser=parser, llm=check_llm
-                        )
-                        validated_result = await fixing_parser.aparse(llm_output_text)
-                        all_new_items_raw = validated_result.new_items
+                all_new_items_raw = extraction.new_items
 
             except Exception as invoke_error:
                 self.logger.error(
@@ -2038,11 +2244,20 @@ class AgentManager:
             vector_store = state["vector_store"]
             plot = state["plot"]
 
-            # Fetch limited context for validation (e.g., plot + maybe previous chapter summary)
+            # Fetch limited context for validation: what the KB holds on the plot and on
+            # how the chapter ends, in one batched search.
             # Re-using full context might be too much for validation LLM
-            validation_context_docs = await vector_store.similarity_search(
-                plot, k=3
-            )  # Get relevant docs
+            chapter_ending = BeautifulSoup(final_content, "html.parser").get_text()[-1000:]
+            validation_queries = [q for q in (plot, chapter_ending) if q and q.strip()]
+            validation_context_docs = []
+            seen_snippets = set()
+            for docs in await vector_store.search_many(
+                validation_queries, k=3, payload_fields=[], max_snippet_chars=200
+            ):
+                for doc in docs:
+                    if doc.page_content not in seen_snippets:
+                        seen_snippets.add(doc.page_content)
+                        validation_context_docs.append(doc)
 
             # Get previous chapters from the current batch for continuity validation
             previous_chapters_from_batch = instructions.get("previous_chapters", [])
@@ -2080,9 +2295,6 @@ class AgentManager:
                 )
             )
 
-            parser = PydanticOutputParser(pydantic_object=ChapterValidation)
-            fixing_parser = OutputFixingParser.from_llm(parser=parser, llm=check_llm)
-
             prompt = ChatPromptTemplate.from_template(
                 """
             You are an expert editor evaluating a novel chapter based on provided criteria and context.
@@ -2119,72 +2331,26 @@ class AgentManager:
             """
             )
 
-            # Define the LLM part of the chain separately
-            llm_chain = prompt | check_llm
-
-            # Invoke LLM first
-            raw_llm_output = await llm_chain.ainvoke(
-                {
-                    "chapter_content": final_content,
-                    "validation_context": validation_context,
-                    "format_instructions": parser.get_format_instructions(),
-                }
-            )
-
-            # Check if LLM output is usable
-            content_to_parse = ""
-            if raw_llm_output:
-                if isinstance(raw_llm_output.content, list):
-                    # Handle list content (e.g. from some models/configurations)
-                    # Assuming list of strings or objects with 'text' attribute
-                    parts = []
-                    for part in raw_llm_output.content:
-                        if isinstance(part, str):
-                            parts.append(part)
-                        elif hasattr(part, "text"):
-                            parts.append(part.text)
-                        else:
-                            parts.append(str(part))
-                    content_to_parse = "".join(parts)
-                else:
-                    content_to_parse = str(raw_llm_output.content)
-
-            if not content_to_parse or not content_to_parse.strip():
-                self.logger.error(
-                    "Validation LLM returned empty or null content. Cannot parse."
-                )
-                # Return a default error structure
-                return {
-                    "error": "Validation LLM returned unusable output.",
-                    "validity_check": {
-                        "is_valid": False,
-                        "overall_score": 0,
-                        "general_feedback": "Validation could not be performed due to an LLM error or empty response.",
-                        # Add other fields with default/null values if needed by downstream steps
-                        "criteria_scores": {},
-                        "style_guide_adherence_score": 0,
-                        "style_guide_adherence_explanation": "N/A",
-                        "continuity_score": 0,
-                        "continuity_explanation": "N/A",
-                        "areas_for_improvement": ["LLM validation failed."],
-                    },
-                }
-
-            # Now try parsing with the fixing parser
             try:
-                result = await fixing_parser.aparse(content_to_parse)
-            except Exception as parse_error:
-                self.logger.error(
-                    f"Failed to parse validation output even with fixing parser: {parse_error}",
-                    exc_info=True,
+                result = await structured_output.ainvoke(
+                    check_llm,
+                    prompt,
+                    {
+                        "chapter_content": final_content,
+                        "validation_context": validation_context,
+                    },
+                    ChapterValidation,
+                    "chapter_validation",
                 )
+            except StructuredOutputError as parse_error:
+                self.logger.error(f"Failed to parse validation output: {parse_error}")
                 # Return a default error structure after parsing failure
                 return {
                     "error": f"Failed to parse validation output: {parse_error}",
                     "validity_check": {
                         "is_valid": False,
                         "overall_score": 0,
-                        "general_feedback": f"Validation output parsing failed: {parse_error}",
+                        "general_feedback": f"Validation could not be performed: {parse_error}",
                         "criteria_scores": {},
                         "style_guide_adherence_score": 0,
                         "style_guide_adherence_explanation": "N/A",
@@ -2336,6 +2502,28 @@ class AgentManager:
         self.logger.info("Chapter generation graph compiled.")
         return compiled_graph
 
+    @staticmethod
+    def _node_event(chapter_number: int, node: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Small, JSON-safe summary of a finished graph node for progress events."""
+        event = {"chapter_number": chapter_number, "node": node}
+        if update.get("error"):
+            event["error"] = update["error"]
+        if node == "construct_context" and update.get("context"):
+            event["context_chars"] = len(update["context"])
+        elif node in ("generate_initial_chapter", "extend_chapter"):
+            event["word_count"] = update.get("current_word_count")
+        elif node == "generate_title":
+            event["title"] = update.get("chapter_title")
+        elif node == "extract_codex_items":
+            event["new_codex_items"] = [
+                {"name": item.get("name"), "type": item.get("type")}
+                for item in update.get("new_codex_items") or []
+            ]
+        elif node == "validate_chapter" and update.get("validity_check"):
+            event["is_valid"] = update["validity_check"].get("is_valid")
+            event["overall_score"] = update["validity_check"].get("overall_score")
+        return event
+
     # --- Public Methods ---
 
     async def generate_chapter(
@@ -2346,8 +2534,14 @@ class AgentManager:
         instructions: Dict[
             str, Any
         ],  # This now contains segment, full plot, total etc.
+        on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
     ) -> Dict[str, Any]:
-        """Generates a chapter using the LangGraph workflow."""
+        """
+        Generates a chapter using the LangGraph workflow.
+
+        With on_event (streaming mode), LLM tokens from the drafting nodes are sent as
+        "token" events and every finished graph node as a "node" event while the graph runs.
+        """
         self.logger.info(
             f"Starting chapter generation process for Chapter {chapter_number}..."
         )
@@ -2377,6 +2571,7 @@ class AgentManager:
             "check_llm": self.check_llm,
             "vector_store": self.vector_store,
             "summarize_chain": self.summarize_chain,
+            "on_event": on_event,
             # Initialize others to None/default
             "context": None,
             "initial_chapter_content": None,
@@ -2395,9 +2590,20 @@ class AgentManager:
         }
 
         try:
-            # Stream the graph execution (or use ainvoke for final result)
-            # Using ainvoke for simplicity here, streaming requires more complex handling
-            final_state = await self.chapter_generation_graph.ainvoke(initial_state)
+            if on_event is None:
+                final_state = await self.chapter_generation_graph.ainvoke(initial_state)
+            else:
+                final_state = initial_state
+                async for mode, chunk in self.chapter_generation_graph.astream(
+                    initial_state, stream_mode=["updates", "values"]
+                ):
+                    if mode == "values":
+                        final_state = chunk
+                        continue
+                    for node, update in chunk.items():
+                        await on_event(
+                            "node", self._node_event(chapter_number, node, update or {})
+                        )
 
             if final_state.get("error"):
                 self.logger.error(
@@ -2580,11 +2786,16 @@ class AgentManager:
                             f"Skipping non-serializable metadata key '{k}' of type {type(v)}"
                         )
 
-            # Use add_texts for simplicity, VectorStore handles batching if implemented
+            # Long-form content is indexed as parent + chunks; the parent ID is returned either way
             # Pass the db_item_id as the ID to use in the vector store
-            ids = await self.vector_store.add_texts(
-                [content], [clean_metadata], ids=[db_item_id] if db_item_id else None
-            )
+            if content_type in CHUNKED_CONTENT_TYPES:
+                ids = await self.vector_store.add_chunked_documents(
+                    [content], [clean_metadata], ids=[db_item_id] if db_item_id else None
+                )
+            else:
+                ids = await self.vector_store.add_texts(
+                    [content], [clean_metadata], ids=[db_item_id] if db_item_id else None
+                )
             if ids:
                 embedding_id = ids[0]
                 self.logger.debug(
@@ -2601,6 +2812,37 @@ class AgentManager:
             self.logger.error(f"Error adding to knowledge base: {e}", exc_info=True)
             return None  # Return None on error
 
+    def queue_knowledge_base_update(
+        self,
+        embedding_id: str,
+        new_content: Optional[str],
+        new_metadata: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Debounced form of update_or_remove_from_knowledge_base(embedding_id, "update", ...)
+        for editor saves: repeated edits of the same item are coalesced and re-embedded in
+        batches by the project's write-behind queue instead of on every save.
+        """
+        if not self.vector_store:
+            self.logger.error("Vector store not initialized.")
+            return
+        new_metadata = dict(new_metadata or {})
+        new_metadata["user_id"] = self.user_id
+        new_metadata["project_id"] = self.project_id
+        new_metadata["updated_at"] = datetime.now(timezone.utc).isoformat()
+        kb_write_queue.enqueue(
+            self.write_queue_key,
+            embedding_id,
+            new_content,
+            new_metadata,
+            self.vector_store.update_many_in_knowledge_base,
+        )
+
+    async def flush_pending_knowledge_base_updates(self):
+        # Always flush: pending is emptied while a write is in flight, and flush()
+        # waits for that write on the queue lock.
+        await kb_write_queue.flush(self.write_queue_key)
+
     async def update_or_remove_from_knowledge_base(
         self,
         identifier: Union[str, Dict[str, str]],
@@ -2650,6 +2892,8 @@ class AgentManager:
                         f"No embedding_id to delete for identifier {identifier}"
                     )
                     return
+                # A queued edit must not re-create the point after it's gone
+                kb_write_queue.discard(self.write_queue_key, embedding_id)
                 await self.vector_store.delete_from_knowledge_base(embedding_id)
                 self.logger.info(f"Deleted item with embedding ID: {embedding_id}")
             elif action == "update":
@@ -2662,6 +2906,8 @@ class AgentManager:
                     raise ValueError(
                         "Either new_content or new_metadata must be provided for update action"
                     )
+                # Queued edits are older than this one; write them first so they can't overwrite it
+                await self.flush_pending_knowledge_base_updates()
 
                 if new_metadata is None:
                     new_metadata = {}
@@ -2831,13 +3077,9 @@ class AgentManager:
             f"Generating codex item: Type={codex_type}, Subtype={subtype}"
         )
         try:
-            parser = PydanticOutputParser(
-                pydantic_object=ModelCodexItem
-            )  # Reformatted line
             llm = await self._get_llm(
                 self.model_settings["extractionLLM"]
             )  # Use extraction LLM
-            fixing_parser = OutputFixingParser.from_llm(parser=parser, llm=llm)
 
             # Fetch relevant context (existing items, chapters)
             existing_items = await db_instance.get_all_codex_items(
@@ -2856,7 +3098,11 @@ class AgentManager:
             )  # Snippets only
 
             relevant_chapters = await self.vector_store.similarity_search(
-                query_text=description, filter={"type": "chapter"}, k=5
+                query_text=description,
+                filter={"type": "chapter"},
+                k=5,
+                payload_fields=["chapter_number"],
+                max_snippet_chars=300,
             )
             chapter_context = "\n\n".join(
                 f"Ch {doc.metadata.get('chapter_number', 'N/A')} Snippet: {doc.page_content[:300]}..."
@@ -2887,17 +3133,18 @@ class AgentManager:
             """
             )
 
-            chain = prompt | llm | fixing_parser
-
-            result = await chain.ainvoke(
+            result = await structured_output.ainvoke(
+                llm,
+                prompt,
                 {
                     "codex_type": codex_type,
                     "subtype": subtype or "N/A",
                     "description": description,
                     "existing_codex_items": existing_items_str,
                     "chapter_context": chapter_context,
-                    "format_instructions": parser.get_format_instructions(),
-                }
+                },
+                ModelCodexItem,
+                "codex_item_generation",
             )
 
             return {"name": result.name, "description": result.description}
@@ -2948,12 +3195,8 @@ class AgentManager:
                     "output_text", "Summary unavailable"
                 )
 
-            parser = PydanticOutputParser(pydantic_object=RelationshipAnalysisList)
             # Use check_llm or extractionLLM as configured
             relationship_llm = await self._get_llm(self.model_settings["extractionLLM"])
-            fixing_parser = OutputFixingParser.from_llm(
-                parser=parser, llm=relationship_llm
-            )
 
             prompt = ChatPromptTemplate.from_template(
                 """
@@ -2977,21 +3220,20 @@ class AgentManager:
             """
             )
 
-            chain = (
-                prompt | relationship_llm | fixing_parser
-            )  # Use fixing parser as fallback
-
             character_list_json = json.dumps(
                 [{"id": c.get("id"), "name": c.get("name")} for c in characters],
                 indent=2,
             )
 
-            result = await chain.ainvoke(
+            result = await structured_output.ainvoke(
+                relationship_llm,
+                prompt,
                 {
                     "characters_json": character_list_json,
                     "context": context_content,
-                    "format_instructions": parser.get_format_instructions(),
-                }
+                },
+                RelationshipAnalysisList,
+                "relationship_analysis",
             )
 
             saved_relationships_output = []
@@ -3240,20 +3482,25 @@ Your response should be a JSON object with a single key "locations" which is a l
                 )
 
                 llm = await self._get_llm(self.model_settings["extractionLLM"])
-                chain = prompt | llm | JsonOutputParser()
 
                 # 5. Invoke the analysis chain
                 try:
-                    analysis_result = await chain.ainvoke(
-                        {
-                            "existing_locations": (
-                                ", ".join(sorted(existing_location_names))
-                                if existing_location_names
-                                else "None"
-                            ),
-                            "chapter_content": batch_content,
-                        }
-                    )
+                    analysis_result = (
+                        await structured_output.ainvoke(
+                            llm,
+                            prompt,
+                            {
+                                "existing_locations": (
+                                    ", ".join(sorted(existing_location_names))
+                                    if existing_location_names
+                                    else "None"
+                                ),
+                                "chapter_content": batch_content,
+                            },
+                            ExtractedLocationList,
+                            "location_extraction",
+                        )
+                    ).model_dump()
                     batch_new_locations = analysis_result.get("locations", [])
                 except Exception as e:
                     self.logger.error(f"Error during location analysis LLM call: {e}")
@@ -3393,20 +3640,25 @@ Your response should be a JSON object with a single key "events" which is a list
                 )
 
                 llm = await self._get_llm(self.model_settings["extractionLLM"])
-                chain = prompt | llm | JsonOutputParser()
 
                 # 5. Invoke the analysis chain
                 try:
-                    analysis_result = await chain.ainvoke(
-                        {
-                            "existing_events": (
-                                ", ".join(sorted(existing_event_titles))
-                                if existing_event_titles
-                                else "None"
-                            ),
-                            "chapter_content": batch_content,
-                        }
-                    )
+                    analysis_result = (
+                        await structured_output.ainvoke(
+                            llm,
+                            prompt,
+                            {
+                                "existing_events": (
+                                    ", ".join(sorted(existing_event_titles))
+                                    if existing_event_titles
+                                    else "None"
+                                ),
+                                "chapter_content": batch_content,
+                            },
+                            ExtractedEventList,
+                            "event_extraction",
+                        )
+                    ).model_dump()
                     batch_new_events = analysis_result.get("events", [])
                 except Exception as e:
                     self.logger.error(f"Error during event analysis LLM call: {e}")
@@ -3523,18 +3775,19 @@ Your response should be a JSON object with a single key "events" which is a list
 
                 # Enhanced formatting with RAG context
                 formatted_pairs_with_context = []
+                event_contexts = await self._entity_chapter_contexts(
+                    [event["title"] for pair in batch_to_analyze for event in pair],
+                    chapter_content_map,
+                    self._get_event_chapter_context,
+                )
 
                 for idx, pair in enumerate(batch_to_analyze):
                     event1 = pair[0]
                     event2 = pair[1]
 
-                    # Retrieve chapter context for each event
-                    event1_context = await self._get_event_chapter_context(
-                        event1["title"], chapter_content_map
-                    )
-                    event2_context = await self._get_event_chapter_context(
-                        event2["title"], chapter_content_map
-                    )
+                    # Chapter context for each event
+                    event1_context = event_contexts.get(event1["title"], "")
+                    event2_context = event_contexts.get(event2["title"], "")
 
                     pair_info = f"Event Pair {idx+1}:\n"
                     pair_info += f"- Event 1: {event1['title']} (ID: {event1['id']})\n"
@@ -3577,10 +3830,17 @@ If a pair is not connected, do not include it in your response. If no connection
                 )
 
                 llm = await self._get_llm(self.model_settings["extractionLLM"])
-                chain = prompt | llm | JsonOutputParser()
 
                 try:
-                    result = await chain.ainvoke({"event_pairs": formatted_pairs})
+                    result = (
+                        await structured_output.ainvoke(
+                            llm,
+                            prompt,
+                            {"event_pairs": formatted_pairs},
+                            EventConnectionAnalysis,
+                            "event_connections",
+                        )
+                    ).model_dump()
                     new_connections = result.get("connections", [])
                 except Exception as e:
                     self.logger.error(
@@ -3627,6 +3887,41 @@ If a pair is not connected, do not include it in your response. If no connection
             )
             return []
 
+    async def _entity_chapter_contexts(
+        self,
+        names: List[str],
+        chapter_content_map: Dict[str, str],
+        literal_lookup: Callable[[str, Dict[str, str]], Awaitable[str]],
+    ) -> Dict[str, str]:
+        """
+        Chapter excerpts for each entity name. Names quoted verbatim in the chapters use
+        literal_lookup; the rest (e.g. paraphrased event titles) are looked up together
+        with one batched vector search.
+        """
+        contexts: Dict[str, str] = {}
+        for name in dict.fromkeys(names):
+            contexts[name] = await literal_lookup(name, chapter_content_map)
+        missing = [name for name, context in contexts.items() if not context]
+        if not missing or not self.vector_store:
+            return contexts
+        try:
+            results = await self.vector_store.search_many(
+                missing,
+                k=2,
+                filter={"type": "chapter"},
+                payload_fields=["chapter_number"],
+                max_snippet_chars=300,
+            )
+        except Exception as e:
+            self.logger.warning(f"Batched chapter context search failed: {e}")
+            return contexts
+        for name, docs in zip(missing, results):
+            contexts[name] = "\n".join(
+                f"Ch {doc.metadata.get('chapter_number', 'N/A')}: {doc.page_content}..."
+                for doc in docs
+            )
+        return contexts
+
     async def _get_event_chapter_context(
         self, event_title: str, chapter_content_map: Dict[str, str]
     ) -> str:
@@ -3720,18 +4015,19 @@ If a pair is not connected, do not include it in your response. If no connection
 
                 # Enhanced formatting with RAG context
                 formatted_pairs_with_context = []
+                location_contexts = await self._entity_chapter_contexts(
+                    [location["name"] for pair in batch_to_analyze for location in pair],
+                    chapter_content_map,
+                    self._get_location_chapter_context,
+                )
 
                 for idx, pair in enumerate(batch_to_analyze):
                     location1 = pair[0]
                     location2 = pair[1]
 
-                    # Retrieve chapter context for each location
-                    location1_context = await self._get_location_chapter_context(
-                        location1["name"], chapter_content_map
-                    )
-                    location2_context = await self._get_location_chapter_context(
-                        location2["name"], chapter_content_map
-                    )
+                    # Chapter context for each location
+                    location1_context = location_contexts.get(location1["name"], "")
+                    location2_context = location_contexts.get(location2["name"], "")
 
                     pair_info = f"Location Pair {idx+1}:\n"
                     pair_info += (
@@ -3779,10 +4075,17 @@ If a pair is not connected, do not include it in your response. If no connection
                 )
 
                 llm = await self._get_llm(self.model_settings["extractionLLM"])
-                chain = prompt | llm | JsonOutputParser()
 
                 try:
-                    result = await chain.ainvoke({"location_pairs": formatted_pairs})
+                    result = (
+                        await structured_output.ainvoke(
+                            llm,
+                            prompt,
+                            {"location_pairs": formatted_pairs},
+                            LocationConnectionSuggestionList,
+                            "location_connections",
+                        )
+                    ).model_dump()
                     new_connections = result.get("connections", [])
                 except Exception as e:
                     self.logger.error(
@@ -4006,8 +4309,6 @@ If a pair is not connected, do not include it in your response. If no connection
         """
         self.logger.info("Generating proactive writing suggestions.")
         try:
-            parser = PydanticOutputParser(pydantic_object=ProactiveSuggestionsResponse)
-
             prompt = ChatPromptTemplate.from_template(
                 """
                 You are a proactive AI writing assistant. Your goal is to provide context-aware suggestions to enhance the user's writing.
@@ -4025,14 +4326,15 @@ If a pair is not connected, do not include it in your response. If no connection
                 """
             )
 
-            chain = prompt | self.check_llm | parser
-
-            result = await chain.ainvoke(
+            result = await structured_output.ainvoke(
+                self.check_llm,
+                prompt,
                 {
                     "recent_chapters_content": recent_chapters_content,
                     "notepad_content": notepad_content,
-                    "format_instructions": parser.get_format_instructions(),
-                }
+                },
+                ProactiveSuggestionsResponse,
+                "proactive_suggestions",
             )
 
             return result
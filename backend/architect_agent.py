@@ -3,19 +3,14 @@ import json
 import asyncio
 import httpx
 from typing import Dict, Any, List, Optional, Annotated
-from langchain_google_genai import ChatGoogleGenerativeAI
 from datetime import timedelta
-from langchain_openai import ChatOpenAI
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_classic.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 from langchain_classic.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_classic.output_parsers import PydanticOutputParser
 from agent_manager import (
     AgentManager,
-    OPENROUTER_API_BASE,
-    SITE_URL,
-    SITE_NAME,
+    SUMMARY_LEVEL_CHAPTER,
 )
 from models import (
     ChapterGenerationRequest,
@@ -32,10 +27,14 @@ import os
 # Assuming these are available and setup correctly
 from database import db_instance
 from api_key_manager import ApiKeyManager
+from llm_clients import llm_clients, route_model
+from structured_output import structured_output
 from models import ProjectStructureUpdateRequest
 
 logger = logging.getLogger(__name__)
 
+CODEX_TOOL_PAYLOAD_FIELDS = ["type", "name", "title", "id", "codex_item_id"]
+
 
 # --- Pydantic Model for Parsing Chapter Details ---
 # Define a model to help the LLM structure the chapter details
@@ -79,6 +78,13 @@ class QueryCodexToolArgs(BaseModel):
     k: int = Field(5, description="Number of results to return")
 
 
+class QueryCodexBatchToolArgs(BaseModel):
+    queries: List[str] = Field(
+        ..., description="Several independent search queries to look up in the knowledge base"
+    )
+    k: int = Field(3, description="Number of results to return per query")
+
+
 class GetProjectDetailsToolArgs(BaseModel):
     pass
 
@@ -235,6 +241,13 @@ class ArchitectAgent:
                 coroutine=self.query_codex_tool,
                 args_schema=QueryCodexToolArgs,
             ),
+            StructuredTool.from_function(
+                name="query_codex_batch_tool",
+                description="Runs several knowledge base searches in one call and returns the results per query. Prefer this over repeated query_codex_tool calls when you need information on several topics. The agent knows the project ID.",
+                func=None,
+                coroutine=self.query_codex_batch_tool,
+                args_schema=QueryCodexBatchToolArgs,
+            ),
             StructuredTool.from_function(
                 name="get_project_details_tool",
                 description="Fetches the basic details of the current project (name, description). The agent knows the project ID.",
@@ -311,72 +324,6 @@ class ArchitectAgent:
             f"ArchitectAgent instantiated for Project: {project_id}, User: {user_id}"
         )
 
-    async def _get_or_create_gemini_cache(
-        self,
-        cache_name: str,
-        system_instruction: str,
-        api_key: str,
-        contents: List[str] = None,
-        ttl_minutes: int = 60,
-    ) -> str:
-        """
-        Creates or retrieves a Gemini context cache using google-genai SDK.
-        Returns the cache name (resource name).
-        """
-        try:
-            from google import genai
-            from google.genai import types
-            
-            client = genai.Client(api_key=api_key)
-
-            # List caches to find one with the matching display_name
-            # Note: The new SDK listing might be synchronous or async depending on client configuration.
-            # Assuming standard sync usage for now as per common migration patterns, or wrapping if needed.
-            # Ideally we'd use an async client if available, but for migration safety we'll use the sync client
-            # inside this async method. If strict async is needed, we'd wrap in run_in_executor.
-            
-            existing_cache = None
-            # Using the list method which returns an iterable
-            for c in client.caches.list():
-                if c.display_name == cache_name:
-                    existing_cache = c
-                    break
-
-            if existing_cache:
-                self.logger.info(f"Found existing Gemini cache: {existing_cache.name}")
-                # Update TTL
-                client.caches.update(
-                    name=existing_cache.name,
-                    config=types.UpdateCachedContentConfig(
-                        ttl=f"{ttl_minutes * 60}s" # TTL in seconds as string with 's' suffix often required
-                    )
-                )
-                return existing_cache.name
-
-            self.logger.info(f"Creating new Gemini cache: {cache_name}")
-            
-            if not contents:
-                self.logger.warning(
-                    f"Skipping Gemini cache creation for {cache_name} because no contents were provided."
-                )
-                return None
-
-            # Create the cache
-            cached_content = client.caches.create(
-                model="models/gemini-flash-latest",
-                config=types.CreateCachedContentConfig(
-                    display_name=cache_name,
-                    system_instruction=system_instruction,
-                    contents=[types.Content(parts=[types.Part(text=c)]) for c in contents],
-                    ttl=f"{ttl_minutes * 60}s",
-                )
-            )
-            return cached_content.name
-
-        except Exception as e:
-            self.logger.error(f"Error creating Gemini cache: {e}")
-            return None
-
     async def _initialize(self):
         """Asynchronously initializes LLM, context, and agent executor."""
         if self.agent_executor:
@@ -424,6 +371,7 @@ class ArchitectAgent:
                 f"- `get_recent_chapters_summary_tool`: Get a summary of recent chapters (default is 3).\\n"
                 f"- `generate_chapter_tool`: Generate a new chapter draft based on provided details.\\n"
                 f"- `query_codex_tool`: Search the project's knowledge base (characters, worldbuilding, etc).\\n"
+                f"- `query_codex_batch_tool`: Run several knowledge base searches at once (e.g. one per character or place you need to look up).\\n"
                 f"- `get_project_structure_tool`: Get the project's folder structure for organizing chapters.\\n"
                 f"- `update_project_structure_tool`: Updates the project's folder structure. Requires a JSON string containing the full desired structure under a 'project_structure' key. Each folder item should have type 'folder', and chapter items should have type 'chapter'.\n"
                 f"- `update_target_word_count_tool`: Sets a default target word count for all chapters in the project.\\n"
@@ -444,29 +392,15 @@ class ArchitectAgent:
                 f"IMPORTANT: Your role is as an intelligent creative assistant. The user is always in control and makes the final decisions for their project."
             )
 
-            # Handle Caching for Gemini
-            cached_content_name = None
-            if "gemini" in architect_model_name.lower():
-                # Create a unique cache name for this project's architect system prompt
-                # Sanitize project_id for cache name (must be alphanumeric/dashes)
-                safe_project_id = "".join(c for c in self.project_id if c.isalnum() or c in "-_")
-                cache_display_name = f"architect_sys_{safe_project_id}"
-                
-                cached_content_name = await self._get_or_create_gemini_cache(
-                    cache_name=cache_display_name,
-                    system_instruction=system_message,
-                    api_key=gemini_api_key
-                )
-
+            # Gemini explicit context caching isn't used: the agent binds tools, which Gemini
+            # rejects alongside a cached system instruction. Implicit prefix caching applies.
             self.llm = await self._get_llm_instance(
-                architect_model_name, gemini_api_key, openrouter_api_key, cached_content_name
+                architect_model_name, gemini_api_key, openrouter_api_key
             )
-            # Construct System Message Object
-            final_system_message_content = system_message if not cached_content_name else "You are the Architect AI. Use the cached context."
-            system_msg_obj = SystemMessage(content=final_system_message_content)
+            system_msg_obj = SystemMessage(content=system_message)
             
             # Apply Anthropic Caching if applicable
-            if "anthropic" in architect_model_name.lower() and not cached_content_name:
+            if "anthropic" in architect_model_name.lower():
                  # Cache the system prompt for Anthropic
                  system_msg_obj.additional_kwargs["cache_control"] = {"type": "ephemeral"}
 
@@ -524,40 +458,20 @@ class ArchitectAgent:
         model_name: str,
         gemini_key: Optional[str],
         openrouter_key: Optional[str],
-        cached_content_name: Optional[str] = None,
     ) -> BaseChatModel:
         self.logger.debug(f"Creating LLM instance for Architect: {model_name}")
         try:
-            llm_instance: BaseChatModel
-            temperature = float(self.model_settings.get("temperature", 0.7))
-
-            if model_name.startswith("openrouter/"):
-                if not openrouter_key:
-                    raise ValueError(
-                        "OpenRouter API key is required but not configured."
-                    )
-                openrouter_model_id = model_name.split("openrouter/", 1)[1]
-                llm_instance = ChatOpenAI(
-                    model=openrouter_model_id,
-                    openai_api_key=openrouter_key,
-                    openai_api_base=OPENROUTER_API_BASE,
-                    temperature=temperature,
-                    default_headers={
-                        "HTTP-Referer": SITE_URL,
-                        "X-Title": SITE_NAME,
-                    },
-                )
-            else:
-                if not gemini_key:
-                    raise ValueError("Gemini API key is required but not configured.")
-                llm_instance = ChatGoogleGenerativeAI(
-                    model=model_name,
-                    google_api_key=gemini_key,
-                    temperature=temperature,
-                    cached_content=cached_content_name,
-                    convert_system_message_to_human=True,
-                    max_output_tokens=8192,
+            provider, _ = route_model(model_name)
+            if provider not in ("openrouter", "gemini"):
+                raise ValueError(
+                    f"The Architect supports Gemini and OpenRouter models, not {model_name}."
                 )
+            llm_instance = llm_clients.get(
+                model_name,
+                openrouter_key if provider == "openrouter" else gemini_key,
+                float(self.model_settings.get("temperature", 0.7)),
+                max_output_tokens=8192 if provider == "gemini" else None,
+            )
             self.logger.info(f"Architect LLM instance created: {model_name}")
             return llm_instance
         except Exception as e:
@@ -698,18 +612,16 @@ class ArchitectAgent:
                     parsing_llm_name, gemini_key, or_key
                 )
 
-            parser = PydanticOutputParser(pydantic_object=ChapterDetailsInput)
             prompt = ChatPromptTemplate.from_template(
                 "Parse the following chapter generation request into a structured format. Extract the plot, writing style, and any other instructions mentioned.\\nRequest: {request}\\n{format_instructions}"
             )
-            chain = prompt | self.parsing_llm | parser
-
             try:
-                parsed_input: ChapterDetailsInput = await chain.ainvoke(
-                    {
-                        "request": chapter_details,
-                        "format_instructions": parser.get_format_instructions(),
-                    }
+                parsed_input: ChapterDetailsInput = await structured_output.ainvoke(
+                    self.parsing_llm,
+                    prompt,
+                    {"request": chapter_details},
+                    ChapterDetailsInput,
+                    "chapter_request_parsing",
                 )
             except Exception as parse_error:
                 self.logger.error(
@@ -814,32 +726,74 @@ class ArchitectAgent:
                     return "Error: Vector store not available for this project."
 
                 results = await agent_manager_instance.vector_store.similarity_search(
-                    query, k=k
+                    query,
+                    k=k,
+                    payload_fields=CODEX_TOOL_PAYLOAD_FIELDS,
+                    max_snippet_chars=201,  # One extra char so the "..." check below still works
                 )
                 if not results:
                     return "No relevant information found in the knowledge base for that query."
+                return self._format_codex_results(results)
 
-                formatted_results = []
-                for i, doc in enumerate(results):
-                    metadata = doc.metadata or {}
-                    item_type = metadata.get("type", "Unknown")
-                    name = metadata.get("name", metadata.get("title", ""))
-                    item_id = metadata.get("id", "Unknown ID")
-                    codex_item_id = metadata.get("codex_item_id", item_id)
-                    content_preview = doc.page_content[:200] + (
-                        "..." if len(doc.page_content) > 200 else ""
-                    )
-                    formatted_results.append(
-                        f"{i+1}. Type: {item_type}, Name: {name}, ID: {codex_item_id}, Content: {content_preview}"
-                    )
+        except Exception as e:
+            self.logger.error(f"Error in query_codex_tool: {e}", exc_info=True)
+            return f"Error querying knowledge base: {str(e)}"
+
+    async def query_codex_batch_tool(self, queries: List[str], k: int = 3) -> str:
+        """Runs several knowledge base searches with one embedding round-trip and one Qdrant batch request."""
+        project_id = self.project_id
+        self.logger.info(
+            f"[Architect Tool] query_codex_batch_tool called for project {project_id} with {len(queries)} queries (k={k})"
+        )
+        try:
+            if not self.agent_manager:
+                return "Error: AgentManager not available to query_codex_batch_tool"
+            if not queries:
+                return "Error: No queries provided."
+
+            async with self.agent_manager.get_or_create_manager(
+                self.user_id, project_id
+            ) as agent_manager_instance:
+                if not agent_manager_instance.vector_store:
+                    return "Error: Vector store not available for this project."
 
-                result_text = "\n".join(formatted_results)
-                return result_text
+                results_per_query = await agent_manager_instance.vector_store.search_many(
+                    queries,
+                    k=k,
+                    payload_fields=CODEX_TOOL_PAYLOAD_FIELDS,
+                    max_snippet_chars=201,
+                )
+                sections = []
+                for query, results in zip(queries, results_per_query):
+                    body = (
+                        self._format_codex_results(results)
+                        if results
+                        else "No relevant information found."
+                    )
+                    sections.append(f"Results for '{query}':\n{body}")
+                return "\n\n".join(sections)
 
         except Exception as e:
-            self.logger.error(f"Error in query_codex_tool: {e}", exc_info=True)
+            self.logger.error(f"Error in query_codex_batch_tool: {e}", exc_info=True)
             return f"Error querying knowledge base: {str(e)}"
 
+    @staticmethod
+    def _format_codex_results(results: List[Any]) -> str:
+        formatted_results = []
+        for i, doc in enumerate(results):
+            metadata = doc.metadata or {}
+            item_type = metadata.get("type", "Unknown")
+            name = metadata.get("name", metadata.get("title", ""))
+            item_id = metadata.get("id", "Unknown ID")
+            codex_item_id = metadata.get("codex_item_id", item_id)
+            content_preview = doc.page_content[:200] + (
+                "..." if len(doc.page_content) > 200 else ""
+            )
+            formatted_results.append(
+                f"{i+1}. Type: {item_type}, Name: {name}, ID: {codex_item_id}, Content: {content_preview}"
+            )
+        return "\n".join(formatted_results)
+
     async def get_project_details_tool(self) -> str:
         """Fetches the basic details of the current project (name, description)."""
         project_id = self.project_id
@@ -919,26 +873,23 @@ class ArchitectAgent:
                 chapters_data.sort(key=lambda x: x.get("chapter_number", 0))
                 recent_chapters = chapters_data[-count:]
 
+                # Stored summaries are reused; only chapters edited since are re-summarized
+                with_content = [c for c in recent_chapters if c.get("content")]
+                stored_summaries = await agent_manager_instance.summarize_chapters(
+                    [(c["id"], c["content"], SUMMARY_LEVEL_CHAPTER) for c in with_content]
+                )
+                summary_by_id = {
+                    c["id"]: summary for c, summary in zip(with_content, stored_summaries)
+                }
+
                 summaries = []
                 for chapter in recent_chapters:
                     chap_num = chapter.get("chapter_number", "N/A")
                     chap_title = chapter.get("title", f"Chapter {chap_num}")
-                    content = chapter.get("content", "")
-                    if not content:
+                    if not chapter.get("content"):
                         summaries.append(f"Ch {chap_num} ({chap_title}): [No content]")
                         continue
-
-                    from langchain_core.documents import Document
-
-                    docs_to_summarize = [Document(page_content=content)]
-                    summary_result = (
-                        await agent_manager_instance.summarize_chain.ainvoke(
-                            {"input_documents": docs_to_summarize}
-                        )
-                    )
-                    summary_text = summary_result.get(
-                        "output_text", "[Summary unavailable]"
-                    )
+                    summary_text = summary_by_id.get(chapter["id"]) or "[Summary unavailable]"
                     summaries.append(f"Ch {chap_num} ({chap_title}): {summary_text}")
 
                 return "\\n\\n".join(summaries)
@@ -131,6 +131,9 @@ class Project(Base):
     validity_checks = relationship(
         "ValidityCheck", back_populates="project", cascade="all, delete-orphan"
     )
+    chapter_summaries = relationship(
+        "ChapterSummary", back_populates="project", cascade="all, delete-orphan"
+    )
     codex_items = relationship(
         "CodexItem", back_populates="project", cascade="all, delete-orphan"
     )
@@ -258,6 +261,34 @@ class ValidityCheck(Base):
         }
 
 
+class ChapterSummary(Base):
+    """
+    LLM summary of a chapter's text (level "chapter") or of a run of chapters starting
+    at chapter_id (level "arc" or "book"). Keyed by the hash of the summarized text, so a
+    summary stays valid until that text changes.
+    """
+
+    __tablename__ = "chapter_summaries"
+    __table_args__ = (
+        UniqueConstraint("chapter_id", "content_hash", "level", name="uq_chapter_summary"),
+        Index("ix_chapter_summaries_project", "project_id"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    chapter_id = Column(String, ForeignKey("chapters.id"), nullable=False)
+    project_id = Column(String, ForeignKey("projects.id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    level = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)
+    summary = Column(Text, nullable=False)
+    model = Column(String, nullable=True)  # LLM that wrote it (informational)
+    created_at = Column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+    project = relationship("Project", back_populates="chapter_summaries")
+
+
 class CodexItem(Base):
     __tablename__ = "codex_items"
     id = Column(String, primary_key=True)
@@ -913,6 +944,66 @@ class Database:
             logger.error(f"Error fetching all chapters: {str(e)}")
             raise
 
+    async def get_chapter_summaries(
+        self, user_id: str, project_id: str
+    ) -> Dict[tuple, str]:
+        """Stored summaries for a project as {(chapter_id, content_hash, level): summary}."""
+        try:
+            async with self.Session() as session:
+                result = await session.execute(
+                    select(
+                        ChapterSummary.chapter_id,
+                        ChapterSummary.content_hash,
+                        ChapterSummary.level,
+                        ChapterSummary.summary,
+                    ).where(
+                        ChapterSummary.user_id == user_id,
+                        ChapterSummary.project_id == project_id,
+                    )
+                )
+                return {
+                    (chapter_id, content_hash, level): summary
+                    for chapter_id, content_hash, level, summary in result.all()
+                }
+        except Exception as e:
+            logger.error(f"Error fetching chapter summaries: {str(e)}")
+            raise
+
+    async def save_chapter_summary(
+        self,
+        chapter_id: str,
+        user_id: str,
+        project_id: str,
+        level: str,
+        content_hash: str,
+        summary: str,
+        model: Optional[str] = None,
+    ):
+        """Stores a summary, replacing summaries of older versions of the same text."""
+        try:
+            async with self.Session() as session:
+                async with session.begin():
+                    await session.execute(
+                        delete(ChapterSummary).where(
+                            ChapterSummary.chapter_id == chapter_id,
+                            ChapterSummary.level == level,
+                        )
+                    )
+                    session.add(
+                        ChapterSummary(
+                            chapter_id=chapter_id,
+                            user_id=user_id,
+                            project_id=project_id,
+                            level=level,
+                            content_hash=content_hash,
+                            summary=summary,
+                            model=model,
+                        )
+                    )
+        except Exception as e:
+            logger.error(f"Error saving chapter summary: {str(e)}")
+            raise
+
     async def create_chapter(
         self,
         title: str,
@@ -1026,6 +1117,12 @@ class Database:
                     logger.debug(
                         f"Deleted validity checks associated with chapter {chapter_id}"
                     )
+                    await session.execute(
+                        delete(ChapterSummary).where(
+                            ChapterSummary.chapter_id == chapter_id,
+                            ChapterSummary.project_id == project_id,
+                        )
+                    )
 
                     # 3. Delete the chapter itself
                     delete_chapter_stmt = (
@@ -1407,6 +1504,8 @@ class Database:
             "extractionLLM": "gemini-1.5-pro-002",
             "knowledgeBaseQueryLLM": "gemini-1.5-pro-002",
             "temperature": 0.7,
+            "embeddingDimensions": None,
+            "denseRescoring": False,
         }
 
     async def create_location(
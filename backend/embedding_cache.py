@@ -0,0 +1,306 @@
+# backend/embedding_cache.py
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SparseEntry = Tuple[List[int], List[float]]
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of the exact text that gets embedded."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Local SQLite cache of document embeddings keyed by (embedding model, content hash).
+
+    Dense vectors are stored as packed float32 blobs and sparse vectors as packed
+    uint32 indices plus float32 values, so a 3072-dim vector takes ~12KB instead of
+    a JSON list. Entries are evicted least-recently-used once the cache grows past
+    max_bytes. All methods are synchronous and are expected to be called from the
+    executor threads that already run the embedding calls.
+    """
+
+    def __init__(self, db_path: str = "./embedding_cache.db", max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._total_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    indices BLOB,
+                    vals BLOB NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, content_hash, kind)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)"
+            )
+            conn.commit()
+            self._total_bytes = conn.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM embeddings"
+            ).fetchone()[0]
+            self._conn = conn
+            logger.info(
+                f"Embedding cache opened at {self.db_path} ({self._total_bytes / 1024 / 1024:.1f} MB)"
+            )
+        return self._conn
+
+    def _get_many(self, model: str, kind: str, hashes: Sequence[str]) -> Dict[str, Tuple]:
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            conn = self._connection()
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT content_hash, indices, vals FROM embeddings "
+                    f"WHERE model = ? AND kind = ? AND content_hash IN ({placeholders})",
+                    [model, kind, *chunk],
+                ).fetchall()
+                for row_hash, indices, vals in rows:
+                    found[row_hash] = (indices, vals)
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND kind = ? AND content_hash = ?",
+                    [(time.time(), model, kind, h) for h in found],
+                )
+                conn.commit()
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def _put_many(self, model: str, kind: str, rows: List[Tuple[str, Optional[bytes], bytes]]):
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            for row_hash, indices, vals in rows:
+                size = len(vals) + (len(indices) if indices else 0)
+                previous = conn.execute(
+                    "SELECT size_bytes FROM embeddings WHERE model = ? AND kind = ? AND content_hash = ?",
+                    (model, kind, row_hash),
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings "
+                    "(model, content_hash, kind, indices, vals, size_bytes, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (model, row_hash, kind, indices, vals, size, now),
+                )
+                self._total_bytes += size - (previous[0] if previous else 0)
+            conn.commit()
+            self._evict_if_needed(conn)
+
+    def _evict_if_needed(self, conn: sqlite3.Connection):
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Evict down to 90% so we don't churn on every insert
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._total_bytes > target:
+            rows = conn.execute(
+                "SELECT model, content_hash, kind, size_bytes FROM embeddings "
+                "ORDER BY last_used ASC LIMIT 200"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND content_hash = ? AND kind = ?",
+                [(m, h, k) for m, h, k, _ in rows],
+            )
+            self._total_bytes -= sum(r[3] for r in rows)
+            evicted += len(rows)
+        conn.commit()
+        logger.info(
+            f"Embedding cache evicted {evicted} entries ({self._total_bytes / 1024 / 1024:.1f} MB remaining)"
+        )
+
+    def get_dense(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Returns cached dense vectors for the given content hashes (missing ones are omitted)."""
+        result = {}
+        for row_hash, (_, vals) in self._get_many(model, "dense", hashes).items():
+            result[row_hash] = array("f", vals).tolist()
+        return result
+
+    def put_dense(self, model: str, entries: Dict[str, List[float]]):
+        self._put_many(
+            model,
+            "dense",
+            [(row_hash, None, array("f", vector).tobytes()) for row_hash, vector in entries.items()],
+        )
+
+    def get_sparse(self, model: str, hashes: Sequence[str]) -> Dict[str, SparseEntry]:
+        """Returns cached sparse vectors as (indices, values) for the given content hashes."""
+        result = {}
+        for row_hash, (indices, vals) in self._get_many(model, "sparse", hashes).items():
+            result[row_hash] = (array("I", indices or b"").tolist(), array("f", vals).tolist())
+        return result
+
+    def put_sparse(self, model: str, entries: Dict[str, SparseEntry]):
+        self._put_many(
+            model,
+            "sparse",
+            [
+                (row_hash, array("I", indices).tobytes(), array("f", values).tobytes())
+                for row_hash, (indices, values) in entries.items()
+            ],
+        )
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size_bytes": self._total_bytes or 0,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+embedding_cache = EmbeddingCache()
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU+TTL cache of query embeddings, keyed by (model, query text).
+
+    Concurrent lookups for the same key share a single computation (single-flight),
+    so e.g. context construction and validation asking for the same plot query at
+    the same time only embed it once.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: int = 1800):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    async def get_or_compute(self, key: Tuple, compute: Callable[[], Awaitable]):
+        try:
+            value = self._cache[key]
+            self.hits += 1
+            return value
+        except KeyError:
+            pass
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            self._cache[key] = value
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved in case nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_compute_many(
+        self, keys: Sequence[Tuple], compute_many: Callable[[List[Tuple]], Awaitable[List]]
+    ) -> List:
+        """
+        Batch variant of get_or_compute: keys that are neither cached nor in flight are
+        computed with a single compute_many call; results are returned in input order.
+        """
+        results: Dict[Tuple, object] = {}
+        waiting: Dict[Tuple, asyncio.Future] = {}
+        owned: Dict[Tuple, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        for key in dict.fromkeys(keys):
+            try:
+                results[key] = self._cache[key]
+                self.hits += 1
+                continue
+            except KeyError:
+                pass
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self.deduplicated += 1
+                waiting[key] = pending
+            else:
+                self.misses += 1
+                owned[key] = self._inflight[key] = loop.create_future()
+
+        if owned:
+            try:
+                values = await compute_many(list(owned))
+                if len(values) != len(owned):
+                    raise ValueError(
+                        f"compute_many returned {len(values)} values for {len(owned)} keys"
+                    )
+                for (key, future), value in zip(owned.items(), values):
+                    self._cache[key] = value
+                    future.set_result(value)
+                    results[key] = value
+            except BaseException as e:
+                # Futures resolved before the failure keep their value
+                for future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()  # Mark retrieved in case nobody else was waiting
+                raise
+            finally:
+                for key in owned:
+                    self._inflight.pop(key, None)
+
+        for key, pending in waiting.items():
+            results[key] = await asyncio.shield(pending)
+        return [results[key] for key in keys]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.deduplicated
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "hit_rate": round((self.hits + self.deduplicated) / lookups, 3) if lookups else 0.0,
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache()
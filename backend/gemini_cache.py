@@ -0,0 +1,275 @@
+# backend/gemini_cache.py
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from embedding_cache import content_hash
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:
+    genai = None
+    types = None
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CACHE_TTL_SECONDS = 3600
+GEMINI_CACHE_REFRESH_MARGIN_SECONDS = 300  # Extend a cache that is still in use this long before it expires
+GEMINI_CACHE_FAILURE_BACKOFF_SECONDS = 600  # e.g. content below the model's minimum cacheable size
+
+# (api key hash, model path, content hash)
+CacheKey = Tuple[str, str, str]
+
+
+class _CacheEntry:
+    def __init__(self, name: str, display_name: str, expires_at: float):
+        self.name = name
+        self.display_name = display_name
+        self.expires_at = expires_at
+        self.refreshed_at = time.monotonic()
+        self.last_used = self.refreshed_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class GeminiCacheRegistry:
+    """
+    In-process map of Gemini context caches, keyed by (API key, model, content hash),
+    with their known expiry.
+
+    A lookup for content that is already cached costs no API call. Creation and TTL
+    updates use the SDK's async client, and concurrent callers for the same key share
+    one request. With min_tokens, content is measured with the model's own tokenizer
+    (count_tokens) before creation, and content found too small is remembered so it is
+    never measured again. Caches that were used since their last refresh are extended shortly
+    before they expire; unused ones are left to expire. A new version of a cache with
+    the same display name and model (e.g. an edited system prompt) replaces and deletes
+    the old one.
+    """
+
+    def __init__(self):
+        self._entries: Dict[CacheKey, _CacheEntry] = {}
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._failed_until: Dict[CacheKey, float] = {}
+        self._too_small: Set[CacheKey] = set()
+        self._clients: Dict[str, Any] = {}
+        self._tasks = set()
+        self.hits = 0
+        self.created = 0
+        self.refreshed = 0
+        self.deleted = 0
+        self.too_small = 0
+        self.failures = 0
+
+    def _client(self, key_hash: str, api_key: str):
+        client = self._clients.get(key_hash)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            self._clients[key_hash] = client
+        return client
+
+    @staticmethod
+    def _model_path(model: str) -> str:
+        return model if model.startswith("models/") else f"models/{model}"
+
+    async def get_or_create(
+        self,
+        api_key: str,
+        model: str,
+        display_name: str,
+        system_instruction: Optional[str],
+        contents: Optional[List[str]] = None,
+        ttl_seconds: int = GEMINI_CACHE_TTL_SECONDS,
+        min_tokens: int = 0,
+    ) -> Optional[str]:
+        """
+        Name of a context cache holding system_instruction and contents for model, or None
+        if one can't be created or the content is under min_tokens (the caller should then
+        send the content uncached).
+        """
+        if genai is None or not api_key:
+            return None
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        key = (
+            key_hash,
+            self._model_path(model),
+            content_hash("\x00".join([system_instruction or "", *(contents or [])])),
+        )
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - now > GEMINI_CACHE_REFRESH_MARGIN_SECONDS:
+            entry.last_used = now
+            self.hits += 1
+            return entry.name
+        if key in self._too_small or self._failed_until.get(key, 0) > now:
+            return None
+
+        async def refresh_or_create() -> Optional[str]:
+            client = self._client(key_hash, api_key)
+            if entry is not None and await self._refresh(client, key, entry, ttl_seconds):
+                return entry.name
+            if entry is None and min_tokens and not await self._large_enough(
+                client, key, system_instruction, contents, min_tokens
+            ):
+                return None
+            return await self._create(
+                client, key, display_name, system_instruction, contents, ttl_seconds
+            )
+
+        name = await self._single_flight(key, refresh_or_create)
+        current = self._entries.get(key)
+        if current is not None:
+            current.last_used = time.monotonic()
+        return name
+
+    async def _single_flight(
+        self, key: CacheKey, operation: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        name = None
+        try:
+            name = await operation()
+        except Exception as e:
+            self.failures += 1
+            self._failed_until[key] = time.monotonic() + GEMINI_CACHE_FAILURE_BACKOFF_SECONDS
+            logger.error(f"Error creating Gemini cache: {e}")
+        finally:
+            future.set_result(name)
+            self._inflight.pop(key, None)
+        return name
+
+    async def _large_enough(
+        self,
+        client,
+        key: CacheKey,
+        system_instruction: Optional[str],
+        contents: Optional[List[str]],
+        min_tokens: int,
+    ) -> bool:
+        response = await client.aio.models.count_tokens(
+            model=key[1], contents=[t for t in [system_instruction, *(contents or [])] if t]
+        )
+        if (response.total_tokens or 0) >= min_tokens:
+            return True
+        self.too_small += 1
+        self._too_small.add(key)
+        return False
+
+    async def _refresh(self, client, key: CacheKey, entry: _CacheEntry, ttl_seconds: int) -> bool:
+        try:
+            await client.aio.caches.update(
+                name=entry.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"),
+            )
+        except Exception as e:
+            # Usually the cache already expired; the caller recreates it
+            logger.info(f"Could not extend Gemini cache {entry.name}: {e}")
+            self._forget(key, entry)
+            return False
+        self.refreshed += 1
+        entry.expires_at = time.monotonic() + ttl_seconds
+        entry.refreshed_at = time.monotonic()
+        self._schedule_refresh(client, key, entry, ttl_seconds)
+        return True
+
+    async def _create(
+        self,
+        client,
+        key: CacheKey,
+        display_name: str,
+        system_instruction: Optional[str],
+        contents: Optional[List[str]],
+        ttl_seconds: int,
+    ) -> str:
+        logger.info(f"Creating new Gemini cache: {display_name}")
+        cached_content = await client.aio.caches.create(
+            model=key[1],
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=system_instruction,
+                contents=[types.Content(parts=[types.Part(text=c)]) for c in contents]
+                if contents
+                else None,
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        self.created += 1
+        entry = _CacheEntry(cached_content.name, display_name, time.monotonic() + ttl_seconds)
+        self._entries[key] = entry
+        self._schedule_refresh(client, key, entry, ttl_seconds)
+
+        # Older content under the same display name, key and model is superseded
+        for other_key, other in list(self._entries.items()):
+            if (
+                other_key != key
+                and other_key[:2] == key[:2]
+                and other.display_name == display_name
+            ):
+                self._forget(other_key, other)
+                self._spawn(self._delete(client, other.name))
+        return entry.name
+
+    def _schedule_refresh(self, client, key: CacheKey, entry: _CacheEntry, ttl_seconds: int):
+        if entry.timer is not None:
+            entry.timer.cancel()
+        entry.timer = asyncio.get_running_loop().call_later(
+            max(ttl_seconds - GEMINI_CACHE_REFRESH_MARGIN_SECONDS, 1),
+            self._refresh_due,
+            client,
+            key,
+            entry,
+            ttl_seconds,
+        )
+
+    def _refresh_due(self, client, key: CacheKey, entry: _CacheEntry, ttl_seconds: int):
+        entry.timer = None
+        if self._entries.get(key) is not entry:
+            return
+        if entry.last_used <= entry.refreshed_at:
+            # Unused since the last refresh: let it expire on the server
+            self._forget(key, entry)
+            return
+
+        async def refresh() -> Optional[str]:
+            return entry.name if await self._refresh(client, key, entry, ttl_seconds) else None
+
+        self._spawn(self._single_flight(key, refresh))
+
+    def _forget(self, key: CacheKey, entry: _CacheEntry):
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    async def _delete(self, client, name: str):
+        try:
+            await client.aio.caches.delete(name=name)
+            self.deleted += 1
+        except Exception as e:
+            logger.info(f"Could not delete superseded Gemini cache {name}: {e}")
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "deleted": self.deleted,
+            "too_small": self.too_small,
+            "failures": self.failures,
+        }
+
+
+gemini_caches = GeminiCacheRegistry()
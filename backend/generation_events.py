@@ -0,0 +1,174 @@
+# backend/generation_events.py
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+GENERATION_EVENT_HISTORY = 4096  # Events kept per run so late or reconnecting clients can catch up
+GENERATION_EVENT_RETENTION_SECONDS = 300.0  # How long a finished run's events stay available
+GENERATION_SUBSCRIBER_QUEUE_SIZE = 2048
+
+
+class _GenerationRun:
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]  # Tells this run's event IDs apart from a previous run's
+        self.next_id = 1
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=GENERATION_EVENT_HISTORY)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.finished = False
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+
+class GenerationEventBroker:
+    """
+    Fan-out of chapter generation progress (node transitions, LLM tokens, saved chapters)
+    to Server-Sent Events clients, per project.
+
+    Every event gets an id of the form "<run token>:<sequence>", and the run's recent
+    events are kept so a client that connects late or reconnects with Last-Event-ID
+    resumes where it left off. If events it hasn't seen were already dropped from the
+    history, or its Last-Event-ID belongs to an earlier run, the replay starts with a
+    "reset" event so the client reloads state instead of silently missing them. A
+    subscriber that falls too far behind is disconnected rather than slowing down
+    generation; it can reconnect and replay from history.
+    """
+
+    def __init__(self):
+        self._runs: Dict[str, _GenerationRun] = {}
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def start(self, project_id: str):
+        """Begins a new run for the project, replacing a previous run's history."""
+        previous = self._runs.get(project_id)
+        if previous is not None:
+            self._close_subscribers(previous)
+            if previous.expiry is not None:
+                previous.expiry.cancel()
+        self._runs[project_id] = _GenerationRun()
+
+    def publish(self, project_id: str, event: str, data: Dict[str, Any]):
+        run = self._runs.get(project_id)
+        if run is None or run.finished:
+            return
+        message = {
+            "id": f"{run.token}:{run.next_id}",
+            "seq": run.next_id,
+            "event": event,
+            "data": data,
+        }
+        run.next_id += 1
+        run.history.append(message)
+        self.published += 1
+        for queue in list(run.subscribers):
+            # The last slot is reserved for the end marker
+            if queue.qsize() < queue.maxsize - 1:
+                queue.put_nowait(message)
+            else:
+                self.dropped_subscribers += 1
+                logger.warning(f"Dropping slow generation event subscriber for project {project_id[:8]}")
+                run.subscribers.discard(queue)
+                queue.put_nowait(None)
+
+    def finish(self, project_id: str, data: Optional[Dict[str, Any]] = None):
+        """Publishes the final "done" event, ends all streams and expires the history later."""
+        run = self._runs.get(project_id)
+        if run is None or run.finished:
+            return
+        self.publish(project_id, "done", data or {})
+        run.finished = True
+        self._close_subscribers(run)
+        run.expiry = asyncio.get_running_loop().call_later(
+            GENERATION_EVENT_RETENTION_SECONDS, self._expire, project_id, run
+        )
+
+    def subscribe(
+        self, project_id: str, last_event_id: Optional[str] = None
+    ) -> Optional[asyncio.Queue]:
+        """
+        Queue of events after last_event_id for the project's current or latest run,
+        ending with None. An ID from another run replays the current run from the
+        start. Returns None if the project has no run to follow.
+        """
+        run = self._runs.get(project_id)
+        if run is None:
+            return None
+        token, last_seq = _parse_event_id(last_event_id)
+        new_run = last_event_id is not None and token != run.token
+        if token != run.token:
+            last_seq = 0
+        backlog: List[Dict[str, Any]] = [m for m in run.history if m["seq"] > last_seq]
+        oldest_seq = run.history[0]["seq"] if run.history else run.next_id
+        if new_run or oldest_seq > last_seq + 1:
+            # Sits just before the oldest retained event, so resuming from it stays gap-free
+            backlog.insert(
+                0,
+                {
+                    "id": f"{run.token}:{oldest_seq - 1}",
+                    "seq": oldest_seq - 1,
+                    "event": "reset",
+                    "data": {
+                        "missed_from": last_seq + 1,
+                        "missed_to": oldest_seq - 1,
+                        "new_run": new_run,
+                    },
+                },
+            )
+        queue: asyncio.Queue = asyncio.Queue(
+            maxsize=max(GENERATION_SUBSCRIBER_QUEUE_SIZE, len(backlog)) + 1
+        )
+        for message in backlog:
+            queue.put_nowait(message)
+        if run.finished:
+            queue.put_nowait(None)
+        else:
+            run.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, project_id: str, queue: asyncio.Queue):
+        run = self._runs.get(project_id)
+        if run is not None:
+            run.subscribers.discard(queue)
+
+    def _close_subscribers(self, run: _GenerationRun):
+        for queue in run.subscribers:
+            queue.put_nowait(None)
+        run.subscribers.clear()
+
+    def _expire(self, project_id: str, run: _GenerationRun):
+        if self._runs.get(project_id) is run:
+            del self._runs[project_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": len(self._runs),
+            "active_runs": sum(1 for run in self._runs.values() if not run.finished),
+            "subscribers": sum(len(run.subscribers) for run in self._runs.values()),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+def _parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+    """Splits a "<run token>:<sequence>" event ID; anything else reads as (None, 0)."""
+    token, _, seq = (event_id or "").partition(":")
+    try:
+        return token, int(seq)
+    except ValueError:
+        return None, 0
+
+
+def format_sse(message: Dict[str, Any]) -> str:
+    """Encodes an event as a Server-Sent Events frame."""
+    return (
+        f"id: {message['id']}\n"
+        f"event: {message['event']}\n"
+        f"data: {json.dumps(message['data'], default=str)}\n\n"
+    )
+
+
+generation_events = GenerationEventBroker()
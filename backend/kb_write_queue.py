@@ -0,0 +1,163 @@
+# backend/kb_write_queue.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KB_WRITE_DEBOUNCE_SECONDS = 3.0  # Quiet period after the last edit before a project's queue is written
+KB_WRITE_MAX_DELAY_SECONDS = 20.0  # Upper bound on how long a continuously edited item can wait
+KB_WRITE_BATCH_SIZE = 32
+
+# (doc_id, new_content, new_metadata)
+KnowledgeBaseUpdate = Tuple[str, Optional[str], Dict[str, Any]]
+UpdateWriter = Callable[[List[KnowledgeBaseUpdate]], Awaitable[Any]]
+
+
+class _ProjectQueue:
+    def __init__(self):
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.writer: Optional[UpdateWriter] = None
+        self.first_enqueued_at: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.lock = asyncio.Lock()
+
+
+class KnowledgeBaseWriteQueue:
+    """
+    Per-project write-behind queue for knowledge base updates coming from editor saves.
+
+    Repeated updates to the same document inside the debounce window are coalesced
+    (latest content wins, metadata is merged), and a project's queue is written as
+    batches through the writer registered with the latest enqueue, normally
+    VectorStore.update_many_in_knowledge_base. Queues are flushed when the window
+    expires, before reads that need fresh data, and when a manager closes.
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = KB_WRITE_DEBOUNCE_SECONDS,
+        max_delay_seconds: float = KB_WRITE_MAX_DELAY_SECONDS,
+        batch_size: int = KB_WRITE_BATCH_SIZE,
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.batch_size = batch_size
+        self._queues: Dict[Tuple[str, str], _ProjectQueue] = {}
+        self._flush_tasks = set()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def enqueue(
+        self,
+        key: Tuple[str, str],
+        doc_id: str,
+        new_content: Optional[str],
+        new_metadata: Optional[Dict[str, Any]],
+        writer: UpdateWriter,
+    ):
+        """Queues an update for doc_id and (re)starts the project's debounce timer."""
+        queue = self._queues.setdefault(key, _ProjectQueue())
+        queue.writer = writer
+        self.enqueued += 1
+        entry = queue.pending.get(doc_id)
+        if entry is None:
+            queue.pending[doc_id] = {"content": new_content, "metadata": dict(new_metadata or {})}
+        else:
+            self.coalesced += 1
+            if new_content is not None:
+                entry["content"] = new_content
+            entry["metadata"].update(new_metadata or {})
+
+        now = time.monotonic()
+        if queue.first_enqueued_at is None:
+            queue.first_enqueued_at = now
+        delay = min(
+            self.debounce_seconds,
+            max(queue.first_enqueued_at + self.max_delay_seconds - now, 0),
+        )
+        if queue.timer is not None:
+            queue.timer.cancel()
+        queue.timer = asyncio.get_running_loop().call_later(
+            delay, self._schedule_flush, key
+        )
+
+    def _schedule_flush(self, key: Tuple[str, str]):
+        task = asyncio.ensure_future(self.flush(key))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def discard(self, key: Tuple[str, str], doc_id: str):
+        """Drops a queued update, e.g. because the document is being deleted."""
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.pending.pop(doc_id, None)
+
+    async def flush(self, key: Tuple[str, str]):
+        """Writes everything queued for the project now. Concurrent callers wait for the same write."""
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        async with queue.lock:
+            if queue.timer is not None:
+                queue.timer.cancel()
+                queue.timer = None
+            batch, queue.pending = queue.pending, {}
+            queue.first_enqueued_at = None
+            if not batch:
+                return
+            updates = [
+                (doc_id, entry["content"], entry["metadata"]) for doc_id, entry in batch.items()
+            ]
+            for start in range(0, len(updates), self.batch_size):
+                chunk = updates[start : start + self.batch_size]
+                try:
+                    await queue.writer(chunk)
+                    self.written += len(chunk)
+                    self.batches += 1
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(
+                        f"Write-behind flush for project {key[1][:8]} failed; "
+                        f"keeping {len(updates) - start} updates queued: {e}",
+                        exc_info=True,
+                    )
+                    # Newer edits that arrived meanwhile win over the failed ones
+                    for doc_id, content, metadata in updates[start:]:
+                        newer = queue.pending.get(doc_id)
+                        if newer is None:
+                            queue.pending[doc_id] = {"content": content, "metadata": metadata}
+                        else:
+                            if newer["content"] is None:
+                                newer["content"] = content
+                            newer["metadata"] = {**metadata, **newer["metadata"]}
+                    queue.first_enqueued_at = time.monotonic()
+                    if queue.timer is not None:
+                        # Debounce started by an edit that arrived during the failed write
+                        queue.timer.cancel()
+                    queue.timer = asyncio.get_running_loop().call_later(
+                        self.max_delay_seconds, self._schedule_flush, key
+                    )
+                    return
+            logger.debug(f"Write-behind flushed {len(updates)} updates for project {key[1][:8]}")
+
+    async def flush_all(self):
+        for key in list(self._queues):
+            await self.flush(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "pending": sum(len(q.pending) for q in self._queues.values()),
+        }
+
+
+kb_write_queue = KnowledgeBaseWriteQueue()
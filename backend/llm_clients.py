@@ -0,0 +1,248 @@
+# backend/llm_clients.py
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from cachetools import TTLCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+
+from rate_limiter import rate_limits
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
+SITE_URL = os.getenv("SCROLLWISE_SITE_URL", "https://github.com/LotusSerene/scrollwise-ai")
+SITE_NAME = os.getenv("SCROLLWISE_SITE_NAME", "ScrollWise AI")
+
+# Keep-alive pools shared by every client of the same API host
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+POOL_TIMEOUT = httpx.Timeout(600.0, connect=10.0)  # Chapter drafts can stream for minutes
+
+_KEY_NAMES = {
+    "openrouter": "OpenRouter",
+    "anthropic": "Anthropic",
+    "openai": "OpenAI",
+    "gemini": "Gemini",
+}
+
+
+def route_model(model_name: str) -> Tuple[str, str]:
+    """
+    Splits a model setting into (provider, provider model id), e.g.
+    "openrouter/openai/gpt-4o" -> ("openrouter", "openai/gpt-4o"). Unprefixed names are Gemini.
+    """
+    for provider in ("openrouter", "anthropic", "openai"):
+        prefix = f"{provider}/"
+        if model_name.startswith(prefix):
+            return provider, model_name[len(prefix):]
+    return "gemini", model_name
+
+
+class _HttpPool:
+    """Sync and async httpx clients for one API host, created on first use."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.responses: Dict[str, int] = {}
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _on_request(self, request: httpx.Request):
+        self.requests += 1
+
+    def _on_response(self, response: httpx.Response):
+        bucket = f"{response.status_code // 100}xx"
+        self.responses[bucket] = self.responses.get(bucket, 0) + 1
+
+    async def _on_async_request(self, request: httpx.Request):
+        self._on_request(request)
+
+    async def _on_async_response(self, response: httpx.Response):
+        self._on_response(response)
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    limits=POOL_LIMITS,
+                    timeout=POOL_TIMEOUT,
+                    event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                )
+            return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(
+                    limits=POOL_LIMITS,
+                    timeout=POOL_TIMEOUT,
+                    event_hooks={
+                        "request": [self._on_async_request],
+                        "response": [self._on_async_response],
+                    },
+                )
+            return self._async_client
+
+    @staticmethod
+    def _connection_counts(client) -> Dict[str, int]:
+        # httpx doesn't expose its pool publicly; read the httpcore pool when it's there
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", None) or [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"open": len(connections), "idle": idle}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "responses": dict(self.responses),
+            "async_connections": self._connection_counts(self._async_client),
+            "sync_connections": self._connection_counts(self._sync_client),
+        }
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+class LLMClientRegistry:
+    """
+    Process-wide chat model clients keyed by (provider, model, API key hash, temperature,
+    options), so managers and agents using the same credentials and settings share one
+    client, and a client is never served to a caller with a different key.
+
+    OpenAI and OpenRouter clients use keep-alive httpx pools shared per API host. Gemini
+    and Anthropic clients keep their SDK's own transport, so for them reusing the client
+    instance is what keeps connections warm. Every client is rate limited through
+    rate_limiter.rate_limits.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: int = 3600):
+        self._clients: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._pools: Dict[str, _HttpPool] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _pool(self, name: str) -> _HttpPool:
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = _HttpPool(name)
+            return self._pools[name]
+
+    def get(
+        self,
+        model_name: str,
+        api_key: Optional[str],
+        temperature: float,
+        max_output_tokens: Optional[int] = None,
+    ) -> BaseChatModel:
+        """Returns the shared client for model_name (a model setting such as "openrouter/openai/gpt-4o")."""
+        provider, model_id = route_model(model_name)
+        if not api_key:
+            raise ValueError(
+                f"{_KEY_NAMES[provider]} API key is required for this model but not configured."
+            )
+        key = (
+            provider,
+            model_id,
+            hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+            float(temperature),
+            max_output_tokens,
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            self.misses += 1
+
+        client = self._create(
+            provider, model_id, api_key, float(temperature), max_output_tokens
+        )
+        with self._lock:
+            # Another caller may have created the same client meanwhile; keep the first
+            client = self._clients.setdefault(key, client)
+        logger.info(f"Created shared {provider} client for model {model_id}")
+        return client
+
+    def _create(
+        self,
+        provider: str,
+        model_id: str,
+        api_key: str,
+        temperature: float,
+        max_output_tokens: Optional[int],
+    ) -> BaseChatModel:
+        limiter = rate_limits.get(provider, api_key)
+        common = {
+            "temperature": temperature,
+            "rate_limiter": limiter,
+            "callbacks": [limiter.callback_handler],
+        }
+        if max_output_tokens:
+            common["max_tokens" if provider != "gemini" else "max_output_tokens"] = max_output_tokens
+
+        if provider in ("openrouter", "openai"):
+            pool = self._pool(provider)
+            extra = {}
+            if provider == "openrouter":
+                extra = {
+                    "openai_api_base": OPENROUTER_API_BASE,
+                    "default_headers": {"HTTP-Referer": SITE_URL, "X-Title": SITE_NAME},
+                }
+            return ChatOpenAI(
+                model=model_id,
+                openai_api_key=api_key,
+                http_client=pool.sync_client,
+                http_async_client=pool.async_client,
+                stream_usage=True,  # Streamed calls report token and cached-token usage too
+                **extra,
+                **common,
+            )
+        if provider == "anthropic":
+            from langchain_anthropic import ChatAnthropic
+
+            return ChatAnthropic(model=model_id, anthropic_api_key=api_key, **common)
+        return ChatGoogleGenerativeAI(
+            model=model_id,
+            google_api_key=api_key,
+            convert_system_message_to_human=True,
+            **common,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_provider: Dict[str, int] = {}
+            for key in self._clients.keys():
+                by_provider[key[0]] = by_provider.get(key[0], 0) + 1
+            pools = dict(self._pools)
+        return {
+            "clients": sum(by_provider.values()),
+            "by_provider": by_provider,
+            "hits": self.hits,
+            "misses": self.misses,
+            "pools": {name: pool.stats() for name, pool in pools.items()},
+        }
+
+    async def aclose(self):
+        with self._lock:
+            self._clients.clear()
+            pools = list(self._pools.values())
+        for pool in pools:
+            await pool.aclose()
+
+
+llm_clients = LLMClientRegistry()
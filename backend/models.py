@@ -194,6 +194,38 @@ class LocationConnectionAnalysis(BaseModel):
         return LocationConnectionAnalysis(connections=unique_connections)
 
 
+# Schemas for the chapter analyzers' LLM output
+class ExtractedLocation(BaseModel):
+    name: str = Field(..., description="Name of the new location")
+    description: str = Field("", description="Description of the location based on the text")
+
+
+class ExtractedLocationList(BaseModel):
+    locations: List[ExtractedLocation] = Field(default_factory=list)
+
+
+class ExtractedEvent(BaseModel):
+    title: str = Field(..., description="Concise title of the new event")
+    description: str = Field("", description="Description of the event based on the text")
+
+
+class ExtractedEventList(BaseModel):
+    events: List[ExtractedEvent] = Field(default_factory=list)
+
+
+class LocationConnectionSuggestion(BaseModel):
+    location1_id: str = Field(..., description="The ID of the first location")
+    location2_id: str = Field(..., description="The ID of the second location")
+    connection_type: str = Field(..., description="Type of connection between locations")
+    description: str = Field(..., description="How the locations are connected")
+    travel_route: Optional[str] = Field(None, description="Travel route, if applicable")
+    cultural_exchange: Optional[str] = Field(None, description="Cultural exchange, if applicable")
+
+
+class LocationConnectionSuggestionList(BaseModel):
+    connections: List[LocationConnectionSuggestion] = Field(default_factory=list)
+
+
 class LocationAnalysis(BaseModel):
     name: str = Field(..., description="Name of the location")
     significance_analysis: str = Field(
@@ -312,6 +344,10 @@ class ModelSettings(BaseModel):
     extractionLLM: str
     knowledgeBaseQueryLLM: str
     temperature: float
+    embeddingDimensions: Optional[int] = None  # e.g. 768; None keeps the model's full size
+    # Rescore reduced-dimension hits with a stored full vector. Off by default: embedded
+    # Qdrant keeps that vector in RAM too, so it costs more memory than the reduction saves.
+    denseRescoring: bool = False
 
 
 class ApiKeyUpdate(BaseModel):
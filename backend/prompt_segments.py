@@ -0,0 +1,107 @@
+# backend/prompt_segments.py
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from llm_clients import route_model
+
+# Segment tiers, most stable first. Provider prompt caches (Anthropic cache_control, OpenAI
+# automatic prefix caching, Gemini implicit caching) only reuse an exact prefix, so segments
+# are laid out in tier order and per-call fields come last. OpenRouter forwards to the
+# underlying provider's cache, so Anthropic models there also need cache_control blocks.
+TIER_STATIC = 0  # Fixed instructions, identical for every call
+TIER_PROJECT = 1  # Changes only when the project itself changes
+TIER_BATCH = 2  # Fixed for one generation request (plot, style) and shared by its chapters
+TIER_CALL = 3  # Changes with every call
+
+ANTHROPIC_MAX_BREAKPOINTS = 4
+
+
+def prompt_cache_provider(model_name: str) -> str:
+    """
+    "anthropic" for models that only cache at explicit cache_control blocks (Anthropic,
+    directly or through OpenRouter), otherwise "other".
+    """
+    provider, model_id = route_model(model_name or "")
+    if provider == "anthropic" or (
+        provider == "openrouter" and model_id.startswith("anthropic/")
+    ):
+        return "anthropic"
+    return "other"
+
+
+class PromptSegment:
+    def __init__(self, name: str, text: str, tier: int, cache_breakpoint: bool = False):
+        self.name = name
+        self.text = text
+        self.tier = tier
+        self.cache_breakpoint = cache_breakpoint
+
+
+class SegmentedPrompt:
+    """
+    A system prompt built from named segments ordered from most to least stable, plus
+    the per-call request sent as the human message.
+
+    A cache breakpoint marks the end of a prefix worth caching on its own (e.g. the fixed
+    rules, or everything that is shared by the chapters of one request). Anthropic models
+    (see prompt_cache_provider) get it as cache_control on that content block; other
+    providers cache prefixes automatically and receive the system prompt as plain text.
+    """
+
+    def __init__(self):
+        self.segments: List[PromptSegment] = []
+
+    def add(
+        self, name: str, text: str, tier: int, cache_breakpoint: bool = False
+    ) -> "SegmentedPrompt":
+        """Appends a segment; empty text is skipped. Tiers must not decrease."""
+        if self.segments and tier < self.segments[-1].tier:
+            raise ValueError(
+                f"Prompt segment '{name}' (tier {tier}) follows less stable segment "
+                f"'{self.segments[-1].name}' (tier {self.segments[-1].tier})"
+            )
+        if text and text.strip():
+            self.segments.append(PromptSegment(name, text.strip(), tier, cache_breakpoint))
+        return self
+
+    def split(self, max_tier: int) -> Tuple["SegmentedPrompt", "SegmentedPrompt"]:
+        """Splits into the segments up to and including max_tier and the rest."""
+        head, tail = SegmentedPrompt(), SegmentedPrompt()
+        for segment in self.segments:
+            (head if segment.tier <= max_tier else tail).segments.append(segment)
+        return head, tail
+
+    def text(self) -> str:
+        return "\n\n".join(s.text for s in self.segments)
+
+    def system_message(self, provider: str) -> SystemMessage:
+        if provider != "anthropic":
+            return SystemMessage(content=self.text())
+
+        # Anthropic allows a limited number of breakpoints; the later ones cover longer prefixes
+        breakpoints = [i for i, s in enumerate(self.segments) if s.cache_breakpoint]
+        breakpoints = set(breakpoints[-ANTHROPIC_MAX_BREAKPOINTS:])
+        blocks: List[Dict[str, Any]] = []
+        for i, segment in enumerate(self.segments):
+            last = i == len(self.segments) - 1
+            block: Dict[str, Any] = {
+                "type": "text",
+                "text": segment.text if last else segment.text + "\n\n",
+            }
+            if i in breakpoints:
+                block["cache_control"] = {"type": "ephemeral"}
+            blocks.append(block)
+        return SystemMessage(content=blocks)
+
+    def to_messages(self, provider: str, request: str) -> List[BaseMessage]:
+        if not self.segments:
+            return [HumanMessage(content=request)]
+        return [self.system_message(provider), HumanMessage(content=request)]
+
+    def layout(self) -> List[Dict[str, Any]]:
+        """Segment names, tiers and sizes, for logging."""
+        return [
+            {"name": s.name, "tier": s.tier, "chars": len(s.text), "breakpoint": s.cache_breakpoint}
+            for s in self.segments
+        ]
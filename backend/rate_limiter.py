@@ -0,0 +1,401 @@
+# backend/rate_limiter.py
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from token_estimator import token_estimator
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Requests and tokens per minute per (provider, API key). Conservative defaults for paid
+# tiers; override with e.g. RATE_LIMIT_GEMINI_RPM / RATE_LIMIT_GEMINI_EMBEDDINGS_TPM.
+PROVIDER_LIMITS = {
+    "gemini": {"rpm": 300, "tpm": 1_000_000},
+    "gemini-embeddings": {"rpm": 1500, "tpm": 5_000_000},
+    "openai": {"rpm": 500, "tpm": 800_000},
+    "anthropic": {"rpm": 50, "tpm": 80_000},
+    "openrouter": {"rpm": 200, "tpm": 1_000_000},
+    "default": {"rpm": 60, "tpm": 200_000},
+}
+BURST_SECONDS = 10.0  # Bucket capacity, in seconds of quota
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+BACKOFF_FACTOR = 0.5  # Multiplicative decrease of concurrency and request rate on a 429
+LATENCY_BACKOFF_FACTOR = 0.9  # Milder decrease when latency shows the provider is congested
+LATENCY_CONGESTION_RATIO = 3.0  # Latency per 1k tokens above this multiple of the running average
+LATENCY_EWMA_ALPHA = 0.1
+OUTPUT_TOKEN_LATENCY_WEIGHT = 10  # Generating a token takes roughly this many times reading one
+THROTTLE_COOLDOWN_SECONDS = 5.0  # Pause after a 429 without a Retry-After header
+MAX_WAIT_STEP_SECONDS = 1.0
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible identifier for an API key (keys themselves are never stored)."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    for candidate in (error, getattr(error, "__cause__", None)):
+        if candidate is None:
+            continue
+        status = getattr(candidate, "status_code", None) or getattr(candidate, "code", None)
+        response = getattr(candidate, "response", None)
+        if status == 429 or getattr(response, "status_code", None) == 429:
+            return True
+    text = str(error)
+    return any(
+        marker in text
+        for marker in ("429", "RESOURCE_EXHAUSTED", "Too Many Requests", "rate limit", "Rate limit")
+    )
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _message_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # Content blocks, e.g. a segmented system prompt with cache breakpoints
+    return "".join(
+        block.get("text", "") if isinstance(block, dict) else str(block) for block in content or []
+    )
+
+
+def _limits_for(provider: str) -> Tuple[float, float]:
+    defaults = PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS["default"])
+    env_name = provider.upper().replace("-", "_")
+    rpm = float(os.getenv(f"RATE_LIMIT_{env_name}_RPM", defaults["rpm"]))
+    tpm = float(os.getenv(f"RATE_LIMIT_{env_name}_TPM", defaults["tpm"]))
+    return rpm, tpm
+
+
+class ProviderRateLimiter(BaseRateLimiter):
+    """
+    Token buckets for requests and tokens per minute plus an adaptive concurrency limit,
+    for one provider and API key.
+
+    Concurrency and the request rate grow additively while calls succeed and are cut
+    multiplicatively (AIMD) on a 429, which also pauses the limiter for Retry-After.
+    Rising latency per token shrinks concurrency gently before the provider starts
+    rejecting. Token costs are debited when a call starts (estimated input) and ends
+    (output), and may run the bucket negative, so one oversized prompt delays the calls
+    after it instead of never fitting.
+
+    Works for LangChain chat models (as their rate_limiter, with callback_handler in their
+    callbacks for completion feedback) and for blocking calls via call().
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.max_rpm = rpm
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = float(INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._requests = max(1.0, rpm / 60.0 * BURST_SECONDS)
+        self._tokens = tpm / 60.0 * BURST_SECONDS
+        self._updated = time.monotonic()
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._latency_average: Optional[float] = None
+        self.callback_handler = RateLimitCallbackHandler(self)
+        self.calls = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            max(1.0, self.rpm / 60.0 * BURST_SECONDS), self._requests + elapsed * self.rpm / 60.0
+        )
+        self._tokens = min(
+            self.tpm / 60.0 * BURST_SECONDS, self._tokens + elapsed * self.tpm / 60.0
+        )
+
+    def _try_acquire(self, requests: int) -> float:
+        """Takes a slot and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._cooldown_until:
+                return self._cooldown_until - now
+            if self.in_flight >= int(self.concurrency):
+                return 0.05
+            if self._requests < 1:
+                return (1 - self._requests) * 60.0 / self.rpm
+            if self._tokens < 0:
+                return -self._tokens * 60.0 / self.tpm
+            self._requests -= requests
+            self.in_flight += 1
+            self.calls += 1
+            return 0.0
+
+    def acquire(self, *, blocking: bool = True, requests: int = 1) -> bool:
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(requests)
+            if wait <= 0:
+                self._acquired(started)
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(wait, MAX_WAIT_STEP_SECONDS))
+
+    async def aacquire(self, *, blocking: bool = True, requests: int = 1) -> bool:
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(requests)
+            if wait <= 0:
+                self._acquired(started)
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(min(wait, MAX_WAIT_STEP_SECONDS))
+
+    def _acquired(self, started: float):
+        self.waited_seconds += time.monotonic() - started
+
+    def has_capacity(self) -> bool:
+        """Whether a call starting now would get a slot without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return (
+                now >= self._cooldown_until
+                and self.in_flight < int(self.concurrency)
+                and self._requests >= 1
+                and self._tokens >= 0
+            )
+
+    def debit_tokens(self, tokens: int):
+        if tokens <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+
+    def release(
+        self,
+        tokens: int = 0,
+        error: Optional[BaseException] = None,
+        started_at: Optional[float] = None,
+    ):
+        """
+        Frees a slot and adapts the limits to how the call went. tokens is the call's size
+        for latency normalization (output tokens weighted by OUTPUT_TOKEN_LATENCY_WEIGHT);
+        started_at is when the call got its slot, or None to leave latency out.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.in_flight = max(0, self.in_flight - 1)
+            if error is not None:
+                if is_rate_limit_error(error):
+                    self.throttled += 1
+                    self._decrease(now, BACKOFF_FACTOR)
+                    self._cooldown_until = max(
+                        self._cooldown_until,
+                        now + (_retry_after(error) or THROTTLE_COOLDOWN_SECONDS),
+                    )
+                return
+            if started_at is not None:
+                per_k_tokens = (now - started_at) / max(1.0, tokens / 1000.0)
+                average = self._latency_average
+                self._latency_average = (
+                    per_k_tokens
+                    if average is None
+                    else average + LATENCY_EWMA_ALPHA * (per_k_tokens - average)
+                )
+                if average is not None and per_k_tokens > average * LATENCY_CONGESTION_RATIO:
+                    self._decrease(now, LATENCY_BACKOFF_FACTOR)
+                    return
+            self.concurrency = min(MAX_CONCURRENCY, self.concurrency + 1.0 / self.concurrency)
+            self.rpm = min(self.max_rpm, self.rpm + self.max_rpm / 100.0)
+
+    def _decrease(self, now: float, factor: float):
+        # Calls that were already in flight fail together; count them as one signal
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.concurrency = max(1.0, self.concurrency * factor)
+        if factor == BACKOFF_FACTOR:
+            self.rpm = max(1.0, self.rpm * factor)
+            logger.warning(
+                f"Rate limited by {self.name}; concurrency -> {int(self.concurrency)}, "
+                f"rate -> {self.rpm:.0f} rpm"
+            )
+
+    def record_cache_usage(self, input_tokens: int, cache_read: int, cache_creation: int):
+        """Adds one call's reported prompt tokens and how many were read from or written to a prompt cache."""
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.cache_read_tokens += cache_read
+            self.cache_creation_tokens += cache_creation
+
+    def call(self, fn: Callable[..., T], *args: Any, tokens: int = 0, requests: int = 1) -> T:
+        """Runs a blocking provider call (e.g. an embeddings batch) under the limiter."""
+        self.acquire(requests=requests)
+        started_at = time.monotonic()
+        self.debit_tokens(tokens)
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.release(tokens, e)
+            raise
+        self.release(tokens, started_at=started_at)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": int(self.concurrency),
+            "in_flight": self.in_flight,
+            "rpm": round(self.rpm),
+            "max_rpm": self.max_rpm,
+            "tpm": self.tpm,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 1),
+            "cooling_down": time.monotonic() < self._cooldown_until,
+            "input_tokens": self.input_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_creation_tokens": self.cache_creation_tokens,
+            "cache_hit_ratio": round(self.cache_read_tokens / self.input_tokens, 3)
+            if self.input_tokens
+            else None,
+        }
+
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    """
+    Reports chat model token usage (including prompt cache reads and writes), completions
+    and errors back to a ProviderRateLimiter.
+    """
+
+    def __init__(self, limiter: ProviderRateLimiter):
+        self.limiter = limiter
+        self._input_tokens: Dict[UUID, int] = {}
+        self._started_at: Dict[UUID, Optional[float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        # The model acquires its slot right after this; a call that will queue behind the
+        # limiter is left out of the latency average, so our own queueing can't look like
+        # provider congestion.
+        self._started_at[run_id] = time.monotonic() if self.limiter.has_capacity() else None
+        tokens = sum(
+            token_estimator.count(_message_text(m.content)) for batch in messages for m in batch
+        )
+        self._input_tokens[run_id] = tokens
+        self.limiter.debit_tokens(tokens)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage and usage.get("output_tokens"):
+                    output_tokens += usage["output_tokens"]
+                else:
+                    output_tokens += token_estimator.count(generation.text or "")
+                if usage and usage.get("input_tokens"):
+                    self._record_cache_usage(usage)
+        self.limiter.debit_tokens(output_tokens)
+        self.limiter.release(
+            self._input_tokens.pop(run_id, 0) + output_tokens * OUTPUT_TOKEN_LATENCY_WEIGHT,
+            started_at=self._started_at.pop(run_id, None),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started_at.pop(run_id, None)
+        self.limiter.release(self._input_tokens.pop(run_id, 0), error)
+
+    def _record_cache_usage(self, usage: Dict[str, Any]):
+        details = usage.get("input_token_details") or {}
+        cache_read = details.get("cache_read") or 0
+        cache_creation = details.get("cache_creation") or 0
+        self.limiter.record_cache_usage(usage["input_tokens"], cache_read, cache_creation)
+        logger.debug(
+            f"{self.limiter.name}: {usage['input_tokens']} prompt tokens, "
+            f"{cache_read} read from cache, {cache_creation} written to cache"
+        )
+
+
+class RateLimiterRegistry:
+    """Process-wide ProviderRateLimiters, one per (provider, API key fingerprint)."""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, api_key: Optional[str]) -> ProviderRateLimiter:
+        key = (provider, key_fingerprint(api_key))
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                rpm, tpm = _limits_for(provider)
+                limiter = ProviderRateLimiter(f"{provider}:{key[1]}", rpm, tpm)
+                self._limiters[key] = limiter
+            return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per provider; limiters are per API key, so they aren't listed individually."""
+        with self._lock:
+            limiters = list(self._limiters.items())
+        totals: Dict[str, Dict[str, Any]] = {}
+        for (provider, _), limiter in limiters:
+            stats = limiter.stats()
+            provider_totals = totals.setdefault(
+                provider,
+                {
+                    "limiters": 0,
+                    "in_flight": 0,
+                    "calls": 0,
+                    "throttled": 0,
+                    "waited_seconds": 0.0,
+                    "cooling_down": 0,
+                    "input_tokens": 0,
+                    "cache_read_tokens": 0,
+                    "cache_creation_tokens": 0,
+                },
+            )
+            provider_totals["limiters"] += 1
+            provider_totals["cooling_down"] += int(stats["cooling_down"])
+            for field in (
+                "in_flight",
+                "calls",
+                "throttled",
+                "waited_seconds",
+                "input_tokens",
+                "cache_read_tokens",
+                "cache_creation_tokens",
+            ):
+                provider_totals[field] += stats[field]
+        for provider_totals in totals.values():
+            provider_totals["waited_seconds"] = round(provider_totals["waited_seconds"], 1)
+            input_tokens = provider_totals["input_tokens"]
+            provider_totals["cache_hit_ratio"] = (
+                round(provider_totals["cache_read_tokens"] / input_tokens, 3)
+                if input_tokens
+                else None
+            )
+        return totals
+
+
+rate_limits = RateLimiterRegistry()
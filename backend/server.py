@@ -26,7 +26,7 @@ from fastapi import (
     status,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import httpx  # Add httpx for async requests
 # Removed jose and JWT related imports
 from fastapi.routing import APIRouter
@@ -39,7 +39,15 @@ from cachetools import TTLCache  # For caching JWKS
 from agent_manager import AgentManager, PROCESS_TYPES, ChapterGenerationState
 from api_key_manager import ApiKeyManager, SecurityManager
 from database import db_instance
-from vector_store import VectorStore
+from vector_store import qdrant_registry, VectorStore, SNAPSHOT_DIR
+from embedding_cache import embedding_cache, query_embedding_cache
+from kb_write_queue import kb_write_queue
+from token_estimator import token_estimator
+from rate_limiter import rate_limits
+from llm_clients import llm_clients, route_model
+from gemini_cache import gemini_caches
+from structured_output import structured_output
+from generation_events import generation_events, format_sse
 
 # Models likely needed by server endpoints too
 from models import (
@@ -236,6 +244,9 @@ class AgentManagerStore:
         self.idle_timeout = 900  # Close managers idle for 15 minutes (15 * 60)
         self._cleanup_task = None
         self._shutdown_event = Event()  # Event to signal shutdown for cleanup task
+        self.reconcile_interval = 1800  # Reconcile open projects' vector stores every 30 minutes
+        self._reconcile_task = None
+        self._reconcile_reports: Dict[str, Dict[str, Any]] = {}
         # --- Add state for tracking running generations ---
         self._generating_projects: Set[str] = set()
         self._generating_projects_lock = Lock()
@@ -380,6 +391,72 @@ class AgentManagerStore:
 
         logger.info("AgentManager cleanup task finished.")
 
+    async def start_reconcile_task(self):
+        """Starts the background task that repairs drift between the DB and vector stores."""
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._run_reconcile())
+            logger.info("Vector store reconcile task started.")
+
+    async def stop_reconcile_task(self):
+        self._shutdown_event.set()
+        if self._reconcile_task and not self._reconcile_task.done():
+            self._reconcile_task.cancel()
+            try:
+                await self._reconcile_task
+            except asyncio.CancelledError:
+                logger.info("Reconcile task cancelled successfully.")
+            except Exception as e:
+                logger.error(f"Error during reconcile task shutdown: {e}", exc_info=True)
+        self._reconcile_task = None
+
+    async def _run_reconcile(self):
+        """Periodically reconciles the vector store of every open, idle-from-generation project."""
+        while not self._shutdown_event.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._shutdown_event.wait(), timeout=self.reconcile_interval
+                )
+                if self._shutdown_event.is_set():
+                    break
+            except asyncio.TimeoutError:
+                pass
+
+            async with self._lock:
+                manager_items = list(self._managers.items())
+            for key, manager in manager_items:
+                if self._shutdown_event.is_set():
+                    break
+                if (
+                    manager.vector_store is None
+                    or manager.indexing
+                    or await self.is_project_generating(manager.project_id)
+                ):
+                    continue
+                try:
+                    self._reconcile_reports[key] = await manager.reconcile_vector_store()
+                except Exception as e:
+                    logger.error(f"Error reconciling vector store for {key}: {e}", exc_info=True)
+
+        logger.info("Vector store reconcile task finished.")
+
+    def reconcile_report(self, user_id: Optional[str] = None, project_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Latest reconcile report for one project, or the number of reconciled projects
+        plus drift totals (across one user's projects when only user_id is given).
+        """
+        if user_id and project_id:
+            return self._reconcile_reports.get(f"{user_id}_{project_id}", {})
+        reports = [
+            report
+            for key, report in self._reconcile_reports.items()
+            if not user_id or key.startswith(f"{user_id}_")
+        ]
+        totals = {"missing": 0, "stale": 0, "orphans": 0, "duplicates": 0, "repaired": 0}
+        for report in reports:
+            for field in totals:
+                totals[field] += report.get(field, 0)
+        return {"projects": len(reports), "totals": totals}
+
     @asynccontextmanager
     async def get_or_create_manager(
         self, user_id: str, project_id: str
@@ -575,6 +652,7 @@ async def lifespan(app: FastAPI):
 
         # Start AgentManager cleanup task
         await agent_manager_store.start_cleanup_task()
+        await agent_manager_store.start_reconcile_task()
 
         yield
 
@@ -586,6 +664,8 @@ async def lifespan(app: FastAPI):
         logger.info("Shutting down server...")
 
         # Stop AgentManager cleanup and close managers
+        await agent_manager_store.stop_reconcile_task()
+        await kb_write_queue.flush_all()
         await agent_manager_store.stop_cleanup_task()
 
         # Close all agent managers to properly close vector stores
@@ -604,6 +684,21 @@ async def lifespan(app: FastAPI):
                 except Exception as e:
                     logger.error(f"Error closing agent manager for key {key}: {str(e)}")
 
+        # Close the shared embedded Qdrant client and the embedding cache
+        try:
+            qdrant_registry.close()
+            embedding_cache.close()
+            logger.info("Qdrant client and embedding cache closed")
+        except Exception as e:
+            logger.error(f"Error closing Qdrant client: {str(e)}")
+
+        # Close the shared LLM HTTP connection pools
+        try:
+            await llm_clients.aclose()
+            logger.info("LLM client connection pools closed")
+        except Exception as e:
+            logger.error(f"Error closing LLM client pools: {str(e)}")
+
         # Close database connection
         try:
             await db_instance.dispose()
@@ -1201,10 +1296,14 @@ async def run_chapter_generation_background(
     api_key_manager: ApiKeyManager,  # Pass ApiKeyManager
 ):
     """The actual chapter generation logic, designed to run in the background."""
+    generated_chapters_details = []  # Store details of generated chapters
+
+    async def publish_event(event: str, data: Dict[str, Any]):
+        generation_events.publish(project_id, event, data)
+
     try:
         logger.info(f"Background task started for user {user_id}, project {project_id}")
         chapter_count = await db_instance.get_chapter_count(project_id, user_id)
-        generated_chapters_details = []  # Store details of generated chapters
         plot_segments = None
         full_plot = gen_request.plot  # Keep original plot
         # Track previous chapters to maintain narrative continuity
@@ -1232,46 +1331,17 @@ async def run_chapter_generation_background(
                 )
                 temperature = float(model_settings.get("temperature", 0.7))
 
-                # 2. Instantiate the LLM (Simplified _get_llm logic here)
-                segmentation_llm: BaseChatModel
-                if segmentation_model_name.startswith("openrouter/"):
-                    if not seg_openrouter_key:
-                        raise ValueError(
-                            "OpenRouter key needed for segmentation model but not found."
-                        )
-                    openrouter_model_id = segmentation_model_name.split(
-                        "openrouter/", 1
-                    )[1]
-                    from langchain_openai import ChatOpenAI  # Local import
-
-                    segmentation_llm = ChatOpenAI(
-                        model=openrouter_model_id,
-                        openai_api_key=seg_openrouter_key,
-                        openai_api_base="https://openrouter.ai/api/v1",
-                        temperature=temperature,
-                        default_headers={  # Add required OpenRouter headers
-                            "HTTP-Referer": os.getenv(
-                                "SCROLLWISE_SITE_URL", "https://github.com/LotusSerene/scrollwise-ai"
-                            ),
-                            "X-Title": os.getenv(
-                                "SCROLLWISE_SITE_NAME", "ScrollWise AI"
-                            ),
-                        },
-                    )
-                else:
-                    if not seg_api_key:
-                        raise ValueError(
-                            "Gemini key needed for segmentation model but not found."
-                        )
-                    from langchain_google_genai import (
-                        ChatGoogleGenerativeAI,
-                    )  # Local import
-
-                    segmentation_llm = ChatGoogleGenerativeAI(
-                        model=segmentation_model_name,
-                        google_api_key=seg_api_key,
-                        temperature=temperature,
+                # 2. Get the shared LLM client for the segmentation model
+                segmentation_provider, _ = route_model(segmentation_model_name)
+                if segmentation_provider not in ("openrouter", "gemini"):
+                    raise ValueError(
+                        f"Segmentation supports Gemini and OpenRouter models, not {segmentation_model_name}."
                     )
+                segmentation_llm: BaseChatModel = llm_clients.get(
+                    segmentation_model_name,
+                    seg_openrouter_key if segmentation_provider == "openrouter" else seg_api_key,
+                    temperature,
+                )
 
                 # 3. Define Segmentation Prompt
                 segmentation_prompt = ChatPromptTemplate.from_template(
@@ -1343,15 +1413,18 @@ async def run_chapter_generation_background(
             user_id, project_id
         ) as agent_manager:
             for i in range(gen_request.numChapters):
-                # Rate Limiting Mitigation: Add a small delay between chapters to avoid Gemini errors
-                if i > 0:
-                    logger.info(f"Rate limiting delay: Waiting 2 seconds before generating next chapter...")
-                    await asyncio.sleep(2)
-
                 chapter_number = chapter_count + i + 1
                 logger.info(
                     f"Background task: Initiating generation for Chapter {chapter_number}..."
                 )
+                await publish_event(
+                    "chapter_started",
+                    {
+                        "chapter_number": chapter_number,
+                        "index": i + 1,
+                        "total": gen_request.numChapters,
+                    },
+                )
 
                 # Determine the plot to use for this specific chapter
                 current_plot_segment = None
@@ -1408,6 +1481,7 @@ async def run_chapter_generation_background(
                     plot=full_plot,  # Main plot context
                     writing_style=gen_request.writingStyle,
                     instructions=current_instructions,  # Contains segment, full plot, total etc.
+                    on_event=publish_event,  # Streams tokens and node progress to SSE clients
                 )
 
                 # Check for errors returned by the graph
@@ -1424,6 +1498,7 @@ async def run_chapter_generation_background(
                             "error": result["error"],
                         }
                     )
+                    await publish_event("chapter_failed", generated_chapters_details[-1])
                     continue  # Skip saving/indexing for this chapter
 
                 # --- Process Successful Generation ---
@@ -1443,6 +1518,7 @@ async def run_chapter_generation_background(
                             "error": "Missing content or title in generation result.",
                         }
                     )
+                    await publish_event("chapter_failed", generated_chapters_details[-1])
                     continue
 
                 # Add this chapter to the list of previous chapters for context in future chapters
@@ -1596,6 +1672,7 @@ async def run_chapter_generation_background(
                         ),
                     }
                 )
+                await publish_event("chapter_saved", generated_chapters_details[-1])
                 logger.info(
                     f"Background task: Successfully processed generated Chapter {actual_chapter_number}."
                 )
@@ -1610,7 +1687,9 @@ async def run_chapter_generation_background(
             exc_info=True,
         )
         # Handle error reporting (e.g., update DB status, log)
+        await publish_event("error", {"error": str(e)})
     finally:
+        generation_events.finish(project_id, {"chapters": generated_chapters_details})
         # --- Ensure project status is cleared ---
         logger.info(
             f"Background task finalizing for project {project_id}. Clearing generation status."
@@ -1665,6 +1744,7 @@ async def generate_chapters(
 
         # --- Start Background Task ---
         try:
+            generation_events.start(project_id)  # Subscribers can connect as soon as we return
             asyncio.create_task(
                 run_chapter_generation_background(
                     user_id=user_id,
@@ -1683,6 +1763,7 @@ async def generate_chapters(
                 f"Failed to start background task for project {project_id}: {task_start_error}",
                 exc_info=True,
             )
+            generation_events.finish(project_id, {"error": "Failed to start generation task."})
             await agent_manager_store_di.finish_project_generation(project_id)
             raise HTTPException(
                 status_code=500, detail="Failed to start generation task."
@@ -1864,11 +1945,11 @@ async def update_chapter(
                 async with agent_manager_store_di.get_or_create_manager(
                     user_id, project_id
                 ) as agent_manager:
-                    await agent_manager.update_or_remove_from_knowledge_base(
+                    # Re-embedded by the write-behind queue, so autosaves don't each hit the embedder
+                    agent_manager.queue_knowledge_base_update(
                         existing_embedding_id,
-                        "update",
-                        new_content=chapter_update.content,
-                        new_metadata={
+                        chapter_update.content,
+                        {
                             "title": chapter_update.title,
                             "structure_item_id": chapter_update.structure_item_id,
                         },
@@ -1877,8 +1958,6 @@ async def update_chapter(
                 kb_error = f"Failed to update chapter in knowledge base: {kb_e}"
                 logger.error(kb_error, exc_info=True)
 
-        # Invalidate agent manager if chapter update might change context
-        await agent_manager_store_di.invalidate_project_managers(project_id)
         return JSONResponse(status_code=200, content=updated_chapter)
     except Exception as e:
         logger.error(f"Error updating chapter {chapter_id}: {str(e)}", exc_info=True)
@@ -2489,11 +2568,10 @@ async def update_codex_item(
                         "type": updated_codex_item_db.get("type"),
                         "subtype": updated_codex_item_db.get("subtype"),
                     }
-                    await agent_manager.update_or_remove_from_knowledge_base(
+                    agent_manager.queue_knowledge_base_update(
                         existing_embedding_id,  # Use the embedding_id for lookup in VS
-                        "update",
-                        new_content=content_for_kb_update,
-                        new_metadata=metadata_for_kb,
+                        content_for_kb_update,
+                        metadata_for_kb,
                     )
             except Exception as kb_e:
                 kb_error = f"Failed to update codex item in knowledge base: {kb_e}"
@@ -4138,42 +4216,16 @@ async def delete_project(
 
         # 2. Delete the associated vector store collection
         try:
-            # Need API key and embedding model to instantiate VectorStore
-            api_key = await api_key_manager.get_api_key(user_id)
-            model_settings = await db_instance.get_model_settings(user_id)
-            # Provide default if settings are missing
-            embedding_model = model_settings.get(
-                "embeddingsModel", "models/gemini-embedding-001"
+            # Close any cached manager first so it doesn't keep a handle on the collection
+            await agent_manager_store.invalidate_project_managers(project_id)
+            collection_name = qdrant_registry.collection_name_for(user_id, project_id)
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: qdrant_registry.drop_collection(collection_name)
+            )
+            vs_deleted = True
+            logger.info(
+                f"Successfully deleted vector store collection for project {project_id}."
             )
-
-            if not api_key:
-                logger.error(
-                    f"Cannot delete vector store for project {project_id}: API key not found for user {user_id}."
-                )
-                error_message = (
-                    " (Warning: Vector store cleanup failed - API key missing)"
-                )
-            elif not embedding_model:
-                logger.error(
-                    f"Cannot delete vector store for project {project_id}: Embedding model not found for user {user_id}."
-                )
-                error_message = (
-                    " (Warning: Vector store cleanup failed - Embedding model missing)"
-                )
-            else:
-                vector_store = VectorStore(
-                    user_id, project_id, api_key, embedding_model
-                )
-                vs_deleted = await vector_store.delete_collection()
-                if vs_deleted:
-                    logger.info(
-                        f"Successfully deleted vector store collection for project {project_id}."
-                    )
-                else:
-                    logger.warning(
-                        f"Failed to delete vector store collection for project {project_id}."
-                    )
-                    error_message = " (Warning: Vector store cleanup failed)"
         except Exception as vs_error:
             logger.error(
                 f"Error during vector store deletion for project {project_id}: {str(vs_error)}",
@@ -4181,7 +4233,27 @@ async def delete_project(
             )
             error_message = f" (Warning: Vector store cleanup error: {str(vs_error)})"
 
-        return {"message": f"Project deleted successfully{error_message}"}
+        # 3. Delete the project's vector snapshots, which hold its full chapter and codex text
+        try:
+            removed = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: _delete_project_snapshots(
+                    qdrant_registry.collection_name_for(user_id, project_id)
+                ),
+            )
+            if removed:
+                logger.info(f"Deleted {removed} vector snapshots of project {project_id}.")
+        except Exception as snapshot_error:
+            logger.error(
+                f"Error deleting vector snapshots for project {project_id}: {snapshot_error}",
+                exc_info=True,
+            )
+            error_message += f" (Warning: Snapshot cleanup error: {snapshot_error})"
+
+        return {
+            "message": f"Project deleted successfully{error_message}",
+            "vector_store_deleted": vs_deleted,
+        }
 
     except HTTPException as http_exc:  # Re-raise HTTP exceptions (like 404)
         raise http_exc
@@ -4275,6 +4347,278 @@ async def get_generation_status(
     )
 
 
+@project_router.get("/{project_id}/generation-events")
+async def stream_generation_events(
+    project_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+):
+    """
+    Server-Sent Events stream of the project's current (or just finished) chapter generation:
+    chapter_started, token, node, chapter_saved, chapter_failed, error and a final done.
+    Reconnecting clients send Last-Event-ID and receive only the events they missed; a
+    reset event comes first when some of those are no longer in the history.
+    """
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+
+    queue = generation_events.subscribe(project_id, last_event_id)
+
+    async def event_stream():
+        if queue is None:
+            yield format_sse({"id": 0, "event": "done", "data": {"chapters": []}})
+            return
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"  # Keeps proxies from closing an idle stream
+                    continue
+                if message is None:
+                    break
+                yield format_sse(message)
+        finally:
+            generation_events.unsubscribe(project_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@project_router.get("/{project_id}/vector-index/status")
+async def get_vector_index_status(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+    agent_manager_store_di: AgentManagerStore = Depends(
+        get_agent_manager_store_dependency
+    ),
+):
+    """
+    Reports progress of the project's vector reindex and its latest DB/index drift
+    report (each empty when none has run since startup).
+    """
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    return {
+        "collection": qdrant_registry.resolve(logical_name),
+        "reindex": qdrant_registry.reindex_status(logical_name),
+        "reconcile": agent_manager_store_di.reconcile_report(user_id, project_id),
+    }
+
+
+def _snapshot_path(logical_name: str, snapshot_name: str) -> str:
+    """Resolves a snapshot file name, only allowing snapshots of the given collection."""
+    if (
+        os.path.basename(snapshot_name) != snapshot_name
+        or not snapshot_name.startswith(f"{logical_name}_")
+        or not snapshot_name.endswith(".snapshot.gz")
+    ):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    path = os.path.join(SNAPSHOT_DIR, snapshot_name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return path
+
+
+def _delete_project_snapshots(logical_name: str) -> int:
+    """Removes every snapshot file of a collection. Returns how many were deleted."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.startswith(f"{logical_name}_") and name.endswith(".snapshot.gz"):
+            os.remove(os.path.join(SNAPSHOT_DIR, name))
+            removed += 1
+    return removed
+
+
+def _new_snapshot_path(logical_name: str) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(SNAPSHOT_DIR, f"{logical_name}_{stamp}.snapshot.gz")
+
+
+@project_router.post("/{project_id}/vector-index/snapshots")
+async def create_vector_snapshot(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+    agent_manager_store_di: AgentManagerStore = Depends(
+        get_agent_manager_store_dependency
+    ),
+):
+    """Saves the project's vectors and payloads to a snapshot file for later restore or cloning."""
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    try:
+        async with agent_manager_store_di.get_or_create_manager(
+            user_id, project_id
+        ) as agent_manager:
+            info = await agent_manager.vector_store.export_snapshot(
+                _new_snapshot_path(logical_name)
+            )
+        info["name"] = os.path.basename(info.pop("path"))
+        return info
+    except Exception as e:
+        logger.error(f"Error creating vector snapshot for project {project_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error creating snapshot: {e}")
+
+
+@project_router.get("/{project_id}/vector-index/snapshots")
+async def list_vector_snapshots(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+):
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(SNAPSHOT_DIR), reverse=True):
+        if not (name.startswith(f"{logical_name}_") and name.endswith(".snapshot.gz")):
+            continue
+        path = os.path.join(SNAPSHOT_DIR, name)
+        try:
+            header = VectorStore.read_snapshot_header(path)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable snapshot {name}: {e}")
+            continue
+        snapshots.append({**header, "name": name, "bytes": os.path.getsize(path)})
+    return snapshots
+
+
+@project_router.post("/{project_id}/vector-index/snapshots/{snapshot_name}/restore")
+async def restore_vector_snapshot(
+    project_id: str,
+    snapshot_name: str,
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+    agent_manager_store_di: AgentManagerStore = Depends(
+        get_agent_manager_store_dependency
+    ),
+):
+    """
+    Restores the project's vector index from one of its snapshots without re-embedding,
+    then reconciles it so rows changed since the snapshot are brought up to date.
+    """
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+    if await agent_manager_store_di.is_project_generating(project_id):
+        raise HTTPException(status_code=409, detail="Project is currently generating")
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    path = _snapshot_path(logical_name, snapshot_name)
+    try:
+        async with agent_manager_store_di.get_or_create_manager(
+            user_id, project_id
+        ) as agent_manager:
+            await agent_manager.stop_indexing()
+            restore = await agent_manager.vector_store.import_snapshot(path)
+            reconcile = await agent_manager.reconcile_vector_store()
+        return {"restore": restore, "reconcile": reconcile}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error restoring vector snapshot for project {project_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error restoring snapshot: {e}")
+
+
+@project_router.delete("/{project_id}/vector-index/snapshots/{snapshot_name}")
+async def delete_vector_snapshot(
+    project_id: str,
+    snapshot_name: str,
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+):
+    user_id = current_user["id"]
+    project = await db_instance.get_project(project_id, user_id)
+    if not project:
+        raise HTTPException(
+            status_code=404, detail="Project not found or not authorized"
+        )
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    os.remove(_snapshot_path(logical_name, snapshot_name))
+    return {"message": "Snapshot deleted"}
+
+
+@project_router.post("/{project_id}/vector-index/clone")
+async def clone_vector_index(
+    project_id: str,
+    target_project_id: str = Body(..., embed=True),
+    id_map: Optional[Dict[str, str]] = Body(None, embed=True),
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+    agent_manager_store_di: AgentManagerStore = Depends(
+        get_agent_manager_store_dependency
+    ),
+):
+    """
+    Copies this project's vector index into another of the user's projects through a
+    snapshot file, so the target needs no re-embedding. id_map maps source row IDs to
+    the target project's row IDs; anything left unmatched is fixed by the reconcile
+    pass that runs on the target afterwards.
+    """
+    user_id = current_user["id"]
+    if target_project_id == project_id:
+        raise HTTPException(status_code=400, detail="Target project must differ from the source")
+    for pid in (project_id, target_project_id):
+        if not await db_instance.get_project(pid, user_id):
+            raise HTTPException(
+                status_code=404, detail="Project not found or not authorized"
+            )
+    if await agent_manager_store_di.is_project_generating(target_project_id):
+        raise HTTPException(status_code=409, detail="Target project is currently generating")
+    logical_name = qdrant_registry.collection_name_for(user_id, project_id)
+    snapshot_path = _new_snapshot_path(logical_name)
+    try:
+        async with agent_manager_store_di.get_or_create_manager(
+            user_id, project_id
+        ) as source_manager:
+            await source_manager.vector_store.export_snapshot(snapshot_path)
+        async with agent_manager_store_di.get_or_create_manager(
+            user_id, target_project_id
+        ) as target_manager:
+            await target_manager.stop_indexing()
+            restore = await target_manager.vector_store.import_snapshot(snapshot_path, id_map)
+            # Rows the id_map didn't cover must be searchable now, not after the periodic pass
+            reconcile = await target_manager.reconcile_vector_store(max_repairs=None)
+        return {"restore": restore, "reconcile": reconcile}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(
+            f"Error cloning vector index of {project_id} into {target_project_id}: {e}",
+            exc_info=True,
+        )
+        raise HTTPException(status_code=500, detail=f"Error cloning vector index: {e}")
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
 @project_router.get("/{project_id}/generation-history")
 async def get_generation_history(
     project_id: str,
@@ -4564,6 +4908,43 @@ async def health_check():
         )
 
 
+@app.get("/health/retrieval")
+async def retrieval_health(
+    current_user: Dict[str, Any] = Depends(get_current_active_user),
+):
+    """
+    Reports vector store and embedding cache statistics. Per-collection and per-project
+    sections only cover the caller's own projects; the rest are process-wide counters.
+    """
+    user_id = current_user["id"]
+    prefix = qdrant_registry.collection_name_for(user_id, "")
+    memory_report = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: qdrant_registry.memory_report(prefix)
+    )
+    return {
+        "qdrant_open_collections": {
+            name: handles
+            for name, handles in qdrant_registry.open_collections().items()
+            if name.startswith(prefix)
+        },
+        "vector_memory": memory_report,
+        "reindex": {
+            name: progress
+            for name, progress in qdrant_registry.reindex_status().items()
+            if name.startswith(prefix)
+        },
+        "reconciler": agent_manager_store.reconcile_report(user_id),
+        "kb_write_queue": kb_write_queue.stats(),
+        "token_estimator": token_estimator.stats(),
+        "rate_limits": rate_limits.stats(),
+        "llm_clients": llm_clients.stats(),
+        "gemini_caches": gemini_caches.stats(),
+        "structured_output": structured_output.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+    }
+
+
 # Removed /shutdown endpoint and graceful_shutdown function
 # Removed signal handlers (Uvicorn/platform handles signals)
 
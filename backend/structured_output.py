@@ -0,0 +1,309 @@
+# backend/structured_output.py
+import json
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type, TypeVar
+
+from langchain_classic.output_parsers import OutputFixingParser
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+
+from rate_limiter import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+REPAIR_TRUNCATION_ATTEMPTS = 3  # Trailing elements dropped, one at a time, from cut-off output
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# Words in a 400 error that point at the structured output request itself
+_UNSUPPORTED_MARKERS = (
+    "schema",
+    "tool",
+    "function",
+    "response_format",
+    "response_mime_type",
+    "json mode",
+)
+
+
+class StructuredOutputError(ValueError):
+    """The model's output could not be turned into the requested schema."""
+
+
+def _normalize_json(text: str) -> Tuple[str, List[str]]:
+    """
+    Rewrites near-JSON into JSON: single-quoted strings, raw newlines in strings,
+    trailing commas and Python literals are fixed, and text after the top-level value is
+    dropped. Returns the result and the brackets still open when the text ended.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if quote:
+            if c == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                out.append("'" if quote == "'" and nxt == "'" else c + nxt)
+                i += 2
+                continue
+            if c == quote:
+                out.append('"')
+                quote = None
+            elif c == '"':
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            elif c == "\t":
+                out.append("\\t")
+            elif c != "\r":
+                out.append(c)
+            i += 1
+            continue
+        if c in "\"'":
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(c)
+            if not stack:
+                break
+        elif c.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(c)
+        i += 1
+    if quote:
+        out.append('"')
+    return "".join(out), stack
+
+
+def _strip_trailing_comma(out: List[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _close(text: str, stack: List[str]) -> str:
+    out = list(text)
+    _strip_trailing_comma(out)
+    if out and out[-1] == ":":
+        out.append("null")
+    return "".join(out) + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parses JSON from LLM output, tolerating code fences, surrounding prose, single
+    quotes, trailing commas, Python literals and output cut off mid-value (the
+    incomplete tail is dropped). Raises StructuredOutputError if nothing parses.
+    """
+    if not text or not text.strip():
+        raise StructuredOutputError("Empty model output")
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    starts = [p for p in (text.find("{"), text.find("[")) if p >= 0]
+    if not starts:
+        raise StructuredOutputError("No JSON object or array in model output")
+    candidate = text[min(starts):]
+
+    for _ in range(REPAIR_TRUNCATION_ATTEMPTS + 1):
+        normalized, stack = _normalize_json(candidate)
+        try:
+            return json.loads(_close(normalized, stack))
+        except ValueError:
+            if not stack:
+                break
+            # Cut-off output: drop the last, incomplete element and try again
+            cut = candidate.rfind(",")
+            if cut <= 0:
+                break
+            candidate = candidate[:cut]
+    raise StructuredOutputError("Model output is not repairable JSON")
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    if status is None and isinstance(getattr(error, "code", None), int):
+        status = error.code
+    return status
+
+
+def is_unsupported_error(error: BaseException) -> bool:
+    """
+    Whether a native structured output call failed because the model or provider can't
+    do it for this schema (as opposed to a transient or account problem).
+    """
+    if isinstance(error, NotImplementedError):
+        return True
+    for candidate in (error, getattr(error, "__cause__", None)):
+        if candidate is None or _status_code(candidate) != 400:
+            continue
+        text = str(candidate).lower()
+        if any(marker in text for marker in _UNSUPPORTED_MARKERS):
+            return True
+    return False
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part) for part in content
+        )
+    return content if isinstance(content, str) else str(content or "")
+
+
+class StructuredOutputRunner:
+    """
+    Gets a Pydantic object from a chat model with as few LLM calls as possible.
+
+    The model is asked through its provider's native structured output mode
+    (with_structured_output: JSON schema or tool calling). If that yields nothing
+    valid, the raw reply is repaired locally (repair_json) and validated. Only if that
+    also fails is OutputFixingParser used, which costs another LLM call. Models that
+    reject a schema in native mode are remembered and asked for plain JSON instead.
+    Counts per task show how often each path is taken.
+    """
+
+    def __init__(self):
+        self._unsupported: Set[Tuple[str, str, str]] = set()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, task: str, outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(task, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    @staticmethod
+    def _native_key(llm: BaseChatModel, schema: Type[BaseModel]) -> Tuple[str, str, str]:
+        model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+        return type(llm).__name__, str(model), schema.__name__
+
+    @staticmethod
+    def _native_kwargs(llm: BaseChatModel) -> Dict[str, Any]:
+        # Strict JSON schema mode rejects free-form dicts (e.g. ChapterValidation.criteria_scores)
+        # and isn't offered by every OpenRouter model; plain tool calling is.
+        if type(llm).__name__ == "ChatOpenAI":
+            return {"method": "function_calling"}
+        return {}
+
+    async def ainvoke(
+        self,
+        llm: BaseChatModel,
+        prompt: ChatPromptTemplate,
+        inputs: Dict[str, Any],
+        schema: Type[M],
+        task: str,
+        validate: Optional[Callable[[Any], M]] = None,
+    ) -> M:
+        """
+        Runs prompt with inputs on llm and returns a schema instance. A prompt variable
+        named format_instructions is filled with the schema's instructions. validate turns
+        repaired JSON into the schema (default: schema.model_validate), e.g. to drop
+        invalid list items rather than reject the whole reply. Raises
+        StructuredOutputError when every path fails. Provider errors other than an
+        unsupported schema (timeouts, 5xx, auth, rate limits) propagate unretried.
+        """
+        parser = PydanticOutputParser(pydantic_object=schema)
+        if "format_instructions" in prompt.input_variables:
+            inputs = {**inputs, "format_instructions": parser.get_format_instructions()}
+        messages = await prompt.aformat_messages(**inputs)
+        validate = validate or schema.model_validate
+
+        raw_text: Optional[str] = None
+        raw_args: Any = None
+        prompted = False
+        native_key = self._native_key(llm, schema)
+        if native_key not in self._unsupported:
+            try:
+                structured = llm.with_structured_output(
+                    schema, include_raw=True, **self._native_kwargs(llm)
+                )
+                result = await structured.ainvoke(messages)
+            except Exception as e:
+                if not is_unsupported_error(e):
+                    # Transient or provider errors (timeouts, 5xx, auth, safety blocks, 429)
+                    # say nothing about native support; don't retry in another mode
+                    self._count(task, "native_error")
+                    raise
+                logger.warning(
+                    f"{native_key[0]} {native_key[1]} has no native structured output for "
+                    f"{schema.__name__} ({e}); using JSON prompting"
+                )
+                self._unsupported.add(native_key)
+                self._count(task, "native_unsupported")
+                result = None
+            if result is not None:
+                if result.get("parsed") is not None:
+                    self._count(task, "native")
+                    return result["parsed"]
+                raw = result.get("raw")
+                tool_calls = getattr(raw, "tool_calls", None) or []
+                raw_args = tool_calls[0].get("args") if tool_calls else None
+                invalid = getattr(raw, "invalid_tool_calls", None) or []
+                raw_text = (invalid[0].get("args") if invalid else None) or _message_text(raw)
+
+        if raw_text is None and raw_args is None:
+            raw_text = _message_text(await llm.ainvoke(messages))
+            prompted = True
+
+        try:
+            data = raw_args if raw_args is not None else repair_json(raw_text)
+            parsed = validate(data)
+            self._count(task, "prompted_json" if prompted else "repaired")
+            return parsed
+        except Exception as e:
+            logger.info(f"Local repair of {task} output failed ({e}); asking the model to fix it")
+
+        if raw_args is None and not (raw_text or "").strip():
+            # Nothing for a fixing call to work from
+            self._count(task, "failed")
+            raise StructuredOutputError(f"Model returned no {task} output")
+        text = raw_text if raw_args is None else json.dumps(raw_args, default=str)
+        try:
+            parsed = await OutputFixingParser.from_llm(parser=parser, llm=llm).aparse(text)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise
+            self._count(task, "failed")
+            raise StructuredOutputError(f"Could not parse {task} output: {e}") from e
+        self._count(task, "llm_fallback")
+        return parsed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {task: dict(c) for task, c in self._counts.items()}
+        return {"tasks": counts, "native_unsupported_models": len(self._unsupported)}
+
+
+structured_output = StructuredOutputRunner()
@@ -0,0 +1,153 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from embedding_cache import content_hash
+from vector_reconcile import ReconcilePlan, within_grace
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+OLD = (NOW - timedelta(hours=1)).isoformat()
+RECENT = (NOW - timedelta(seconds=30)).isoformat()
+GRACE = 300
+
+
+def uid() -> str:
+    return str(uuid.uuid4())
+
+
+def item(text="text", type="chapter", db_id=None, embedding_id=None, modified_at=OLD, **extra):
+    db_id = db_id or uid()
+    return {
+        "source": "chapter",
+        "db_id": db_id,
+        "embedding_id": embedding_id,
+        "point_id": embedding_id or db_id,
+        "type": type,
+        "text": text,
+        "metadata": {"id": db_id, "type": type},
+        "modified_at": modified_at,
+        **extra,
+    }
+
+
+def point(point_id, text="text", type="chapter", payload_id=None, **extra):
+    return {
+        "point_id": point_id,
+        "id": payload_id or point_id,
+        "type": type,
+        "content_hash": content_hash(text),
+        **extra,
+    }
+
+
+def plan_for(points, items, known_ids=(), include_recent=False):
+    plan = ReconcilePlan(
+        {"chapter", "uploaded_file"},
+        {"event"},
+        set(known_ids),
+        GRACE,
+        include_recent=include_recent,
+        now=NOW,
+    )
+    plan.add_points(points)
+    plan.add_items(items)
+    return plan
+
+
+def test_up_to_date_item_needs_nothing():
+    row = item()
+    plan = plan_for([point(row["point_id"])], [row])
+    assert (plan.missing, plan.stale, plan.duplicates, plan.orphans()) == ([], [], [], [])
+
+
+def test_missing_point_is_added_and_its_id_written_back():
+    row = item()
+    plan = plan_for([], [row])
+    assert plan.missing == [row]
+    assert plan.embedding_id_fixes == [(row, row["point_id"])]
+
+
+def test_changed_text_is_stale():
+    row = item(text="new text")
+    plan = plan_for([point(row["point_id"], text="old text")], [row])
+    assert plan.stale == [(row, row["point_id"])]
+    assert plan.missing == []
+
+
+def test_point_under_lost_id_is_adopted_not_re_embedded():
+    row = item()
+    adopted = uid()
+    plan = plan_for([point(adopted, payload_id=row["db_id"])], [row])
+    assert plan.missing == []
+    assert plan.embedding_id_fixes == [(row, adopted)]
+    assert plan.orphans() == []
+
+
+def test_extra_points_for_the_same_row_are_duplicates():
+    row = item()
+    extra = uid()
+    plan = plan_for(
+        [point(row["point_id"]), point(extra, payload_id=row["db_id"])], [row]
+    )
+    assert plan.duplicates == [extra]
+    assert plan.orphans() == []
+
+
+def test_point_of_another_type_with_the_same_payload_id_is_not_a_duplicate():
+    row = item()
+    other = uid()
+    plan = plan_for(
+        [point(row["point_id"]), point(other, type="event", payload_id=row["db_id"])],
+        [row],
+    )
+    assert plan.duplicates == []
+
+
+def test_unclaimed_point_of_an_owned_type_is_an_orphan():
+    stray = uid()
+    plan = plan_for([point(stray, updated_at=OLD)], [])
+    assert plan.orphans() == [stray]
+
+
+def test_shared_types_and_known_ids_are_never_orphans():
+    shared, known = uid(), uid()
+    plan = plan_for(
+        [point(shared, type="event"), point(known, payload_id="event-1")],
+        [],
+        known_ids={"event-1"},
+    )
+    assert plan.orphans() == []
+
+
+def test_recent_rows_and_points_are_left_for_the_next_pass():
+    row = item(text="new text", modified_at=RECENT)
+    stray = uid()
+    plan = plan_for(
+        [point(row["point_id"], text="old text"), point(stray, updated_at=RECENT)], [row]
+    )
+    assert plan.stale == []
+    assert plan.orphans() == []
+
+
+def test_include_recent_repairs_rows_but_keeps_recent_points():
+    row = item(modified_at=RECENT)
+    stray = uid()
+    plan = plan_for([point(stray, updated_at=RECENT)], [row], include_recent=True)
+    assert plan.missing == [row]
+    assert plan.orphans() == []
+
+
+def test_presence_only_item_is_never_re_embedded_or_refreshed():
+    lost = item(type="uploaded_file", presence_only=True)
+    indexed = item(text="db preview", type="uploaded_file", presence_only=True)
+    plan = plan_for([point(indexed["point_id"], text="full file", type="uploaded_file")], [lost, indexed])
+    assert plan.missing == []
+    assert plan.stale == []
+    assert plan.unrecoverable == 1
+    assert plan.orphans() == []
+
+
+def test_within_grace_handles_naive_and_unparseable_timestamps():
+    assert within_grace((NOW - timedelta(seconds=10)).replace(tzinfo=None), GRACE, NOW)
+    assert not within_grace(OLD, GRACE, NOW)
+    assert not within_grace("not a date", GRACE, NOW)
+    assert not within_grace(None, GRACE, NOW)
@@ -0,0 +1,122 @@
+# backend/token_estimator.py
+import logging
+import math
+import threading
+from typing import Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+from embedding_cache import content_hash
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token for English prose, by provider. Used when no local
+# tokenizer for the model is available; slightly conservative so budgets don't overflow.
+CHARS_PER_TOKEN = {
+    "gemini": 4.0,
+    "anthropic": 3.5,
+    "openai": 4.0,
+    "default": 3.8,
+}
+# Shorter texts are tokenized directly; hashing them costs about as much as tokenizing
+MEMO_MIN_CHARS = 256
+
+
+def provider_for(model_name: Optional[str]) -> str:
+    """Maps a model setting (e.g. "gemini-2.5-pro", "openrouter/anthropic/claude-3.5-sonnet") to a provider."""
+    name = (model_name or "").lower()
+    if name.startswith("openrouter/"):
+        name = name.split("/", 1)[1]
+    if name.startswith("openai/") or name.startswith("gpt") or name.startswith("o1"):
+        return "openai"
+    if name.startswith("anthropic/") or "claude" in name:
+        return "anthropic"
+    if "gemini" in name or "gemma" in name or name.startswith("google/"):
+        return "gemini"
+    return "default"
+
+
+class TokenEstimator:
+    """
+    Local token counts for context budgeting, without calling the provider's count-tokens API.
+
+    OpenAI models are counted exactly with tiktoken when it is installed; other providers
+    use a calibrated chars-per-token estimate. tiktoken counts for longer texts are
+    memoized by (encoding, content hash), so re-counting the same chapters on every
+    generation is a dictionary lookup. Estimates are cheaper than the hash and are
+    never memoized.
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        self._memo = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._encodings: Dict[str, object] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _encoding(self, model_name: str):
+        if tiktoken is None:
+            return None
+        model = (model_name or "").split("/")[-1]
+        with self._lock:
+            if model not in self._encodings:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        # Model newer than this tiktoken release
+                        encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    # e.g. the encoding file can't be downloaded offline
+                    logger.warning(f"tiktoken unavailable for {model}, using estimate: {e}")
+                    encoding = None
+                self._encodings[model] = encoding
+            return self._encodings[model]
+
+    def _method(self, model_name: Optional[str]) -> Tuple[str, object]:
+        provider = provider_for(model_name)
+        if provider == "openai":
+            encoding = self._encoding(model_name)
+            if encoding is not None:
+                return f"tiktoken:{encoding.name}", encoding
+        return f"chars:{provider}", CHARS_PER_TOKEN[provider]
+
+    def count(self, text: str, model_name: Optional[str] = None) -> int:
+        if not text or not isinstance(text, str):
+            return 0
+        method, counter = self._method(model_name)
+        if isinstance(counter, float) or len(text) < MEMO_MIN_CHARS:
+            return self._count(text, counter)
+        key = (method, content_hash(text))
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        tokens = self._count(text, counter)
+        with self._lock:
+            self._memo[key] = tokens
+        return tokens
+
+    @staticmethod
+    def _count(text: str, counter) -> int:
+        if isinstance(counter, float):
+            return math.ceil(len(text) / counter)
+        return len(counter.encode(text, disallowed_special=()))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._memo),
+            "tokenizer": "tiktoken" if tiktoken is not None else None,
+        }
+
+
+token_estimator = TokenEstimator()
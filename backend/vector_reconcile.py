@@ -0,0 +1,157 @@
+# backend/vector_reconcile.py
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from embedding_cache import content_hash
+from vector_store import point_key
+
+# Payload fields the reconciler reads per point (no text, no vectors)
+RECONCILE_POINT_FIELDS = ["id", "item_id", "type", "content_hash", "created_at", "updated_at"]
+
+
+def within_grace(timestamp, grace_seconds: float, now: Optional[datetime] = None) -> bool:
+    """True when a row or point changed too recently to judge (its write may still be in flight)."""
+    if not timestamp:
+        return False
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return False
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (now or datetime.now(timezone.utc)) - timestamp < timedelta(seconds=grace_seconds)
+
+
+class PointRow(NamedTuple):
+    """What the reconciler keeps per indexed point."""
+
+    point_id: str
+    type: Optional[str]
+    content_hash: Optional[str]
+    payload_id: Optional[str]
+    item_id: Optional[str]
+    modified_at: Any
+
+    @classmethod
+    def from_payload(cls, row: Dict[str, Any]) -> "PointRow":
+        payload_id, item_id = row.get("id"), row.get("item_id")
+        return cls(
+            row["point_id"],
+            row.get("type"),
+            row.get("content_hash"),
+            None if payload_id is None else str(payload_id),
+            None if item_id is None else str(item_id),
+            row.get("updated_at") or row.get("created_at"),
+        )
+
+
+class ReconcilePlan:
+    """
+    Decides what one reconcile pass repairs, without touching the DB or the collection.
+
+    Points are added page by page and kept as compact PointRow tuples (IDs, type and
+    content hash only); DB index items are then added page by page. An item whose point
+    is missing is re-embedded unless it is presence_only (its text can't be rebuilt from
+    the DB), an item whose point has another content_hash is refreshed, extra points for
+    the same row are duplicates, and a point found only under the row's payload ID is
+    adopted (the DB gets its ID back). Points of owned types that no item or known ID
+    refers to are orphans. Items and points changed within grace_seconds are skipped so
+    in-flight writes are never mistaken for drift; include_recent still repairs recently
+    changed items (re-embedding a row is idempotent) but never deletes recent points.
+    """
+
+    def __init__(
+        self,
+        owned_types: Iterable[str],
+        shared_types: Iterable[str],
+        known_ids: Set[str],
+        grace_seconds: float,
+        include_recent: bool = False,
+        now: Optional[datetime] = None,
+    ):
+        self.owned_types = set(owned_types)
+        self.shared_types = set(shared_types)
+        self.known_ids = set(known_ids)
+        self.grace_seconds = grace_seconds
+        self.include_recent = include_recent
+        self.now = now or datetime.now(timezone.utc)
+        self.points: Dict[str, PointRow] = {}
+        self.points_by_payload_id: Dict[str, List[PointRow]] = {}
+        self.claimed: Set[str] = set()
+        self.missing: List[Dict[str, Any]] = []
+        self.stale: List[Tuple[Dict[str, Any], str]] = []
+        self.duplicates: List[str] = []
+        self.embedding_id_fixes: List[Tuple[Dict[str, Any], str]] = []
+        self.unrecoverable = 0
+        self.db_rows = 0
+
+    def _within_grace(self, timestamp) -> bool:
+        return within_grace(timestamp, self.grace_seconds, self.now)
+
+    def add_points(self, rows: Iterable[Dict[str, Any]]):
+        """Adds a page of scanned point payloads (RECONCILE_POINT_FIELDS plus point_id)."""
+        for row in rows:
+            point = PointRow.from_payload(row)
+            self.points[point.point_id] = point
+            if point.payload_id is not None:
+                self.points_by_payload_id.setdefault(point.payload_id, []).append(point)
+
+    def add_items(self, items: Iterable[Dict[str, Any]]):
+        """Adds a page of DB index items (see AgentManager._iter_index_items)."""
+        for item in items:
+            self.db_rows += 1
+            self.owned_types.add(item["type"])
+            for value in (item["db_id"], item["embedding_id"], item.get("alias_id")):
+                if value:
+                    self.known_ids.add(point_key(value))
+                    self.known_ids.add(str(value))
+
+            point = self.points.get(point_key(item["point_id"])) or self.points.get(
+                point_key(item["db_id"])
+            )
+            same_item = [
+                p
+                for p in self.points_by_payload_id.get(str(item["db_id"]), [])
+                if p.type == item["type"]
+            ]
+            if point is None and same_item:
+                # The point exists under an ID the DB lost track of; adopt it
+                point = same_item[0]
+                self.embedding_id_fixes.append((item, point.point_id))
+            if point is not None:
+                self.claimed.add(point.point_id)
+                self.duplicates.extend(
+                    p.point_id
+                    for p in same_item
+                    if p.point_id != point.point_id and p.point_id not in self.claimed
+                )
+                self.claimed.update(p.point_id for p in same_item)
+
+            if not self.include_recent and self._within_grace(item["modified_at"]):
+                continue
+            if point is None:
+                if item.get("presence_only"):
+                    self.unrecoverable += 1
+                    continue
+                self.missing.append(item)
+                if not item["embedding_id"]:
+                    self.embedding_id_fixes.append((item, point_key(item["point_id"])))
+            elif not item.get("presence_only") and point.content_hash != content_hash(
+                item["text"]
+            ):
+                self.stale.append((item, point.point_id))
+
+    def orphans(self) -> List[str]:
+        """Points no item claimed, of types owned by the reconciled tables. Call after all items."""
+        owned_types = self.owned_types - self.shared_types
+        return [
+            point.point_id
+            for point in self.points.values()
+            if point.point_id not in self.claimed
+            and point.type in owned_types
+            and point.point_id not in self.known_ids
+            and str(point.payload_id) not in self.known_ids
+            and str(point.item_id) not in self.known_ids
+            and not self._within_grace(point.modified_at)
+        ]
@@ -1,13 +1,23 @@
 import asyncio
+import base64
+import copy
+import gzip
+import functools
+from array import array
 
 # from langchain_qdrant import Qdrant # Deprecated
 from langchain_qdrant import QdrantVectorStore
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
-from typing import List, Dict, Any, Optional
+from langchain_core.embeddings import Embeddings
+from typing import List, Dict, Any, Optional, Set, Callable, Awaitable, AsyncIterator
 import logging
 import json
+import math
 import os
+import re
+import threading
+import time
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as rest
@@ -23,33 +33,103 @@ from qdrant_client.http.models import (
     PointIdsList,
 )
 import uuid
-from fastembed import SparseTextEmbedding  # Added
+from fastembed import SparseTextEmbedding, TextEmbedding  # Added
+from embedding_cache import embedding_cache, query_embedding_cache, content_hash
+from rate_limiter import ProviderRateLimiter, rate_limits
+from token_estimator import token_estimator
+
+
+# Texts per embedContent batch request made by GoogleGenerativeAIEmbeddings
+EMBED_REQUEST_BATCH = 100
 
 
 class QdrantEmbeddingFunction:
-    def __init__(self, embeddings_model):
+    def __init__(self, embeddings_model, rate_limiter: Optional[ProviderRateLimiter] = None):
         self.embeddings = embeddings_model
+        self.rate_limiter = rate_limiter  # None for local models
 
     def __call__(self, input: List[str]) -> List[List[float]]:
         """Generates embeddings for a list of texts."""
         # Handle single string input
         if isinstance(input, str):
             input = [input]
-        return self.embeddings.embed_documents(input)
+        return self.embed_documents(input)
 
     # Add embed_documents method to maintain compatibility with LangChain
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Generates embeddings for a list of texts."""
-        return self.embeddings.embed_documents(texts)
+        if self.rate_limiter is None or not texts:
+            return self.embeddings.embed_documents(texts)
+        return self.rate_limiter.call(
+            self.embeddings.embed_documents,
+            texts,
+            tokens=sum(token_estimator.count(text) for text in texts),
+            requests=math.ceil(len(texts) / EMBED_REQUEST_BATCH),
+        )
 
     # Add the missing embed_query method
     def embed_query(self, text: str) -> List[float]:
         """Generates an embedding for a single query text."""
         # Use embed_documents and take the first result
-        result = self.embeddings.embed_documents([text])
+        result = self.embed_documents([text])
         return result[0] if result else []
 
 
+# embeddingsModel values with this prefix run a fastembed ONNX model on the local CPU,
+# e.g. "fastembed/BAAI/bge-small-en-v1.5"
+LOCAL_EMBEDDINGS_PREFIX = "fastembed/"
+
+_local_dense_models: Dict[str, "TextEmbedding"] = {}
+_local_dense_models_lock = threading.Lock()
+
+
+def is_local_embeddings_model(model_name: Optional[str]) -> bool:
+    return bool(model_name) and model_name.startswith(LOCAL_EMBEDDINGS_PREFIX)
+
+
+class LocalDenseEmbeddings(Embeddings):
+    """
+    Dense embeddings computed locally with a fastembed ONNX model, so indexing and
+    queries need no network. The loaded model is shared by every project using the
+    same model name. Calls are blocking; callers already run them in executor threads,
+    and ONNX Runtime releases the GIL while it computes.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name[len(LOCAL_EMBEDDINGS_PREFIX):]
+        with _local_dense_models_lock:
+            if self.model_name not in _local_dense_models:
+                logging.getLogger(__name__).info(
+                    f"Loading local dense embedding model {self.model_name}..."
+                )
+                _local_dense_models[self.model_name] = TextEmbedding(model_name=self.model_name)
+            self.model = _local_dense_models[self.model_name]
+        self.dimensions = self._lookup_dimensions()
+
+    def _lookup_dimensions(self) -> int:
+        for description in TextEmbedding.list_supported_models():
+            if description.get("model", "").lower() == self.model_name.lower():
+                return int(description["dim"])
+        # Custom models: measure a probe embedding
+        return len(self.embed_query("dimension probe"))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.model.embed(list(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def normalize_entity_name(name: Optional[str]) -> str:
+    """Standardize name for comparison by removing extra spaces, punctuation and converting to lowercase."""
+    if not name or not isinstance(name, str):
+        return ""
+    name = name.lower()
+    name = re.sub(r"[^\w\s-]", "", name)  # Allow words, spaces, hyphens
+    name = re.sub(r"\s+", " ", name).strip()
+    return name
+
+
 def flatten_metadata(metadata):
     flattened = {}
     for key, value in metadata.items():
@@ -61,661 +141,1145 @@ def flatten_metadata(metadata):
     return flattened
 
 
+QDRANT_STORAGE_PATH = "./local_qdrant_storage"
+PAYLOAD_INDEX_FIELDS = ("type", "user_id", "project_id", "id", "parent_id", "point_kind")
+SPARSE_MODEL_NAME = "Qdrant/bm25"
+
+# Long-form content types indexed as a vectorless parent point plus embedded chunks
+CHUNKED_CONTENT_TYPES = {"chapter", "uploaded_file"}
+CHUNK_MAX_TOKENS = 400
+CHARS_PER_TOKEN = 4  # Rough estimate for English prose
+CHUNK_NAMESPACE = uuid.UUID("5b8f3c1e-2a47-4d0e-9c61-7f2d8e4a9b13")
+
+# Leading characters of each point's text kept in a separate "page_snippet" payload field,
+# so snippet-only searches never have to transfer the full page_content
+SNIPPET_PAYLOAD_CHARS = 500
+
+# Ingestion pipeline limits
+INGEST_BATCH_MAX_TOKENS = 16000  # Estimated tokens per embedding request
+INGEST_BATCH_MAX_ITEMS = 64  # Stay under the embedding API's per-request item limit
+INGEST_MAX_CONCURRENCY = 3  # Batches being embedded at once
+INGEST_QUEUE_DEPTH = 2  # Embedded batches waiting to be written before producers block
+
+# Native output size of the dense embedding model. Smaller configured dimensions take a
+# Matryoshka prefix of it (truncate + renormalize); the full vector can be kept for rescoring.
+DENSE_FULL_DIMENSIONS = 3072
+RESCORE_CANDIDATE_FACTOR = 4  # Reduced-dimension candidates fetched per result before rescoring
+
+# Items written to the shadow collection per reindex checkpoint
+REINDEX_BATCH_ITEMS = 64
+
+# Collection snapshots: gzipped JSON lines (header, one line per point, trailer) with
+# vectors packed as base64 float32, so a restore or clone needs no embedding calls
+SNAPSHOT_DIR = "./local_qdrant_snapshots"
+SNAPSHOT_FORMAT = "scrollwise-vectors"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_BATCH_POINTS = 256
+
+
+def point_key(value) -> str:
+    """Point ID as Qdrant reports it (canonical UUID form), for comparing against stored IDs."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return str(value)
+
+
+def _pack(values, typecode: str = "f") -> str:
+    return base64.b64encode(array(typecode, values).tobytes()).decode("ascii")
+
+
+def _unpack(data: str, typecode: str = "f") -> List:
+    return array(typecode, base64.b64decode(data)).tolist()
+
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[tuple]:
+    """
+    Splits text into (start, end) character spans of at most ~max_tokens each.
+    Paragraph boundaries are preferred, then sentence boundaries, then a hard cut.
+    text[start:end] is always the exact chunk text.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    spans = []
+
+    # Paragraph spans with exact offsets
+    paragraphs = []
+    pos = 0
+    for match in re.finditer(r"\n\s*\n", text):
+        paragraphs.append((pos, match.start()))
+        pos = match.end()
+    paragraphs.append((pos, len(text)))
+
+    def split_long(start: int, end: int):
+        while end - start > max_chars:
+            window = text[start : start + max_chars]
+            cut = max(window.rfind(". "), window.rfind("! "), window.rfind("? "))
+            if cut < max_chars // 2:
+                cut = window.rfind(" ")
+            cut = start + (cut + 1 if cut > 0 else max_chars)
+            yield start, cut
+            start = cut
+        if end > start:
+            yield start, end
+
+    current_start = current_end = None
+    for p_start, p_end in paragraphs:
+        if not text[p_start:p_end].strip():
+            continue
+        if current_start is not None and p_end - current_start <= max_chars:
+            current_end = p_end
+            continue
+        if current_start is not None:
+            spans.append((current_start, current_end))
+            current_start = current_end = None
+        if p_end - p_start > max_chars:
+            spans.extend(split_long(p_start, p_end))
+        else:
+            current_start, current_end = p_start, p_end
+    if current_start is not None:
+        spans.append((current_start, current_end))
+    return spans
+
+
+class QdrantClientRegistry:
+    """
+    Process-wide owner of the embedded Qdrant client.
+
+    The local storage folder can only be opened once per process, so every
+    VectorStore borrows this client instead of opening its own. The registry
+    also keeps a reference count of open collection handles and remembers
+    which collections have already been verified, so repeated handles for the
+    same project skip the existence/index checks.
+
+    A project's logical collection name is either a collection itself or, once
+    a reindex or restore has been swapped in, a Qdrant alias of the physical
+    collection serving it.
+    """
+
+    def __init__(self, path: str = QDRANT_STORAGE_PATH):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._client: Optional[QdrantClient] = None
+        self._lock = threading.RLock()
+        self._open_collections: Dict[str, int] = {}
+        self._ensured_collections: Dict[str, tuple] = {}  # physical name -> (dense size, rescore size)
+        self._aliases: Optional[Dict[str, str]] = None  # logical -> physical, mirrors Qdrant's aliases
+        self._reindex_progress: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def collection_name_for(user_id: str, project_id: str) -> str:
+        return f"user_{user_id[:8]}_project_{project_id[:8]}"
+
+    def _load_aliases(self) -> Dict[str, str]:
+        # Only this registry changes aliases, so they are read from storage once
+        if self._aliases is None:
+            self._aliases = {
+                alias.alias_name: alias.collection_name
+                for alias in self.client.get_aliases().aliases
+            }
+        return self._aliases
+
+    def resolve(self, logical_name: str) -> str:
+        """Returns the physical collection currently serving a logical collection name."""
+        with self._lock:
+            return self._load_aliases().get(logical_name, logical_name)
+
+    def shadow_name_for(self, logical_name: str) -> str:
+        """
+        Name of the next-generation collection a reindex fills. Deterministic, so an
+        interrupted reindex finds (and resumes) the same shadow collection.
+        """
+        current = self.resolve(logical_name)
+        match = re.search(r"_g(\d+)$", current)
+        generation = int(match.group(1)) if match and current != logical_name else 0
+        return f"{logical_name}_g{generation + 1}"
+
+    def swap_collection(self, logical_name: str, new_physical: str):
+        """Points the logical alias at new_physical, then drops the old physical collection."""
+        with self._lock:
+            aliases = self._load_aliases()
+            old_physical = aliases.get(logical_name, logical_name)
+            if old_physical == new_physical:
+                return
+            operations = []
+            if logical_name in aliases:
+                operations.append(
+                    rest.DeleteAliasOperation(
+                        delete_alias=rest.DeleteAlias(alias_name=logical_name)
+                    )
+                )
+            else:
+                # Never swapped before: the collection holding the logical name has to
+                # go before the name can become an alias
+                self.drop_physical(logical_name)
+            operations.append(
+                rest.CreateAliasOperation(
+                    create_alias=rest.CreateAlias(
+                        collection_name=new_physical, alias_name=logical_name
+                    )
+                )
+            )
+            # Deleting and re-creating the alias in one call switches it atomically
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+            aliases[logical_name] = new_physical
+            self.logger.info(
+                f"Collection {logical_name} now served by {new_physical} (was {old_physical})"
+            )
+            if old_physical != logical_name:
+                self.drop_physical(old_physical)
+
+    def set_reindex_progress(self, logical_name: str, **fields):
+        with self._lock:
+            self._reindex_progress.setdefault(logical_name, {}).update(fields)
+
+    def reindex_status(self, logical_name: Optional[str] = None) -> Dict[str, Any]:
+        """Snapshot of reindex progress, for one logical collection or all of them."""
+        with self._lock:
+            if logical_name is not None:
+                return dict(self._reindex_progress.get(logical_name, {}))
+            return {name: dict(p) for name, p in self._reindex_progress.items()}
+
+    @property
+    def client(self) -> QdrantClient:
+        """Returns the shared client, opening the local storage on first use."""
+        with self._lock:
+            if self._client is None:
+                self.logger.debug("Initializing shared local Qdrant client...")
+                self._client = QdrantClient(path=self.path)
+                self.logger.info(f"Local Qdrant client initialized at: {self.path}")
+            return self._client
+
+    def acquire(self, collection_name: str) -> QdrantClient:
+        """Registers an open handle on a collection and returns the shared client."""
+        client = self.client
+        with self._lock:
+            self._open_collections[collection_name] = (
+                self._open_collections.get(collection_name, 0) + 1
+            )
+        return client
+
+    def release(self, collection_name: str):
+        """Drops one handle on a collection. The client itself stays open."""
+        with self._lock:
+            remaining = self._open_collections.get(collection_name, 0) - 1
+            if remaining > 0:
+                self._open_collections[collection_name] = remaining
+            else:
+                self._open_collections.pop(collection_name, None)
+
+    def open_collections(self) -> Dict[str, int]:
+        """Returns a snapshot of open collection handles (name -> handle count)."""
+        with self._lock:
+            return dict(self._open_collections)
+
+    def create_collection(
+        self,
+        collection_name: str,
+        embedding_size: int,
+        rescore_size: Optional[int] = None,
+    ):
+        """
+        Creates a collection with the hybrid (dense + sparse) config and payload indexes.
+        With rescore_size, a full-dimension "dense_full" vector is added next to the
+        reduced "dense" one without an HNSW graph, since it is only used to rescore
+        candidates. Embedded Qdrant keeps it in RAM, so it costs rescore_size x 4 bytes
+        per point on top of the reduced vector.
+        """
+        vectors_config = {
+            "dense": VectorParams(size=embedding_size, distance=Distance.COSINE)
+        }
+        if rescore_size:
+            vectors_config["dense_full"] = VectorParams(
+                size=rescore_size,
+                distance=Distance.COSINE,
+                hnsw_config=rest.HnswConfigDiff(m=0),
+            )
+        with self._lock:
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=vectors_config,
+                sparse_vectors_config={
+                    "sparse": SparseVectorParams(
+                        index=rest.SparseIndexParams(
+                            on_disk=False,
+                        )
+                    )
+                },
+            )
+            self.logger.info(f"Collection {collection_name} created with Hybrid Search config.")
+            self._ensure_payload_indexes(collection_name, existing_schema={})
+            self._ensured_collections[collection_name] = (embedding_size, rescore_size)
+
+    def _ensure_payload_indexes(self, collection_name: str, existing_schema: Dict):
+        for field_name in PAYLOAD_INDEX_FIELDS:
+            if field_name in existing_schema:
+                continue
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=rest.PayloadSchemaType.KEYWORD,
+                wait=True,
+            )
+            self.logger.info(
+                f"Created keyword index for '{field_name}' field in collection {collection_name}."
+            )
+
+    def ensure_collection(
+        self,
+        collection_name: str,
+        embedding_size: int,
+        rescore_size: Optional[int] = None,
+    ) -> bool:
+        """
+        Makes sure the collection exists with the hybrid config and payload indexes.
+        Returns True when an existing collection needs migration (legacy unnamed
+        vectors, a dense dimension mismatch or a different rescoring layout); such
+        collections are left untouched.
+        """
+        layout = (embedding_size, rescore_size)
+        with self._lock:
+            if self._ensured_collections.get(collection_name) == layout:
+                return False
+
+            if not self.client.collection_exists(collection_name):
+                self.logger.debug(
+                    f"Collection not found, creating new one: {collection_name}"
+                )
+                self.create_collection(collection_name, embedding_size, rescore_size)
+                return False
+
+            collection_info = self.client.get_collection(
+                collection_name=collection_name
+            )
+            config_vectors = collection_info.config.params.vectors
+            if not (isinstance(config_vectors, dict) and "dense" in config_vectors):
+                self.logger.warning(
+                    f"Collection '{collection_name}' exists but is not configured for Hybrid Search. "
+                    "Migration required."
+                )
+                return True
+            if config_vectors["dense"].size != embedding_size:
+                self.logger.warning(
+                    f"Dimension mismatch: Collection '{collection_name}' dense vector has "
+                    f"{config_vectors['dense'].size} dimensions but current embeddings model "
+                    f"produces {embedding_size} dimensions. Migration required."
+                )
+                return True
+            current_rescore = config_vectors.get("dense_full")
+            if (current_rescore.size if current_rescore else None) != rescore_size:
+                self.logger.warning(
+                    f"Collection '{collection_name}' full-dimension rescoring vector does not "
+                    f"match the configured layout (expected {rescore_size}). Migration required."
+                )
+                return True
+
+            try:
+                self._ensure_payload_indexes(
+                    collection_name, collection_info.payload_schema or {}
+                )
+            except Exception as index_e:
+                self.logger.error(
+                    f"Error checking/creating index for existing collection: {index_e}",
+                    exc_info=True,
+                )
+            self._ensured_collections[collection_name] = layout
+            self.logger.debug(f"Collection already exists: {collection_name}")
+            return False
+
+    def memory_report(self, prefix: str = "") -> Dict[str, Dict[str, Any]]:
+        """
+        Dense-vector memory per collection whose name starts with prefix. Blocking.
+
+        Embedded Qdrant (QdrantClient(path=...), the only mode this registry opens) keeps
+        every vector (dense and the dense_full rescoring vector) in process memory as
+        float32, so embedded_ram_bytes is what this process holds. Point counts are
+        Qdrant's approximate points_count (chunked parents included, though they carry
+        no dense vector), so figures are an upper bound; the registry lock is only held
+        to list the collections.
+        """
+        client = self.client
+        with self._lock:
+            names = [
+                description.name
+                for description in client.get_collections().collections
+                if description.name.startswith(prefix)
+            ]
+        report = {}
+        for name in names:
+            try:
+                info = client.get_collection(collection_name=name)
+                vectors = info.config.params.vectors
+                if not (isinstance(vectors, dict) and "dense" in vectors):
+                    continue
+                dims = vectors["dense"].size
+                rescore = vectors.get("dense_full")
+                rescore_dims = rescore.size if rescore else 0
+                points = info.points_count or 0
+                report[name] = {
+                    "points": points,
+                    "dimensions": dims,
+                    "rescore_dimensions": rescore_dims or None,
+                    "embedded_ram_bytes": points * (dims + rescore_dims) * 4,
+                }
+            except Exception as e:
+                self.logger.error(f"Error building memory report for {name}: {e}")
+        return report
+
+    def drop_collection(self, collection_name: str) -> bool:
+        """
+        Deletes a collection without needing any embedding models. Returns False if it did not exist.
+        Given a logical name, the serving physical collection, any unfinished reindex
+        shadow and the alias are all removed.
+        """
+        with self._lock:
+            aliases = self._load_aliases()
+            physical = aliases.get(collection_name, collection_name)
+            targets = [physical, self.shadow_name_for(collection_name)]
+            if collection_name in aliases:
+                self.client.update_collection_aliases(
+                    change_aliases_operations=[
+                        rest.DeleteAliasOperation(
+                            delete_alias=rest.DeleteAlias(alias_name=collection_name)
+                        )
+                    ]
+                )
+                aliases.pop(collection_name)
+            self._reindex_progress.pop(collection_name, None)
+
+            dropped = False
+            for name in dict.fromkeys(targets):
+                if self.drop_physical(name) and name == physical:
+                    dropped = True
+            return dropped
+
+    def drop_physical(self, collection_name: str) -> bool:
+        """
+        Deletes one physical collection (e.g. a reindex shadow) by its own name, leaving
+        aliases alone. Returns False if it did not exist.
+        """
+        with self._lock:
+            self._ensured_collections.pop(collection_name, None)
+            if not self.client.collection_exists(collection_name):
+                return False
+            self.client.delete_collection(collection_name=collection_name, timeout=60)
+            self.logger.info(f"Deleted Qdrant collection: {collection_name}")
+            return True
+
+    def close(self):
+        """Closes the shared client. Only called on process shutdown."""
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception as e:
+                    self.logger.error(f"Error closing shared Qdrant client: {e}")
+                self._client = None
+            if self._open_collections:
+                self.logger.warning(
+                    f"Closing Qdrant client with open collections: {list(self._open_collections)}"
+                )
+            self._open_collections.clear()
+            self._ensured_collections.clear()
+            self._aliases = None
+
+
+qdrant_registry = QdrantClientRegistry()
+
+
 class VectorStore:
-    def __init__(self, user_id, project_id, api_key, embeddings_model):
+    def __init__(
+        self,
+        user_id,
+        project_id,
+        api_key,
+        embeddings_model,
+        embedding_dimensions=None,
+        dense_rescoring=False,
+        _defer_setup=False,
+    ):
         self.user_id = user_id
         self.project_id = project_id
         self.api_key = api_key
         self.embeddings_model = embeddings_model # Store for later use
+        self.embedding_dimensions = embedding_dimensions
+        self.dense_rescoring = dense_rescoring
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
         self.llm = None
+        self.last_ingest_stats: Dict[str, Any] = {}
+        self._name_index: Optional[Dict[str, tuple]] = None  # point_id -> (type, normalized name)
+        self.logical_collection_name = qdrant_registry.collection_name_for(user_id, project_id)
+        self.init_timings: Dict[str, float] = {}  # phase -> seconds
+        # Set by the owner to write any queued (write-behind) updates before a read
+        self.before_read: Optional[Callable[[], Awaitable[None]]] = None
+
+        if not _defer_setup:
+            self._timed_phase("sparse_model", self._load_sparse_model)
+            self._timed_phase("dense_embeddings", self._load_dense_embeddings)
+            self._timed_phase("collection", self._open_collection)
+            self._log_init_timings()
+
+    @property
+    def collection_name(self) -> str:
+        """Physical collection currently serving this project; follows reindex swaps."""
+        return qdrant_registry.resolve(self.logical_collection_name)
+
+    @classmethod
+    async def create(
+        cls,
+        user_id,
+        project_id,
+        api_key,
+        embeddings_model,
+        embedding_dimensions=None,
+        dense_rescoring=False,
+    ) -> "VectorStore":
+        """
+        Async factory that runs all blocking setup (model loading, opening the
+        local store, collection checks) in the default executor so the event
+        loop keeps serving other requests while a cold project loads.
+        """
+        instance = cls(
+            user_id,
+            project_id,
+            api_key,
+            embeddings_model,
+            embedding_dimensions=embedding_dimensions,
+            dense_rescoring=dense_rescoring,
+            _defer_setup=True,
+        )
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        # The sparse model load is independent of the dense client and the collection
+        await asyncio.gather(
+            loop.run_in_executor(
+                None, instance._timed_phase, "sparse_model", instance._load_sparse_model
+            ),
+            loop.run_in_executor(
+                None,
+                instance._timed_phase,
+                "dense_embeddings",
+                instance._load_dense_embeddings,
+            ),
+        )
+        await loop.run_in_executor(
+            None, instance._timed_phase, "collection", instance._open_collection
+        )
+        instance.init_timings["total"] = time.perf_counter() - started
+        instance._log_init_timings()
+        return instance
 
+    def _timed_phase(self, phase: str, func):
+        started = time.perf_counter()
+        try:
+            return func()
+        finally:
+            self.init_timings[phase] = time.perf_counter() - started
+
+    def _log_init_timings(self):
+        breakdown = ", ".join(
+            f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.init_timings.items()
+        )
+        self.logger.info(
+            f"VectorStore init timings for {self.collection_name}: {breakdown}"
+        )
+
+    def _load_sparse_model(self):
         # Initialize Sparse Embedding Model (Qdrant/bm25 is standard/lightweight)
         try:
             self.logger.debug("Initializing SparseTextEmbedding model...")
-            self.sparse_embedding_model = SparseTextEmbedding(model_name="Qdrant/bm25")
+            self.sparse_embedding_model = SparseTextEmbedding(model_name=SPARSE_MODEL_NAME)
             self.logger.debug("SparseTextEmbedding model initialized.")
         except Exception as e:
             self.logger.error(f"Error initializing SparseTextEmbedding: {e}")
             raise
 
+    def _load_dense_embeddings(self):
         try:
             self.logger.debug("Initializing embeddings model...")
-            base_embeddings = GoogleGenerativeAIEmbeddings(
-                model=embeddings_model, google_api_key=self.api_key
+            if is_local_embeddings_model(self.embeddings_model):
+                self.base_embeddings = LocalDenseEmbeddings(self.embeddings_model)
+                self.full_embedding_size = self.base_embeddings.dimensions
+            else:
+                self.base_embeddings = GoogleGenerativeAIEmbeddings(
+                    model=self.embeddings_model, google_api_key=self.api_key
+                )
+                self.full_embedding_size = DENSE_FULL_DIMENSIONS  # Current Google embedding model dimension
+            self.embeddings = QdrantEmbeddingFunction(
+                self.base_embeddings,
+                None
+                if is_local_embeddings_model(self.embeddings_model)
+                else rate_limits.get("gemini-embeddings", self.api_key),
+            )
+            self.embedding_size = min(
+                int(self.embedding_dimensions or self.full_embedding_size),
+                self.full_embedding_size,
+            )
+            # Rescoring only makes sense when the primary index holds a reduced prefix
+            self.dense_rescoring = bool(
+                self.dense_rescoring and self.embedding_size < self.full_embedding_size
+            )
+            self.logger.debug(
+                f"Embeddings model initialized successfully with dimension: {self.embedding_size}"
+                + (f" (rescoring at {self.full_embedding_size})" if self.dense_rescoring else "")
             )
-            self.embeddings = QdrantEmbeddingFunction(base_embeddings)
-            self.embedding_size = 3072  # Current Google embedding model dimension
-            self.logger.debug(f"Embeddings model initialized successfully with dimension: {self.embedding_size}")
         except Exception as e:
             self.logger.error(
-                f"Error initializing GoogleGenerativeAIEmbeddings: {str(e)}"
+                f"Error initializing embeddings model {self.embeddings_model}: {str(e)}"
             )
             raise
 
+    def _open_collection(self):
         try:
-            self.logger.debug("Initializing local Qdrant client...")
-            # Use local path for persistent storage
-            qdrant_path = "./local_qdrant_storage"
-            
-            self.collection_name = f"user_{user_id[:8]}_project_{project_id[:8]}"
             self.logger.debug(f"Setting up collection: {self.collection_name}")
-
-            self.qdrant_client = QdrantClient(
-                path=qdrant_path
-            )
-            self.logger.info(f"Local Qdrant client initialized at: {qdrant_path}")
+            self.qdrant_client = qdrant_registry.acquire(self.logical_collection_name)
         except Exception as e:
             self.logger.error(f"Error initializing local Qdrant client: {str(e)}")
             raise
 
+        try:
             # Check if collection exists or create it
-            try:
-                collections = self.qdrant_client.get_collections()
-                collection_exists = any(
-                    c.name == self.collection_name for c in collections.collections
-                )
-
-                # Check dimension mismatch AND vector configuration
-                if collection_exists:
-                    collection_info = self.qdrant_client.get_collection(
-                        collection_name=self.collection_name
-                    )
-                    
-                    # Check if it's using named vectors (hybrid config)
-                    config_vectors = collection_info.config.params.vectors
-                    is_hybrid_config = isinstance(config_vectors, dict) and "dense" in config_vectors
-                    
-                    # Note: We don't strictly check for "sparse" in vectors_config because it might be in sparse_vectors_config
-                    # But for our specific migration from "dense-only" to "hybrid", checking for dict is enough.
-                    
-                    if not is_hybrid_config:
-                         self.logger.warning(
-                            f"Collection '{self.collection_name}' exists but is not configured for Hybrid Search. "
-                            "Migration required."
-                        )
-                         self.needs_migration = True
-                         # Do NOT delete here. Let AgentManager handle it.
-
-                    elif config_vectors["dense"].size != self.embedding_size:
-                        error_msg = (
-                            f"Dimension mismatch: Collection '{self.collection_name}' dense vector has {config_vectors['dense'].size} dimensions "
-                            f"but current embeddings model produces {self.embedding_size} dimensions.\n"
-                            f"Migration required."
-                        )
-                        self.logger.warning(error_msg)
-                        self.needs_migration = True
-                    else:
-                        self.needs_migration = False
-                else:
-                    self.needs_migration = False # New collection will be created correctly below
-
-                if not collection_exists:
-                    # ... creation logic ...
-                    self.logger.debug(
-                        f"Collection not found (or deleted), creating new one: {self.collection_name}"
-                    )
-                    # Create the collection with HYBRID config
-                    # Create the collection with HYBRID config
-                    self.qdrant_client.create_collection(
-                        collection_name=self.collection_name,
-                        vectors_config={
-                            "dense": VectorParams(
-                                size=self.embedding_size, 
-                                distance=Distance.COSINE
-                            )
-                        },
-                        sparse_vectors_config={
-                            "sparse": SparseVectorParams(
-                                index=rest.SparseIndexParams(
-                                    on_disk=False,
-                                )
-                            )
-                        }
-                    )
-                    self.logger.info(f"Collection {self.collection_name} created with Hybrid Search config.")
-
-                    # Create payload index for the 'type' field immediately after collection creation
-                    try:
-                        self.qdrant_client.create_payload_index(
-                            collection_name=self.collection_name,
-                            field_name="type",
-                            field_schema=rest.PayloadSchemaType.KEYWORD,  # Use KEYWORD for exact matching/filtering
-                            wait=True,  # Wait for index creation to complete
-                        )
-                        self.logger.info(
-                            f"Created keyword index for 'type' field in collection {self.collection_name}."
-                        )
-                        # Create payload index for 'user_id'
-                        self.qdrant_client.create_payload_index(
-                            collection_name=self.collection_name,
-                            field_name="user_id",
-                            field_schema=rest.PayloadSchemaType.KEYWORD,
-                            wait=True,
-                        )
-                        self.logger.info(
-                            f"Created keyword index for 'user_id' field in collection {self.collection_name}."
-                        )
-                        # Create payload index for 'project_id'
-                        self.qdrant_client.create_payload_index(
-                            collection_name=self.collection_name,
-                            field_name="project_id",
-                            field_schema=rest.PayloadSchemaType.KEYWORD,
-                            wait=True,
-                        )
-                        self.logger.info(
-                            f"Created keyword index for 'project_id' field in collection {self.collection_name}."
-                        )
-                        # Create payload index for 'id' (original item ID)
-                        self.qdrant_client.create_payload_index(
-                            collection_name=self.collection_name,
-                            field_name="id",  # Field to store original DB item ID
-                            field_schema=rest.PayloadSchemaType.KEYWORD,
-                            wait=True,
-                        )
-                        self.logger.info(
-                            f"Created keyword index for 'id' field in collection {self.collection_name}."
-                        )
-                    except Exception as index_e:
-                        self.logger.error(
-                            f"Failed to create payload index for 'type' field: {index_e}",
-                            exc_info=True,
-                        )
-                        # Decide if we should raise here or just log the error
-                        raise  # Re-raise for now, as filtering might fail without it
-
-                else:
-                    self.logger.debug(
-                        f"Collection already exists: {self.collection_name}"
-                    )
-                    # Dimension check already done above, just verify indexes
-                    try:
-                        collection_info = self.qdrant_client.get_collection(
-                            collection_name=self.collection_name
-                        )
-                        if "type" not in collection_info.payload_schema:
-                            self.logger.warning(
-                                f"Index 'type' not found in existing collection {self.collection_name}. Creating it now."
-                            )
-                            self.qdrant_client.create_payload_index(
-                                collection_name=self.collection_name,
-                                field_name="type",
-                                field_schema=rest.PayloadSchemaType.KEYWORD,
-                                wait=True,
-                            )
-                            self.logger.info(
-                                f"Created missing keyword index for 'type' field."
-                            )
-                        if "user_id" not in collection_info.payload_schema:
-                            self.logger.warning(
-                                f"Index 'user_id' not found in existing collection {self.collection_name}. Creating it now."
-                            )
-                            self.qdrant_client.create_payload_index(
-                                collection_name=self.collection_name,
-                                field_name="user_id",
-                                field_schema=rest.PayloadSchemaType.KEYWORD,
-                                wait=True,
-                            )
-                            self.logger.info(
-                                f"Created missing keyword index for 'user_id' field."
-                            )
-                        if "project_id" not in collection_info.payload_schema:
-                            self.logger.warning(
-                                f"Index 'project_id' not found in existing collection {self.collection_name}. Creating it now."
-                            )
-                            self.qdrant_client.create_payload_index(
-                                collection_name=self.collection_name,
-                                field_name="project_id",
-                                field_schema=rest.PayloadSchemaType.KEYWORD,
-                                wait=True,
-                            )
-                            self.logger.info(
-                                f"Created missing keyword index for 'project_id' field."
-                            )
-                        if (
-                            "id" not in collection_info.payload_schema
-                        ):  # Check for "id" index
-                            self.logger.warning(
-                                f"Index 'id' not found in existing collection {self.collection_name}. Creating it now."
-                            )
-                            self.qdrant_client.create_payload_index(
-                                collection_name=self.collection_name,
-                                field_name="id",
-                                field_schema=rest.PayloadSchemaType.KEYWORD,
-                                wait=True,
-                            )
-                            self.logger.info(
-                                f"Created missing keyword index for 'id' field."
-                            )
-                    except Exception as check_index_e:
-                        self.logger.error(
-                            f"Error checking/creating index for existing collection: {check_index_e}",
-                            exc_info=True,
-                        )
-                        # Handle error appropriately, maybe log and continue
-
-            except Exception as e:
-                self.logger.error(f"Error checking or creating collection: {str(e)}")
-                raise
+            self.needs_migration = qdrant_registry.ensure_collection(
+                self.collection_name,
+                self.embedding_size,
+                self.rescore_size,
+            )
 
             # Initialize Qdrant vector store with LangChain
-            # self.vector_store = Qdrant( # Deprecated usage
-            # Initialize Qdrant vector store with LangChain
-            if not getattr(self, "needs_migration", False):
-                self.vector_store = QdrantVectorStore(  # Correct usage
+            if not self.needs_migration:
+                self.vector_store = QdrantVectorStore(
                     client=self.qdrant_client,
                     collection_name=self.collection_name,
-                    embedding=base_embeddings,  # Correct argument name is 'embedding'
-                    vector_name="dense", # Specify the named vector
+                    embedding=self.base_embeddings,
+                    vector_name="dense",  # Specify the named vector
+                    # The dense index may hold a reduced-dimension prefix of the model output
+                    validate_collection_config=False,
                 )
             else:
                 self.logger.info("Skipping QdrantVectorStore initialization due to pending migration.")
                 self.vector_store = None
 
             # Verify collection initialization by getting count
-            try:
-                count = self.qdrant_client.count(
-                    collection_name=self.collection_name, exact=True
-                ).count
-                self.logger.debug(
-                    f"Collection verification successful. Current document count: {count}"
-                )
-                if count == 0:
-                    self.logger.warning(
-                        "Collection is empty - this might indicate data loss"
-                    )
-            except Exception as verify_e:
-                self.logger.error(f"Collection verification failed: {str(verify_e)}")
-                raise
+            count = self.qdrant_client.count(
+                collection_name=self.collection_name, exact=True
+            ).count
+            self.logger.debug(
+                f"Collection verification successful. Current document count: {count}"
+            )
 
             self.logger.info(
                 f"Successfully initialized vector store with collection: {self.collection_name}"
             )
 
         except Exception as e:
+            qdrant_registry.release(self.logical_collection_name)
+            self.qdrant_client = None
             self.logger.error(
                 f"Error initializing Qdrant vector store: {str(e)}", exc_info=True
             )
             raise
 
-        # Removed backup_dir and backup_file initialization
-
-    # Removed _backup_item method
+    @property
+    def dense_cache_model(self) -> str:
+        # Full-dimension vectors are cached; reduced ones are derived from them locally
+        return f"{self.embeddings_model}@{self.full_embedding_size}"
+
+    @property
+    def rescore_size(self) -> Optional[int]:
+        """Size of the stored full-dimension rescoring vector, or None when not kept."""
+        return self.full_embedding_size if self.dense_rescoring else None
+
+    def _reduce_dense(self, vector: List[float]) -> List[float]:
+        """Matryoshka prefix of a full embedding, renormalized to unit length."""
+        if self.embedding_size >= len(vector):
+            return vector
+        prefix = vector[: self.embedding_size]
+        norm = sum(x * x for x in prefix) ** 0.5
+        return [x / norm for x in prefix] if norm else prefix
+
+    def _dense_vectors(self, full_vector: List[float]) -> Dict[str, List[float]]:
+        """Named dense vectors to store for one point."""
+        vectors = {"dense": self._reduce_dense(full_vector)}
+        if self.dense_rescoring:
+            vectors["dense_full"] = full_vector
+        return vectors
+
+    def _hybrid_prefetch(
+        self, dense_vector: List[float], sparse_vector, limit: int, qdrant_filter
+    ) -> List[rest.Prefetch]:
+        """
+        Prefetches fused by a hybrid query. While a migration is pending the live
+        collection's dense layout doesn't match the current model, so only the
+        model-independent sparse side is searched until the rebuilt index is swapped in.
+        """
+        sparse = rest.Prefetch(
+            query=sparse_vector, using="sparse", limit=limit, filter=qdrant_filter
+        )
+        if self.needs_migration:
+            return [sparse]
+        return [self._dense_prefetch(dense_vector, limit, qdrant_filter), sparse]
 
-    async def get_count(self) -> int:
-        """Returns the current number of documents in the collection."""
-        try:
-             # Use run_in_executor for async context
-             count = await asyncio.get_running_loop().run_in_executor(
-                 None,
-                 lambda: self.qdrant_client.count(
-                    collection_name=self.collection_name, exact=True
-                ).count
-             )
-             return count
-        except:
-            return 0
+    def _dense_prefetch(self, query_vector: List[float], limit: int, qdrant_filter) -> rest.Prefetch:
+        """
+        Dense side of a hybrid query. With rescoring, the reduced index supplies
+        RESCORE_CANDIDATE_FACTOR x limit candidates that are re-ranked by the
+        full-dimension vector before fusion.
+        """
+        reduced = rest.Prefetch(
+            query=self._reduce_dense(query_vector),
+            using="dense",
+            limit=limit * RESCORE_CANDIDATE_FACTOR if self.dense_rescoring else limit,
+            filter=qdrant_filter,
+        )
+        if not self.dense_rescoring:
+            return reduced
+        return rest.Prefetch(
+            prefetch=[reduced],
+            query=query_vector,
+            using="dense_full",
+            limit=limit,
+            filter=qdrant_filter,
+        )
 
-    async def add_to_knowledge_base(
-        self, text: str, metadata: Dict[str, Any] = None
-    ) -> str:
-        """Add single text to the vector store."""
-        try:
-            # Add to vector store
-            ids = await self.add_texts(
-                [text], [metadata] if metadata is not None else None
+    def _embed_dense_cached(self, texts: List[str]) -> List[List[float]]:
+        """Dense document embeddings, served from the local embedding cache where possible. Blocking."""
+        hashes = [content_hash(text) for text in texts]
+        cached = embedding_cache.get_dense(self.dense_cache_model, hashes)
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), computed))
+            embedding_cache.put_dense(self.dense_cache_model, fresh)
+            cached.update(fresh)
+        if len(texts) > len(missing):
+            self.logger.debug(
+                f"Dense embedding cache: {len(texts) - len(missing)}/{len(texts)} hits"
             )
-            embedding_id = ids[0]
+        return [cached[h] for h in hashes]
+
+    def _embed_sparse_cached(self, texts: List[str]) -> List[rest.SparseVector]:
+        """Sparse (BM25) document embeddings, served from the local embedding cache where possible. Blocking."""
+        hashes = [content_hash(text) for text in texts]
+        cached = embedding_cache.get_sparse(SPARSE_MODEL_NAME, hashes)
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            # fastembed returns a generator, so we convert to list
+            computed = list(self.sparse_embedding_model.embed(list(missing.values())))
+            fresh = {
+                h: (vec.indices.tolist(), vec.values.tolist())
+                for h, vec in zip(missing.keys(), computed)
+            }
+            embedding_cache.put_sparse(SPARSE_MODEL_NAME, fresh)
+            cached.update(fresh)
+        return [
+            rest.SparseVector(indices=cached[h][0], values=cached[h][1]) for h in hashes
+        ]
 
-            # Removed backup call
+    async def _embed_query(self, query_text: str) -> tuple:
+        """Returns (dense, sparse) query embeddings, shared through the process-wide query cache."""
 
-            return embedding_id
-        except Exception as e:
-            self.logger.error(f"Error adding to knowledge base: {str(e)}")
-            raise
+        async def compute():
+            loop = asyncio.get_running_loop()
+            dense, sparse = await asyncio.gather(
+                loop.run_in_executor(None, self.embeddings.embed_query, query_text),
+                loop.run_in_executor(
+                    None, lambda: list(self.sparse_embedding_model.embed([query_text]))[0]
+                ),
+            )
+            return dense, rest.SparseVector(
+                indices=sparse.indices.tolist(), values=sparse.values.tolist()
+            )
 
-    async def delete_from_knowledge_base(self, embedding_id: str):
-        try:
-            self.logger.info(f"Attempting to delete embedding ID: {embedding_id}")
+        return await query_embedding_cache.get_or_compute(
+            (self.dense_cache_model, SPARSE_MODEL_NAME, query_text), compute
+        )
 
-            # Check if point exists before deletion
-            try:
-                points = await asyncio.get_running_loop().run_in_executor(
-                    None,
-                    lambda: self.qdrant_client.retrieve(
-                        collection_name=self.collection_name,
-                        ids=[embedding_id],
-                        with_payload=True,
-                    ),
-                )
-                if not points or len(points) == 0:
-                    self.logger.warning(
-                        f"Document with embedding ID {embedding_id} not found in collection"
-                    )
-                    return False  # Return false to indicate deletion was not performed
-            except Exception as inner_e:
-                self.logger.error(
-                    f"Error checking document existence: {str(inner_e)}", exc_info=True
-                )
-                raise
+    async def _embed_queries(self, query_texts: List[str]) -> List[tuple]:
+        """Batch variant of _embed_query: all uncached queries share one dense and one sparse call."""
 
-            # Proceed with deletion
-            self.logger.debug(
-                f"Attempting to execute delete operation for ID: {embedding_id}"
+        async def compute_many(keys):
+            texts = [key[2] for key in keys]
+            loop = asyncio.get_running_loop()
+            dense, sparse = await asyncio.gather(
+                loop.run_in_executor(None, self.embeddings.embed_documents, texts),
+                loop.run_in_executor(
+                    None, lambda: list(self.sparse_embedding_model.embed(texts))
+                ),
             )
-            try:
-                await asyncio.get_running_loop().run_in_executor(
-                    None,
-                    lambda: self.qdrant_client.delete(
-                        collection_name=self.collection_name,
-                        points_selector=PointIdsList(points=[embedding_id]),
-                        wait=True,  # Ensure deletion completes before returning
+            return [
+                (
+                    dense_vector,
+                    rest.SparseVector(
+                        indices=sparse_vector.indices.tolist(),
+                        values=sparse_vector.values.tolist(),
                     ),
                 )
-                self.logger.info(f"Successfully deleted embedding ID: {embedding_id}")
-                return True  # Return true to indicate successful deletion
-            except Exception as delete_e:
-                self.logger.error(
-                    f"Error during delete operation: {str(delete_e)}", exc_info=True
-                )
-                raise
-
-        except Exception as e:
-            self.logger.error(
-                f"Error deleting embedding ID {embedding_id}: {str(e)}", exc_info=True
-            )
-            raise  # Re-raise to let caller handle the error
-
-    async def update_in_knowledge_base(
-        self, doc_id: str, new_content: str = None, new_metadata: Dict[str, Any] = None
-    ):
-        """Single unified method for updating documents."""
-        try:
-            if not (new_content or new_metadata):
-                self.logger.warning(
-                    f"No new content or metadata provided for update. Doc ID: {doc_id}"
-                )
-                return
+                for dense_vector, sparse_vector in zip(dense, sparse)
+            ]
 
-            loop = asyncio.get_running_loop()
+        return await query_embedding_cache.get_or_compute_many(
+            [(self.dense_cache_model, SPARSE_MODEL_NAME, text) for text in query_texts],
+            compute_many,
+        )
 
-            # Prepare update data
-            update_data = {}
-            current_metadata = {}
-            current_vector = None
 
-            # Try to get existing point data
-            try:
-                points = await loop.run_in_executor(
-                    None,
-                    lambda: self.qdrant_client.retrieve(
-                        collection_name=self.collection_name,
-                        ids=[doc_id],
-                        with_payload=True,
-                        with_vectors=True,  # Also get the existing vector
-                    ),
-                )
-                if points and len(points) > 0:
-                    current_metadata = points[0].payload
-                    current_vector = points[0].vector
-            except Exception as e:
-                self.logger.debug(
-                    f"Could not retrieve existing point (this is OK for new points): {e}"
-                )
+    # Removed _backup_item method
 
-            # Update metadata
-            if new_metadata:
-                new_metadata["user_id"] = self.user_id
-                new_metadata["project_id"] = self.project_id
-                for key, value in new_metadata.items():
-                    if value is None and key in current_metadata:
-                        current_metadata.pop(key, None)
-                    else:
-                        current_metadata[key] = value
+    def _payload_selector(
+        self, payload_fields: Optional[List[str]], max_snippet_chars: Optional[int]
+    ):
+        """Builds the Qdrant payload selector for a search with optional projection/snippets."""
+        use_snippet = (
+            max_snippet_chars is not None and max_snippet_chars <= SNIPPET_PAYLOAD_CHARS
+        )
+        content_fields = ["page_snippet"] if use_snippet else ["page_content"]
+        if payload_fields is not None:
+            return rest.PayloadSelectorInclude(
+                include=list(dict.fromkeys([*payload_fields, *content_fields]))
+            )
+        if use_snippet:
+            return rest.PayloadSelectorExclude(exclude=["page_content"])
+        return True
+
+    @staticmethod
+    def _split_payload(payload: Dict[str, Any], max_snippet_chars: Optional[int] = None):
+        """Pops the stored text out of a payload, trimmed to max_snippet_chars. Returns (text, metadata)."""
+        page_content = payload.pop("page_content", None)
+        page_snippet = payload.pop("page_snippet", None)
+        text = page_content if page_content is not None else (page_snippet or "")
+        if max_snippet_chars is not None:
+            text = text[:max_snippet_chars]
+        return text, payload
+
+    async def _fill_missing_snippets(
+        self, results: List[Any], max_snippet_chars: Optional[int]
+    ):
+        """Points written before page_snippet existed only have page_content; fetch just that."""
+        if max_snippet_chars is None or max_snippet_chars > SNIPPET_PAYLOAD_CHARS:
+            return
+        missing = list(
+            dict.fromkeys(
+                p.id for p in results if p.payload is not None and "page_snippet" not in p.payload
+            )
+        )
+        if not missing:
+            return
+        points = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: self.qdrant_client.retrieve(
+                collection_name=self.collection_name,
+                ids=missing,
+                with_payload=rest.PayloadSelectorInclude(include=["page_content"]),
+            ),
+        )
+        texts = {
+            str(p.id): (p.payload or {}).get("page_content", "")[:max_snippet_chars]
+            for p in points
+        }
+        for result in results:
+            if str(result.id) in texts:
+                result.payload["page_snippet"] = texts[str(result.id)]
 
-            # Get vector - either from new content or use existing
-            vector_struct = None
-            
-            if new_content:
-                # Compute new embeddings (DENSE)
-                dense_vector = await loop.run_in_executor(
-                    None, lambda: self.embeddings.embed_documents([new_content])[0]
-                )
-                # Compute new embeddings (SPARSE)
-                # fastembed returns generator of SparseEmbedding, we need list
-                sparse_embedding_gen = await loop.run_in_executor(
-                    None, lambda: list(self.sparse_embedding_model.embed([new_content]))
-                )
-                sparse_vector_data = sparse_embedding_gen[0]
-                
-                # Construct Hybrid Vector
-                vector_struct = {
-                    "dense": dense_vector,
-                    "sparse": rest.SparseVector(
-                        indices=sparse_vector_data.indices.tolist(),
-                        values=sparse_vector_data.values.tolist()
-                    )
-                }
-                current_metadata["page_content"] = new_content
-                
-            elif current_vector is not None:
-                # Use existing vector if no new content
-                # Warning: If existing vector was old (dense-only), this keeps it old.
-                # Ideally we should re-embed if it's not a dict, but for now preserve existing.
-                vector_struct = current_vector
-                
-            else:
-                # Fallback: metadata as content
-                fallback_text = json.dumps(current_metadata)
-                
-                dense_vector = await loop.run_in_executor(
-                    None, lambda: self.embeddings.embed_documents([fallback_text])[0]
-                )
-                sparse_embedding_gen = await loop.run_in_executor(
-                    None, lambda: list(self.sparse_embedding_model.embed([fallback_text]))
-                )
-                sparse_vector_data = sparse_embedding_gen[0]
-                
-                vector_struct = {
-                    "dense": dense_vector,
-                    "sparse": rest.SparseVector(
-                        indices=sparse_vector_data.indices.tolist(),
-                        values=sparse_vector_data.values.tolist()
-                    )
-                }
-                self.logger.warning(
-                    f"Generated fallback Hybrid vector for doc {doc_id} using metadata as content"
+    def _points_to_documents(
+        self, points: List[Any], max_snippet_chars: Optional[int] = None
+    ) -> List[Document]:
+        """Converts scored points into Documents (page_content popped from the payload)."""
+        documents = []
+        for scored_point in points:
+            if hasattr(scored_point, "payload") and scored_point.payload:
+                # Extract page_content and metadata from payload
+                page_content, metadata = self._split_payload(
+                    scored_point.payload, max_snippet_chars
                 )
+                documents.append(Document(page_content=page_content, metadata=metadata))
+        return documents
 
-            # Create point with required vector
-            point_to_upsert = rest.PointStruct(
-                id=doc_id, vector=vector_struct, payload=current_metadata
-            )
+    async def get_count(self) -> int:
+        """Returns the current number of documents in the collection."""
+        try:
+             # Use run_in_executor for async context
+             count = await asyncio.get_running_loop().run_in_executor(
+                 None,
+                 lambda: self.qdrant_client.count(
+                    collection_name=self.collection_name, exact=True
+                ).count
+             )
+             return count
+        except:
+            return 0
 
-            # Perform upsert
-            await loop.run_in_executor(
-                None,
-                lambda: self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=[point_to_upsert],
-                    wait=True,  # Ensure the operation completes before returning
-                ),
+    async def add_to_knowledge_base(
+        self, text: str, metadata: Dict[str, Any] = None
+    ) -> str:
+        """Add single text to the vector store."""
+        try:
+            # Add to vector store
+            ids = await self.add_texts(
+                [text], [metadata] if metadata is not None else None
             )
+            embedding_id = ids[0]
 
-            self.logger.info(f"Successfully updated document with ID: {doc_id}")
-            return True  # Return success indicator
+            # Removed backup call
 
+            return embedding_id
         except Exception as e:
-            self.logger.error(f"Error updating doc ID: {doc_id}. Error: {str(e)}")
+            self.logger.error(f"Error adding to knowledge base: {str(e)}")
             raise
 
-    async def similarity_search(
-        self, query_text: str, k: int = 4, filter: Optional[Dict[str, Any]] = None
-    ) -> List[Document]:
-        """Search for similar documents."""
+    async def delete_from_knowledge_base(self, embedding_id: str):
         try:
-            # Convert the filter dict to Qdrant's filter format
-            qdrant_filter = None
-            if filter:
-                must_conditions = []
-                must_not_conditions = []
-
-                for key, value in filter.items():
-                    if isinstance(value, dict):
-                        # Handle special operators
-                        for op, val in value.items():
-                            if op == "$eq":
-                                must_conditions.append(
-                                    FieldCondition(key=key, match=MatchValue(value=val))
-                                )
-                            elif op == "$ne":
-                                must_not_conditions.append(
-                                    FieldCondition(key=key, match=MatchValue(value=val))
-                                )
-                            elif op == "$in":
-                                must_conditions.append(
-                                    FieldCondition(key=key, match=MatchAny(any=val))
-                                )
-                            elif op == "$nin":
-                                must_not_conditions.append(
-                                    FieldCondition(key=key, match=MatchAny(any=val))
-                                )
-                    else:
-                        # Simple equality match
-                        must_conditions.append(
-                            FieldCondition(key=key, match=MatchValue(value=value))
-                        )
+            self.logger.info(f"Attempting to delete embedding ID: {embedding_id}")
 
-                if must_conditions or must_not_conditions:
-                    qdrant_filter = Filter(
-                        must=must_conditions if must_conditions else None,
-                        must_not=must_not_conditions if must_not_conditions else None,
+            # Check if point exists before deletion
+            try:
+                points = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    lambda: self.qdrant_client.retrieve(
+                        collection_name=self.collection_name,
+                        ids=[embedding_id],
+                        with_payload=True,
+                    ),
+                )
+                if not points or len(points) == 0:
+                    self.logger.warning(
+                        f"Document with embedding ID {embedding_id} not found in collection"
                     )
+                    return False  # Return false to indicate deletion was not performed
+            except Exception as inner_e:
+                self.logger.error(
+                    f"Error checking document existence: {str(inner_e)}", exc_info=True
+                )
+                raise
 
-            # Get embeddings for the query
-            query_embedding = await asyncio.get_running_loop().run_in_executor(
-                None, self.embeddings.embed_query, query_text
-            )
-
-            # Search in Qdrant
-            search_result = await asyncio.get_running_loop().run_in_executor(
-                None,
-                lambda: self.qdrant_client.search(
-                    collection_name=self.collection_name,
-                    query_vector=query_embedding,
-                    limit=k,
-                    query_filter=qdrant_filter,  # Use query_filter instead of filter
-                ),
+            # Proceed with deletion
+            self.logger.debug(
+                f"Attempting to execute delete operation for ID: {embedding_id}"
             )
-
-            # Convert results to Documents
-            documents = []
-            for scored_point in search_result:
-                if hasattr(scored_point, "payload") and scored_point.payload:
-                    # Extract page_content and metadata from payload
-                    page_content = scored_point.payload.pop("page_content", "")
-                    metadata = scored_point.payload
-
-                    documents.append(
-                        Document(page_content=page_content, metadata=metadata)
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    lambda: self.qdrant_client.delete(
+                        collection_name=self.collection_name,
+                        points_selector=PointIdsList(points=[embedding_id]),
+                        wait=True,  # Ensure deletion completes before returning
+                    ),
+                )
+                if points[0].payload and points[0].payload.get("chunked"):
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._delete_chunks_sync, embedding_id
                     )
-
-            return documents
+                self._unindex_names([embedding_id])
+                self.logger.info(f"Successfully deleted embedding ID: {embedding_id}")
+                return True  # Return true to indicate successful deletion
+            except Exception as delete_e:
+                self.logger.error(
+                    f"Error during delete operation: {str(delete_e)}", exc_info=True
+                )
+                raise
 
         except Exception as e:
-            self.logger.error(f"Error in similarity_search: {str(e)}")
-            raise
+            self.logger.error(
+                f"Error deleting embedding ID {embedding_id}: {str(e)}", exc_info=True
+            )
+            raise  # Re-raise to let caller handle the error
 
     def _build_qdrant_filter(
         self, filter_dict: Dict[str, Any] = None
     ) -> Optional[Filter]:
-        """Convert API filter dict to Qdrant Filter object"""
-        if not filter_dict:
-            # Base filter for user and project
-            return Filter(
-                must=[
-                    FieldCondition(key="user_id", match=MatchValue(value=self.user_id)),
-                    FieldCondition(
-                        key="project_id", match=MatchValue(value=self.project_id)
-                    ),
-                ]
-            )
-
+        """
+        Convert API filter dict to Qdrant Filter object.
+        Values are matched for equality; dict values support $eq, $ne, $in and $nin.
+        The user and project conditions are always applied.
+        """
         # Start with user and project filter conditions
         must_conditions = [
             FieldCondition(key="user_id", match=MatchValue(value=self.user_id)),
             FieldCondition(key="project_id", match=MatchValue(value=self.project_id)),
         ]
+        must_not_conditions = []
 
-        # Handle special case for type filtering
-        if "type" in filter_dict:
-            if isinstance(filter_dict["type"], dict):
-                # Handle $nin operator by converting to $neq for each value
-                if "$nin" in filter_dict["type"]:
-                    for val in filter_dict["type"]["$nin"]:
-                        must_not_condition = FieldCondition(
-                            key="type", match=MatchValue(value=val)
+        for key, value in (filter_dict or {}).items():
+            if isinstance(value, dict):
+                # Handle special operators
+                for op, val in value.items():
+                    if op == "$eq":
+                        must_conditions.append(
+                            FieldCondition(key=key, match=MatchValue(value=val))
+                        )
+                    elif op == "$ne":
+                        must_not_conditions.append(
+                            FieldCondition(key=key, match=MatchValue(value=val))
                         )
-                        # Add a must_not condition to filter
-                        return Filter(
-                            must=must_conditions, must_not=[must_not_condition]
+                    elif op == "$in":
+                        must_conditions.append(
+                            FieldCondition(key=key, match=MatchAny(any=list(val)))
+                        )
+                    elif op == "$nin":
+                        must_not_conditions.append(
+                            FieldCondition(key=key, match=MatchAny(any=list(val)))
                         )
-                # Other operators can be handled similarly
+                    else:
+                        self.logger.warning(f"Unsupported filter operator '{op}' on '{key}'")
             else:
                 # Simple equality match
                 must_conditions.append(
-                    FieldCondition(
-                        key="type", match=MatchValue(value=filter_dict["type"])
-                    )
+                    FieldCondition(key=key, match=MatchValue(value=value))
                 )
 
-        # Add any other filter conditions (simplified implementation)
-        for key, value in filter_dict.items():
-            if key != "type":  # Skip 'type' as it's already handled
-                if isinstance(value, dict):
-                    # Operators not fully implemented in this basic version
-                    pass
-                else:
-                    must_conditions.append(
-                        FieldCondition(key=key, match=MatchValue(value=value))
-                    )
+        return Filter(
+            must=must_conditions,
+            must_not=must_not_conditions if must_not_conditions else None,
+        )
+
+    def _scan_filter(self, filter: Optional[Dict[str, Any]], include_chunks: bool) -> Filter:
+        qdrant_filter = self._build_qdrant_filter(filter)
+        if not include_chunks:
+            qdrant_filter.must_not = (qdrant_filter.must_not or []) + [
+                FieldCondition(key="point_kind", match=MatchValue(value="chunk"))
+            ]
+        return qdrant_filter
+
+    async def scan_payload(
+        self,
+        fields: List[str],
+        filter: Optional[Dict[str, Any]] = None,
+        include_chunks: bool = False,
+        page_size: int = 256,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lists payload fields of every matching point without running a similarity search.
+        Uses filtered scroll with payload projection and no vectors, so it costs no
+        embedding calls and has no result cap. Each row also carries "point_id".
+        """
+        qdrant_filter = self._scan_filter(filter, include_chunks)
+
+        def scan():
+            rows = []
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=qdrant_filter,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=rest.PayloadSelectorInclude(include=list(fields)),
+                    with_vectors=False,
+                )
+                for point in points:
+                    rows.append({"point_id": str(point.id), **(point.payload or {})})
+                if offset is None:
+                    return rows
+
+        return await asyncio.get_running_loop().run_in_executor(None, scan)
+
+    async def iter_payload(
+        self,
+        fields: List[str],
+        filter: Optional[Dict[str, Any]] = None,
+        include_chunks: bool = False,
+        page_size: int = 256,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Same rows as scan_payload, yielded one scroll page at a time."""
+        qdrant_filter = self._scan_filter(filter, include_chunks)
+        loop = asyncio.get_running_loop()
+        offset = None
+        while True:
+            points, offset = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    self.qdrant_client.scroll,
+                    collection_name=self.collection_name,
+                    scroll_filter=qdrant_filter,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=rest.PayloadSelectorInclude(include=list(fields)),
+                    with_vectors=False,
+                ),
+            )
+            yield [{"point_id": str(point.id), **(point.payload or {})} for point in points]
+            if offset is None:
+                return
+
+    async def get_entity_names(self, types: Optional[List[str]] = None) -> Set[str]:
+        """
+        Returns the normalized names of indexed entities, optionally limited to some types.
+        Served from an in-memory index built once with scan_payload and kept current by
+        this store's add/update/delete methods.
+        """
+        if self._name_index is None:
+            rows = await self.scan_payload(fields=["name", "type"])
+            self._name_index = {}
+            self._index_names((row["point_id"], row) for row in rows)
+            self.logger.debug(
+                f"Built name index for {self.collection_name} ({len(self._name_index)} entries)"
+            )
+        type_filter = set(types) if types else None
+        return {
+            name
+            for item_type, name in self._name_index.values()
+            if type_filter is None or item_type in type_filter
+        }
 
-        return Filter(must=must_conditions)
+    def _index_names(self, entries):
+        """Records (point_id, payload) pairs in the name index, if it has been built."""
+        if self._name_index is None:
+            return
+        for point_id, payload in entries:
+            if not payload or payload.get("point_kind") == "chunk":
+                continue
+            name = normalize_entity_name(payload.get("name"))
+            if name:
+                self._name_index[str(point_id)] = (payload.get("type"), name)
+            else:
+                self._name_index.pop(str(point_id), None)
+
+    def _unindex_names(self, point_ids):
+        if self._name_index is None:
+            return
+        for point_id in point_ids:
+            self._name_index.pop(str(point_id), None)
 
     async def _search_with_relevance(
-        self, query: str, k: int, filter: Optional[Filter] = None
+        self,
+        query: str,
+        k: int,
+        filter: Optional[Filter] = None,
+        payload_fields: Optional[List[str]] = None,
+        max_snippet_chars: Optional[int] = None,
     ) -> List[Document]:
         loop = asyncio.get_running_loop()
 
         # Get embedding for query
-        query_vector = await loop.run_in_executor(
-            None, self.embeddings.embed_query, query
-        )
+        query_vector, _ = await self._embed_query(query)
 
         # Prepare search parameters
         search_params = {
             "collection_name": self.collection_name,
-            "query_vector": query_vector,
+            "query_vector": rest.NamedVector(
+                name="dense", vector=self._reduce_dense(query_vector)
+            ),
             "limit": k,
-            "with_payload": True,
+            "with_payload": self._payload_selector(payload_fields, max_snippet_chars),
         }
 
         # Only add filter if it's not None
         if filter is not None:
-            search_params["filter"] = filter
+            search_params["query_filter"] = filter
 
         # Search with Qdrant native client for more control
         search_results = await loop.run_in_executor(
             None, lambda: self.qdrant_client.search(**search_params)
         )
+        await self._fill_missing_snippets(search_results, max_snippet_chars)
 
         # Convert to Document objects
         documents = []
         for result in search_results:
             # Extract payload/metadata
-            payload = result.payload
-            page_content = payload.pop("page_content", "")
+            page_content, payload = self._split_payload(
+                result.payload or {}, max_snippet_chars
+            )
 
             # Add score to metadata
             payload["relevance_score"] = result.score
@@ -727,17 +1291,21 @@ class VectorStore:
         return documents
 
     async def get_knowledge_base_content(self) -> List[Dict[str, Any]]:
+        await self._flush_pending_writes()
         loop = asyncio.get_running_loop()
 
         try:
-            # Define the server-side filter
+            # Define the server-side filter (chunks are listed through their parent)
             qdrant_filter = Filter(
                 must=[
                     FieldCondition(key="user_id", match=MatchValue(value=self.user_id)),
                     FieldCondition(
                         key="project_id", match=MatchValue(value=self.project_id)
                     ),
-                ]
+                ],
+                must_not=[
+                    FieldCondition(key="point_kind", match=MatchValue(value="chunk"))
+                ],
             )
 
             # Get points using the filter
@@ -776,7 +1344,7 @@ class VectorStore:
             for point in points:  # Process points directly from Qdrant response
                 payload = point.payload
                 # page_content might be missing if only metadata was stored for some items
-                page_content = payload.pop("page_content", "")
+                page_content, payload = self._split_payload(payload)
                 content.append(
                     {"id": point.id, "metadata": payload, "page_content": page_content}
                 )
@@ -810,62 +1378,6 @@ class VectorStore:
         else:
             return {}
 
-    async def update_doc(
-        self, doc_id: str, content: str, metadata: Optional[Dict[str, Any]] = None
-    ) -> str:
-        """Update a document in the vector store."""
-        try:
-            self.logger.debug(f"Updating document with ID: {doc_id}")
-
-            # Verify document exists
-            try:
-                point = await asyncio.get_running_loop().run_in_executor(
-                    None,
-                    lambda: self.qdrant_client.retrieve(
-                        collection_name=self.collection_name,
-                        ids=[doc_id],
-                        with_payload=True,
-                    ),
-                )
-                if not point:
-                    self.logger.warning(f"Document {doc_id} not found in collection")
-                    raise ValueError(f"Document {doc_id} not found in collection")
-            except Exception as e:
-                self.logger.error(f"Error getting existing document: {str(e)}")
-                raise
-
-            # Generate embeddings for new content
-            new_vector = await asyncio.get_running_loop().run_in_executor(
-                None, lambda: self.embeddings.embed_documents([content])[0]
-            )
-
-            # Prepare metadata payload
-            if metadata is None:
-                metadata = {}
-
-            # Make sure page_content is in the payload
-            metadata["page_content"] = content
-            metadata["user_id"] = self.user_id
-            metadata["project_id"] = self.project_id
-
-            # Update the point
-            await asyncio.get_running_loop().run_in_executor(
-                None,
-                lambda: self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=[
-                        PointStruct(id=doc_id, vector=new_vector, payload=metadata)
-                    ],
-                ),
-            )
-
-            self.logger.debug(f"Updated document with ID: {doc_id}")
-            return doc_id
-
-        except Exception as e:
-            self.logger.error(f"Error updating doc ID: {doc_id}. Error: {str(e)}")
-            raise
-
     async def update_or_remove_from_knowledge_base(
         self,
         doc_id: str,
@@ -883,6 +1395,10 @@ class VectorStore:
                         collection_name=self.collection_name, points_selector=[doc_id]
                     ),
                 )
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._delete_chunks_sync, doc_id
+                )
+                self._unindex_names([doc_id])
                 return None
             else:
                 # Update the document
@@ -903,22 +1419,38 @@ class VectorStore:
 
         # Store content in metadata for Qdrant
         metadata["page_content"] = new_content
+        metadata["page_snippet"] = new_content[:SNIPPET_PAYLOAD_CHARS]
+        metadata["content_hash"] = content_hash(new_content)
         metadata["user_id"] = self.user_id
         metadata["project_id"] = self.project_id
 
-        # Generate new embedding
-        new_vector = await asyncio.get_running_loop().run_in_executor(
-            None, lambda: self.embeddings.embed_documents([new_content])[0]
+        # Generate new embeddings (dense + sparse, cached by content)
+        loop = asyncio.get_running_loop()
+        new_dense_vector = await loop.run_in_executor(
+            None, lambda: self._embed_dense_cached([new_content])[0]
+        )
+        new_sparse_vector = await loop.run_in_executor(
+            None, lambda: self._embed_sparse_cached([new_content])[0]
         )
 
         # Update the document
-        await asyncio.get_running_loop().run_in_executor(
+        await loop.run_in_executor(
             None,
             lambda: self.qdrant_client.upsert(
                 collection_name=self.collection_name,
-                points=[PointStruct(id=doc_id, vector=new_vector, payload=metadata)],
+                points=[
+                    PointStruct(
+                        id=doc_id,
+                        vector={
+                            **self._dense_vectors(new_dense_vector),
+                            "sparse": new_sparse_vector,
+                        },
+                        payload=metadata,
+                    )
+                ],
             ),
         )
+        self._index_names([(doc_id, metadata)])
 
     async def clear(self):
         """Clear the collection"""
@@ -926,10 +1458,7 @@ class VectorStore:
         # Delete and recreate collection
         try:
             await loop.run_in_executor(
-                None,
-                lambda: self.qdrant_client.delete_collection(
-                    collection_name=self.collection_name
-                ),
+                None, lambda: qdrant_registry.drop_collection(self.logical_collection_name)
             )
         except Exception as e:
             self.logger.warning(f"Error deleting collection: {str(e)}")
@@ -937,80 +1466,479 @@ class VectorStore:
         # Recreate collection
         await loop.run_in_executor(
             None,
-            lambda: self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=self.embedding_size, distance=Distance.COSINE
-                ),
+            lambda: qdrant_registry.create_collection(
+                self.collection_name,
+                self.embedding_size,
+                self.rescore_size,
             ),
         )
+        self._name_index = None
+        # A reindexed project is now served by a collection under its logical name again
+        self._rebuild_langchain_wrapper()
+
+    def recreate_collection(self):
+        """
+        Deletes and recreates the collection with the correct Hybrid configuration.
+        This is used during the migration process.
+        """
+        try:
+            self.logger.info(f"Recreating collection {self.collection_name} for migration...")
+            qdrant_registry.drop_collection(self.logical_collection_name)
+            qdrant_registry.create_collection(
+                self.collection_name,
+                self.embedding_size,
+                self.rescore_size,
+            )
+            self.logger.info(f"Collection {self.collection_name} recreated successfully.")
+            
+            self.needs_migration = False
+            self._name_index = None
+
+            # Re-initialize the LangChain wrapper now that the collection is correct
+            self._rebuild_langchain_wrapper()
+            self.logger.info("QdrantVectorStore wrapper initialized after recreation.")
+            
+        except Exception as e:
+            self.logger.error(f"Error recreating collection: {e}")
+            raise
+
+    def _rebuild_langchain_wrapper(self):
+        if is_local_embeddings_model(self.embeddings_model):
+            base_embeddings = self.base_embeddings
+        else:
+            base_embeddings = GoogleGenerativeAIEmbeddings(
+                model=self.embeddings_model,
+                google_api_key=self.api_key,
+                task_type="retrieval_document",
+            )
+        self.vector_store = QdrantVectorStore(
+            client=self.qdrant_client,
+            collection_name=self.collection_name,
+            embedding=base_embeddings,
+            vector_name="dense",
+            validate_collection_config=False,
+        )
+
+    def _bound_to(self, physical_collection: str) -> "VectorStore":
+        """Shallow copy of this store that reads and writes another collection (e.g. a reindex shadow)."""
+        clone = copy.copy(self)
+        clone.logical_collection_name = physical_collection
+        clone.vector_store = None
+        clone._name_index = None
+        return clone
+
+    async def reindex(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ) -> Dict[str, Any]:
+        """
+        Rebuilds the whole index into a shadow collection and swaps it in once complete.
+
+        The live collection keeps serving searches until the swap. Items are written in
+        checkpointed batches; each point records the content_hash of its text, so a rerun
+        after a crash or rate limit skips everything already in the shadow and only
+        embeds what is missing or changed. Progress is published through
+        qdrant_registry.reindex_status().
+        """
+        if not (len(texts) == len(metadatas) == len(ids)):
+            raise ValueError("Number of texts, metadatas and IDs must match")
+        loop = asyncio.get_running_loop()
+        logical = self.logical_collection_name
+        shadow_name = qdrant_registry.shadow_name_for(logical)
+        qdrant_registry.set_reindex_progress(
+            logical,
+            status="preparing",
+            shadow_collection=shadow_name,
+            total=len(texts),
+            done=0,
+            skipped=0,
+            started_at=time.time(),
+            error=None,
+        )
+        try:
+            # A shadow left with an outdated config (e.g. dimension change) is rebuilt from scratch
+            if await loop.run_in_executor(
+                None,
+                lambda: qdrant_registry.ensure_collection(
+                    shadow_name,
+                    self.embedding_size,
+                    self.rescore_size,
+                ),
+            ):
+                await loop.run_in_executor(
+                    None, lambda: qdrant_registry.drop_physical(shadow_name)
+                )
+                await loop.run_in_executor(
+                    None,
+                    lambda: qdrant_registry.ensure_collection(
+                        shadow_name,
+                        self.embedding_size,
+                        self.rescore_size,
+                    ),
+                )
+            shadow = self._bound_to(shadow_name)
+
+            expected = {}
+            items = []
+            for text, metadata, item_id in zip(texts, metadatas, ids):
+                point_id = point_key(item_id)
+                expected[point_id] = content_hash(text)
+                items.append((text, dict(metadata), item_id, point_id))
+
+            # Checkpoint: what a previous (interrupted) run already wrote
+            rows = await shadow.scan_payload(
+                ["content_hash", "point_kind", "parent_id", "chunk_count"],
+                include_chunks=True,
+            )
+            chunk_counts: Dict[str, int] = {}
+            for row in rows:
+                if row.get("point_kind") == "chunk" and row.get("parent_id"):
+                    parent_key = point_key(row["parent_id"])
+                    chunk_counts[parent_key] = chunk_counts.get(parent_key, 0) + 1
+            written, complete = set(), set()
+            for row in rows:
+                if row.get("point_kind") == "chunk":
+                    continue
+                written.add(row["point_id"])
+                if row.get("content_hash") != expected.get(row["point_id"]):
+                    continue
+                if row.get("chunk_count") is not None and chunk_counts.get(
+                    row["point_id"], 0
+                ) != row["chunk_count"]:
+                    continue  # Interrupted between the parent and its chunks
+                complete.add(row["point_id"])
+
+            # Items deleted from the project since the shadow was started
+            stale = [point_id for point_id in written if point_id not in expected]
+            if stale:
+                await loop.run_in_executor(None, lambda: shadow._delete_points_sync(stale))
+
+            pending = [item for item in items if item[3] not in complete]
+            qdrant_registry.set_reindex_progress(
+                logical, status="running", done=len(complete), skipped=len(complete)
+            )
+            if complete:
+                self.logger.info(
+                    f"Resuming reindex of {logical} into {shadow_name}: "
+                    f"{len(complete)}/{len(items)} items already checkpointed"
+                )
+
+            done = len(complete)
+            for batch_start in range(0, len(pending), REINDEX_BATCH_ITEMS):
+                batch = pending[batch_start : batch_start + REINDEX_BATCH_ITEMS]
+                # Partially written chunked items are cleared so no chunk of an older version survives
+                rewritten = [item[2] for item in batch if item[3] in written]
+                if rewritten:
+                    await loop.run_in_executor(
+                        None, lambda: [shadow._delete_chunks_sync(p) for p in rewritten]
+                    )
+                plain = [item for item in batch if item[1].get("type") not in CHUNKED_CONTENT_TYPES]
+                chunked = [item for item in batch if item[1].get("type") in CHUNKED_CONTENT_TYPES]
+                if plain:
+                    await shadow.add_texts(
+                        [item[0] for item in plain],
+                        [item[1] for item in plain],
+                        ids=[item[2] for item in plain],
+                    )
+                if chunked:
+                    await shadow.add_chunked_documents(
+                        [item[0] for item in chunked],
+                        [item[1] for item in chunked],
+                        ids=[item[2] for item in chunked],
+                    )
+                done += len(batch)
+                qdrant_registry.set_reindex_progress(logical, done=done)
+                self.logger.info(f"Reindex {logical}: {done}/{len(items)} items")
+
+            qdrant_registry.set_reindex_progress(logical, status="swapping")
+            await loop.run_in_executor(
+                None, lambda: qdrant_registry.swap_collection(logical, shadow_name)
+            )
+            self.needs_migration = False
+            self._name_index = None
+            self._rebuild_langchain_wrapper()
+            qdrant_registry.set_reindex_progress(
+                logical, status="completed", finished_at=time.time()
+            )
+            return qdrant_registry.reindex_status(logical)
+        except asyncio.CancelledError:
+            qdrant_registry.set_reindex_progress(logical, status="interrupted")
+            raise
+        except Exception as e:
+            qdrant_registry.set_reindex_progress(logical, status="failed", error=str(e))
+            self.logger.error(f"Reindex of {logical} failed (live collection untouched): {e}")
+            raise
+
+    def _delete_points_sync(self, point_ids: List[str]):
+        """Deletes points and any chunks parented to them. Blocking."""
+        self.qdrant_client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=point_ids),
+        )
+        for point_id in point_ids:
+            self._delete_chunks_sync(point_id)
 
-    def recreate_collection(self):
+    async def delete_points(self, point_ids: List[str]):
+        """Deletes points (and their chunks) by point ID."""
+        if not point_ids:
+            return
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self._delete_points_sync(point_ids)
+        )
+        self._unindex_names(point_ids)
+
+    async def backfill_content_hashes(self, page_size: int = 256) -> int:
         """
-        Deletes and recreates the collection with the correct Hybrid configuration.
-        This is used during the migration process.
+        Writes the content_hash payload field on points indexed before it existed, so
+        drift checks can compare hashes without transferring page_content again.
+        Only the hash is set; vectors are left untouched. Returns the number of points updated.
         """
-        try:
-            self.logger.info(f"Recreating collection {self.collection_name} for migration...")
-            self.qdrant_client.delete_collection(self.collection_name)
-            
-            # Create the collection with HYBRID config
-            self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config={
-                    "dense": VectorParams(
-                        size=self.embedding_size, 
-                        distance=Distance.COSINE
+        missing_hash = Filter(
+            must=[rest.IsEmptyCondition(is_empty=rest.PayloadField(key="content_hash"))],
+            must_not=[FieldCondition(key="point_kind", match=MatchValue(value="chunk"))],
+        )
+
+        def backfill():
+            updated = 0
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=missing_hash,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=rest.PayloadSelectorInclude(include=["page_content"]),
+                    with_vectors=False,
+                )
+                for point in points:
+                    text = (point.payload or {}).get("page_content")
+                    if text is None:
+                        continue
+                    self.qdrant_client.set_payload(
+                        collection_name=self.collection_name,
+                        payload={"content_hash": content_hash(text)},
+                        points=[point.id],
                     )
-                },
-                sparse_vectors_config={
-                    "sparse": SparseVectorParams(
-                        index=rest.SparseIndexParams(
-                            on_disk=False,
-                        )
+                    updated += 1
+                if offset is None:
+                    return updated
+
+        updated = await asyncio.get_running_loop().run_in_executor(None, backfill)
+        if updated:
+            self.logger.info(f"Backfilled content_hash on {updated} points in {self.collection_name}")
+        return updated
+
+    def _snapshot_header(self) -> Dict[str, Any]:
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "source_collection": self.logical_collection_name,
+            "user_id": self.user_id,
+            "project_id": self.project_id,
+            "dense_model": self.dense_cache_model,
+            "embedding_size": self.embedding_size,
+            "rescore_size": self.rescore_size,
+            "sparse_model": SPARSE_MODEL_NAME,
+            "created_at": time.time(),
+        }
+
+    async def export_snapshot(self, path: str) -> Dict[str, Any]:
+        """
+        Writes every point of the collection (dense, dense_full and sparse vectors plus
+        payload) to a compact snapshot file that import_snapshot can load without
+        re-embedding anything. The file is written under a temporary name and renamed
+        when complete.
+        """
+        await self._flush_pending_writes()
+        header = self._snapshot_header()
+
+        def export():
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            count = 0
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                offset = None
+                while True:
+                    points, offset = self.qdrant_client.scroll(
+                        collection_name=self.collection_name,
+                        limit=SNAPSHOT_BATCH_POINTS,
+                        offset=offset,
+                        with_payload=True,
+                        with_vectors=True,
                     )
-                }
-            )
-            self.logger.info(f"Collection {self.collection_name} recreated successfully.")
-            
-            # Re-create indices
-            self.qdrant_client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="type",
-                field_schema=rest.PayloadSchemaType.KEYWORD,
-                wait=True,
+                    for point in points:
+                        vectors = point.vector if isinstance(point.vector, dict) else {}
+                        record = {"id": str(point.id), "payload": point.payload or {}}
+                        for name in ("dense", "dense_full"):
+                            if vectors.get(name) is not None:
+                                record[name] = _pack(vectors[name])
+                        sparse = vectors.get("sparse")
+                        if sparse is not None:
+                            record["sparse"] = [_pack(sparse.indices, "I"), _pack(sparse.values)]
+                        f.write(json.dumps(record) + "\n")
+                        count += 1
+                    if offset is None:
+                        break
+                f.write(json.dumps({"end": True, "points": count}) + "\n")
+            os.replace(tmp_path, path)
+            return count
+
+        started = time.perf_counter()
+        count = await asyncio.get_running_loop().run_in_executor(None, export)
+        self.logger.info(
+            f"Exported {count} points of {self.collection_name} to {path} "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return {**header, "path": path, "points": count, "bytes": os.path.getsize(path)}
+
+    @staticmethod
+    def read_snapshot_header(path: str) -> Dict[str, Any]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{os.path.basename(path)} is not a supported vector snapshot")
+        return header
+
+    async def import_snapshot(
+        self, path: str, id_map: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Replaces this store's collection with the contents of a snapshot (restore), which
+        may come from another project (clone). Points are loaded into a shadow collection
+        that is swapped in once complete, so the live index serves searches until then.
+
+        user_id/project_id payload fields are rewritten to this store's; id_map optionally
+        maps source IDs (point IDs and the id/parent_id/item_id payload fields) to the
+        IDs of the rows they belong to in this project. The snapshot must come from the
+        same embedding model and dimensions; otherwise a reindex is needed instead.
+        """
+        header = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.read_snapshot_header(path)
+        )
+        expected = {
+            "dense_model": self.dense_cache_model,
+            "embedding_size": self.embedding_size,
+            "rescore_size": self.rescore_size,
+            "sparse_model": SPARSE_MODEL_NAME,
+        }
+        mismatched = [k for k, v in expected.items() if header.get(k) != v]
+        if mismatched:
+            raise ValueError(
+                "Snapshot was built with different embedding settings "
+                f"({', '.join(f'{k}={header.get(k)}' for k in mismatched)}); reindex instead"
             )
-            self.qdrant_client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="user_id",
-                field_schema=rest.PayloadSchemaType.KEYWORD,
-                wait=True,
+        logical = self.logical_collection_name
+        if qdrant_registry.reindex_status(logical).get("status") in (
+            "preparing",
+            "running",
+            "swapping",
+            "restoring",
+        ):
+            raise ValueError(f"A reindex or restore of {logical} is already in progress")
+
+        id_map = {point_key(k): v for k, v in (id_map or {}).items()}
+        loop = asyncio.get_running_loop()
+        shadow_name = qdrant_registry.shadow_name_for(logical)
+        qdrant_registry.set_reindex_progress(
+            logical,
+            status="restoring",
+            shadow_collection=shadow_name,
+            source=os.path.basename(path),
+            done=0,
+            started_at=time.time(),
+            error=None,
+        )
+
+        cancelled = threading.Event()
+
+        def remap(value):
+            if value is None:
+                return value
+            return id_map.get(point_key(value), value)
+
+        def load():
+            # Start from an empty shadow; any unfinished reindex there is superseded
+            qdrant_registry.drop_physical(shadow_name)
+            qdrant_registry.ensure_collection(
+                shadow_name, self.embedding_size, self.rescore_size
             )
-            self.qdrant_client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="project_id",
-                field_schema=rest.PayloadSchemaType.KEYWORD,
-                wait=True,
+            count = 0
+            trailer = None
+            batch = []
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                f.readline()
+                for line in f:
+                    record = json.loads(line)
+                    if record.get("end"):
+                        trailer = record
+                        break
+                    payload = record["payload"]
+                    payload["user_id"] = self.user_id
+                    payload["project_id"] = self.project_id
+                    for field in ("id", "parent_id", "item_id"):
+                        if field in payload:
+                            payload[field] = remap(payload[field])
+                    vector = {
+                        name: _unpack(record[name])
+                        for name in ("dense", "dense_full")
+                        if name in record
+                    }
+                    if "sparse" in record:
+                        indices, values = record["sparse"]
+                        vector["sparse"] = rest.SparseVector(
+                            indices=_unpack(indices, "I"), values=_unpack(values)
+                        )
+                    batch.append(
+                        PointStruct(id=remap(record["id"]), vector=vector, payload=payload)
+                    )
+                    if len(batch) >= SNAPSHOT_BATCH_POINTS:
+                        if cancelled.is_set():
+                            return count
+                        self.qdrant_client.upsert(collection_name=shadow_name, points=batch)
+                        count += len(batch)
+                        batch = []
+                        qdrant_registry.set_reindex_progress(logical, done=count)
+            if batch:
+                self.qdrant_client.upsert(collection_name=shadow_name, points=batch)
+                count += len(batch)
+            if trailer is None or trailer.get("points") != count:
+                raise ValueError(f"Snapshot {os.path.basename(path)} is truncated")
+            return count
+
+        try:
+            count = await loop.run_in_executor(None, load)
+            qdrant_registry.set_reindex_progress(logical, status="swapping", done=count)
+            await loop.run_in_executor(
+                None, lambda: qdrant_registry.swap_collection(logical, shadow_name)
             )
-            
             self.needs_migration = False
-
-            # Re-initialize the LangChain wrapper now that the collection is correct
-            base_embeddings = GoogleGenerativeAIEmbeddings(
-                model=self.embeddings_model,
-                google_api_key=self.api_key,
-                task_type="retrieval_document",
+            self._name_index = None
+            self._rebuild_langchain_wrapper()
+            qdrant_registry.set_reindex_progress(
+                logical, status="completed", finished_at=time.time()
             )
-            self.vector_store = QdrantVectorStore(
-                client=self.qdrant_client,
-                collection_name=self.collection_name,
-                embedding=base_embeddings,
-                vector_name="dense",
+            self.logger.info(
+                f"Restored {count} points into {logical} from {os.path.basename(path)}"
             )
-            self.logger.info("QdrantVectorStore wrapper initialized after recreation.")
-            
+            return qdrant_registry.reindex_status(logical)
+        except asyncio.CancelledError:
+            # Unlike a reindex, a restore is not resumable, so its shadow is dropped
+            cancelled.set()
+            qdrant_registry.set_reindex_progress(logical, status="interrupted")
+            self.logger.warning(f"Restore of {logical} interrupted (live collection untouched)")
+            await loop.run_in_executor(
+                None, lambda: qdrant_registry.drop_physical(shadow_name)
+            )
+            raise
         except Exception as e:
-            self.logger.error(f"Error recreating collection: {e}")
+            qdrant_registry.set_reindex_progress(logical, status="failed", error=str(e))
+            self.logger.error(f"Restore of {logical} failed (live collection untouched): {e}")
+            await loop.run_in_executor(
+                None, lambda: qdrant_registry.drop_physical(shadow_name)
+            )
             raise
 
     async def get_document_by_id(self, doc_id: str) -> Document:
@@ -1030,8 +1958,7 @@ class VectorStore:
 
         # Convert to Document
         point = points[0]
-        payload = point.payload
-        page_content = payload.pop("page_content", "")
+        page_content, payload = self._split_payload(point.payload)
 
         return Document(page_content=page_content, metadata=payload)
 
@@ -1043,84 +1970,358 @@ class VectorStore:
     ) -> List[str]:
         """Add multiple texts to the vector store, optionally using provided IDs."""
         if metadatas is None:
-            metadatas = [{}] * len(texts)
+            metadatas = [{} for _ in texts]
         if len(texts) != len(metadatas):
             raise ValueError("Number of texts and metadatas must match")
         if ids is not None and len(texts) != len(ids):
             raise ValueError("Number of texts and provided IDs must match")
+        if not texts:
+            return []
 
         # Ensure user_id and project_id in metadata
         for metadata in metadatas:
             metadata["user_id"] = self.user_id
             metadata["project_id"] = self.project_id
 
-        # Add batching to prevent memory issues with large numbers of documents
-        batch_size = 10  # Process 10 documents at a time
-        all_ids_returned = (
-            []
-        )  # Use a different name to avoid confusion with input 'ids'
+        # Generate UUIDs only if specific IDs are not provided
+        point_ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
 
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i : i + batch_size]
-            batch_metadatas = metadatas[i : i + batch_size]
-            batch_ids_input = ids[i : i + batch_size] if ids else None
+        started = time.perf_counter()
+        batches = self._plan_ingest_batches(texts)
+        await self._run_ingest_pipeline(texts, metadatas, point_ids, batches)
+        self._index_names(zip(point_ids, metadatas))
+        elapsed = max(time.perf_counter() - started, 1e-6)
 
-            # Generate UUIDs only if specific IDs are not provided for the batch
-            batch_point_ids = (
-                batch_ids_input
-                if batch_ids_input
-                else [str(uuid.uuid4()) for _ in range(len(batch_texts))]
-            )
-
-            # Create DENSE embeddings
-            loop = asyncio.get_running_loop()
-            dense_vectors = await loop.run_in_executor(
-                None, self.embeddings.embed_documents, batch_texts
-            )
-            
-            # Create SPARSE embeddings
-            # fastembed returns a generator, so we convert to list
-            sparse_vectors = await loop.run_in_executor(
-                None, lambda: list(self.sparse_embedding_model.embed(batch_texts))
-            )
+        self.last_ingest_stats = {
+            "documents": len(texts),
+            "batches": len(batches),
+            "seconds": round(elapsed, 3),
+            "docs_per_sec": round(len(texts) / elapsed, 1),
+        }
+        self.logger.info(
+            f"Ingested {len(texts)} documents in {len(batches)} batches "
+            f"({elapsed:.2f}s, {len(texts) / elapsed:.1f} docs/sec)"
+        )
+        return point_ids
+
+    def _plan_ingest_batches(self, texts: List[str]) -> List[tuple]:
+        """Groups consecutive texts into (start, end) batches bounded by estimated tokens and item count."""
+        max_chars = INGEST_BATCH_MAX_TOKENS * CHARS_PER_TOKEN
+        batches = []
+        batch_start, batch_chars = 0, 0
+        for i, text in enumerate(texts):
+            text_chars = len(text)
+            if i > batch_start and (
+                batch_chars + text_chars > max_chars
+                or i - batch_start >= INGEST_BATCH_MAX_ITEMS
+            ):
+                batches.append((batch_start, i))
+                batch_start, batch_chars = i, 0
+            batch_chars += text_chars
+        batches.append((batch_start, len(texts)))
+        return batches
 
-            # Prepare points for batch upsert
-            points = []
-            for j, (text, metadata, dense_vec, sparse_vec, point_id) in enumerate(
-                zip(
-                    batch_texts, batch_metadatas, dense_vectors, sparse_vectors, batch_point_ids
+    async def _run_ingest_pipeline(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        point_ids: List[str],
+        batches: List[tuple],
+    ):
+        """
+        Embeds batches concurrently (dense and sparse side by side, bounded by a semaphore)
+        while a single writer upserts finished batches. A batch keeps its slot until it is
+        queued for writing, so at most INGEST_MAX_CONCURRENCY + INGEST_QUEUE_DEPTH embedded
+        batches (plus the one being written) are held in memory however large the import.
+        """
+        loop = asyncio.get_running_loop()
+        embed_slots = asyncio.Semaphore(INGEST_MAX_CONCURRENCY)
+        ready: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_DEPTH)
+        upsert_errors: List[Exception] = []
+
+        async def embed_batch(batch_start: int, batch_end: int):
+            batch_texts = texts[batch_start:batch_end]
+            async with embed_slots:
+                # Dense (remote) and sparse (local CPU) embeddings run at the same time
+                dense_vectors, sparse_vectors = await asyncio.gather(
+                    loop.run_in_executor(None, self._embed_dense_cached, batch_texts),
+                    loop.run_in_executor(None, self._embed_sparse_cached, batch_texts),
                 )
-            ):
-                # Store the text in metadata for Qdrant
-                metadata["page_content"] = text
-
-                # Use named vectors for Hybrid Search
-                points.append(PointStruct(
-                    id=point_id, 
-                    vector={
-                        "dense": dense_vec,
-                        "sparse": rest.SparseVector(
-                            indices=sparse_vec.indices.tolist(),
-                            values=sparse_vec.values.tolist()
+                points = []
+                for offset, (dense_vec, sparse_vec) in enumerate(
+                    zip(dense_vectors, sparse_vectors)
+                ):
+                    index = batch_start + offset
+                    # Store the text in metadata for Qdrant
+                    payload = metadatas[index]
+                    payload["page_content"] = texts[index]
+                    payload["page_snippet"] = texts[index][:SNIPPET_PAYLOAD_CHARS]
+                    payload["content_hash"] = content_hash(texts[index])
+                    # Use named vectors for Hybrid Search
+                    points.append(
+                        PointStruct(
+                            id=point_ids[index],
+                            vector={**self._dense_vectors(dense_vec), "sparse": sparse_vec},
+                            payload=payload,
                         )
-                    }, 
-                    payload=metadata
-                ))
+                    )
+                # Hold the slot until the writer has room, so no new batch starts embedding
+                await ready.put(points)
 
-            # Upsert the batch
-            await loop.run_in_executor(
+        async def writer():
+            while True:
+                points = await ready.get()
+                if points is None:
+                    return
+                if upsert_errors:
+                    continue  # Keep draining so producers never block on a dead writer
+                try:
+                    await loop.run_in_executor(
+                        None,
+                        lambda: self.qdrant_client.upsert(
+                            collection_name=self.collection_name, points=points
+                        ),
+                    )
+                except Exception as e:
+                    upsert_errors.append(e)
+
+        writer_task = asyncio.create_task(writer())
+        embed_tasks = [asyncio.create_task(embed_batch(s, e)) for s, e in batches]
+        try:
+            await asyncio.gather(*embed_tasks)
+        except Exception:
+            for task in embed_tasks:
+                task.cancel()
+            raise
+        finally:
+            await ready.put(None)
+            await writer_task
+
+        if upsert_errors:
+            self.logger.error(f"Error upserting ingested batch: {upsert_errors[0]}")
+            raise upsert_errors[0]
+
+    def _build_chunks(
+        self, parent_id: str, text: str, parent_metadata: Dict[str, Any]
+    ) -> List[tuple]:
+        """Returns (chunk_id, chunk_text, chunk_metadata) for every chunk of a parent document."""
+        base_metadata = {
+            k: v
+            for k, v in parent_metadata.items()
+            if k
+            not in ("page_content", "page_snippet", "content_hash", "chunked", "chunk_count")
+        }
+        chunks = []
+        seen_hashes: Dict[str, int] = {}
+        for index, (start, end) in enumerate(split_into_chunks(text)):
+            chunk_text = text[start:end]
+            chunk_hash = content_hash(chunk_text)
+            # Chunk IDs are content-addressed, so unchanged chunks keep their ID across edits
+            occurrence = seen_hashes.get(chunk_hash, 0)
+            seen_hashes[chunk_hash] = occurrence + 1
+            chunk_id = str(
+                uuid.uuid5(CHUNK_NAMESPACE, f"{parent_id}:{chunk_hash}:{occurrence}")
+            )
+            chunk_metadata = {
+                **base_metadata,
+                "point_kind": "chunk",
+                "parent_id": str(parent_id),
+                "chunk_index": index,
+                "char_start": start,
+                "char_end": end,
+                "chunk_hash": chunk_hash,
+            }
+            chunks.append((chunk_id, chunk_text, chunk_metadata))
+        return chunks
+
+    def _parent_point(
+        self, parent_id: str, text: str, metadata: Dict[str, Any], chunk_count: int
+    ) -> PointStruct:
+        # The parent holds the full text and metadata but no vectors; only its chunks are searchable
+        payload = {
+            **metadata,
+            "page_content": text,
+            "page_snippet": text[:SNIPPET_PAYLOAD_CHARS],
+            "content_hash": content_hash(text),
+            "chunked": True,
+            "chunk_count": chunk_count,
+            "user_id": self.user_id,
+            "project_id": self.project_id,
+        }
+        return PointStruct(id=parent_id, vector={}, payload=payload)
+
+    async def add_chunked_documents(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Adds long documents in chunked mode: one parent point per document (returned ID)
+        plus one embedded point per chunk carrying parent_id and character offsets.
+        """
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        if len(texts) != len(metadatas):
+            raise ValueError("Number of texts and metadatas must match")
+        if ids is not None and len(texts) != len(ids):
+            raise ValueError("Number of texts and provided IDs must match")
+
+        parent_ids = ids if ids else [str(uuid.uuid4()) for _ in texts]
+        parent_points = []
+        chunk_ids, chunk_texts, chunk_metadatas = [], [], []
+        for text, metadata, parent_id in zip(texts, metadatas, parent_ids):
+            metadata = {**metadata, "user_id": self.user_id, "project_id": self.project_id}
+            chunks = self._build_chunks(parent_id, text, metadata)
+            parent_points.append(self._parent_point(parent_id, text, metadata, len(chunks)))
+            for chunk_id, chunk_text, chunk_metadata in chunks:
+                chunk_ids.append(chunk_id)
+                chunk_texts.append(chunk_text)
+                chunk_metadatas.append(chunk_metadata)
+
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: self.qdrant_client.upsert(
+                collection_name=self.collection_name, points=parent_points
+            ),
+        )
+        self._index_names((point.id, point.payload) for point in parent_points)
+        if chunk_texts:
+            await self.add_texts(chunk_texts, chunk_metadatas, ids=chunk_ids)
+        self.logger.debug(
+            f"Added {len(parent_ids)} chunked documents ({len(chunk_ids)} chunks)"
+        )
+        return parent_ids
+
+    async def _upsert_chunked_document(
+        self, parent_id: str, text: str, metadata: Dict[str, Any]
+    ):
+        """
+        Writes a chunked parent and re-embeds only the chunks whose text changed.
+        Chunks that are unchanged just get their offsets/metadata refreshed and
+        chunks that no longer exist are deleted.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = self._build_chunks(parent_id, text, metadata)
+        new_chunk_ids = {chunk_id for chunk_id, _, _ in chunks}
+
+        existing_chunk_ids = set()
+        offset = None
+        while True:
+            batch_points, offset = await loop.run_in_executor(
                 None,
-                lambda: self.qdrant_client.upsert(
-                    collection_name=self.collection_name, points=points
+                lambda: self.qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=Filter(
+                        must=[
+                            FieldCondition(
+                                key="parent_id", match=MatchValue(value=str(parent_id))
+                            )
+                        ]
+                    ),
+                    limit=256,
+                    offset=offset,
+                    with_payload=False,
+                    with_vectors=False,
                 ),
             )
+            existing_chunk_ids.update(str(point.id) for point in batch_points)
+            if offset is None:
+                break
+
+        stale_ids = list(existing_chunk_ids - new_chunk_ids)
+        to_embed = [c for c in chunks if c[0] not in existing_chunk_ids]
+        to_refresh = [c for c in chunks if c[0] in existing_chunk_ids]
+
+        def write_parent_and_refresh():
+            self.qdrant_client.upsert(
+                collection_name=self.collection_name,
+                points=[self._parent_point(parent_id, text, metadata, len(chunks))],
+            )
+            for chunk_id, chunk_text, chunk_metadata in to_refresh:
+                self.qdrant_client.overwrite_payload(
+                    collection_name=self.collection_name,
+                    payload={
+                        **chunk_metadata,
+                        "page_content": chunk_text,
+                        "page_snippet": chunk_text[:SNIPPET_PAYLOAD_CHARS],
+                    },
+                    points=[chunk_id],
+                )
+            if stale_ids:
+                self.qdrant_client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=stale_ids),
+                )
 
-            all_ids_returned.extend(batch_point_ids)
+        await loop.run_in_executor(None, write_parent_and_refresh)
+        self._index_names([(parent_id, metadata)])
+        if to_embed:
+            await self.add_texts(
+                [c[1] for c in to_embed], [c[2] for c in to_embed], ids=[c[0] for c in to_embed]
+            )
+        self.logger.debug(
+            f"Chunked document {parent_id}: {len(to_embed)} re-embedded, "
+            f"{len(to_refresh)} unchanged, {len(stale_ids)} removed"
+        )
 
-            # Give the event loop a chance to process other tasks
-            await asyncio.sleep(0.1)
+    def _delete_chunks_sync(self, parent_id: str):
+        self.qdrant_client.delete(
+            collection_name=self.collection_name,
+            points_selector=rest.FilterSelector(
+                filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="parent_id", match=MatchValue(value=str(parent_id))
+                        )
+                    ]
+                )
+            ),
+        )
 
-        return all_ids_returned
+    async def _collapse_to_parents(
+        self,
+        documents: List[Document],
+        k: int,
+        payload_fields: Optional[List[str]] = None,
+        max_snippet_chars: Optional[int] = None,
+    ) -> List[Document]:
+        """
+        Groups chunk hits by parent (best rank wins) and returns the parent documents,
+        projected to payload_fields and trimmed to max_snippet_chars like any other hit.
+        """
+        groups: Dict[str, List[Document]] = {}
+        for doc in documents:
+            key = doc.metadata.get("parent_id") or doc.metadata.get("id") or str(id(doc))
+            groups.setdefault(key, []).append(doc)
+        selected = list(groups.items())[:k]
+
+        parent_ids = [key for key, docs in selected if docs[0].metadata.get("parent_id")]
+        parents = {}
+        if parent_ids:
+            points = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: self.qdrant_client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=parent_ids,
+                    with_payload=self._payload_selector(payload_fields, max_snippet_chars),
+                ),
+            )
+            await self._fill_missing_snippets(points, max_snippet_chars)
+            parents = {str(point.id): point.payload for point in points}
+
+        collapsed = []
+        for key, docs in selected:
+            payload = parents.get(key)
+            if payload is None:
+                collapsed.append(docs[0])
+                continue
+            page_content, payload = self._split_payload(payload, max_snippet_chars)
+            payload["matched_chunks"] = [
+                [d.metadata.get("char_start"), d.metadata.get("char_end")] for d in docs
+            ]
+            collapsed.append(Document(page_content=page_content, metadata=payload))
+        return collapsed
 
     async def update_doc(
         self, doc_id: str, content: str, metadata: Optional[Dict[str, Any]] = None
@@ -1146,25 +2347,29 @@ class VectorStore:
                 self.logger.error(f"Error getting existing document: {str(e)}")
                 raise
 
+            if metadata is None:
+                metadata = {}
+            if point[0].payload.get("chunked") or metadata.get("type") in CHUNKED_CONTENT_TYPES:
+                await self._upsert_chunked_document(doc_id, content, metadata)
+                self.logger.debug(f"Updated chunked document with ID: {doc_id}")
+                return doc_id
+
             loop = asyncio.get_running_loop()
 
             # Generate DENSE embeddings for new content
             new_dense_vector = await loop.run_in_executor(
-                None, lambda: self.embeddings.embed_documents([content])[0]
+                None, lambda: self._embed_dense_cached([content])[0]
             )
             
             # Generate SPARSE embeddings for new content
-            new_sparse_vector_gen = await loop.run_in_executor(
-                None, lambda: list(self.sparse_embedding_model.embed([content]))
+            new_sparse_vector = await loop.run_in_executor(
+                None, lambda: self._embed_sparse_cached([content])[0]
             )
-            new_sparse_vector = new_sparse_vector_gen[0]
-
-            # Prepare metadata payload
-            if metadata is None:
-                metadata = {}
 
             # Make sure page_content is in the payload
             metadata["page_content"] = content
+            metadata["page_snippet"] = content[:SNIPPET_PAYLOAD_CHARS]
+            metadata["content_hash"] = content_hash(content)
             metadata["user_id"] = self.user_id
             metadata["project_id"] = self.project_id
 
@@ -1177,11 +2382,8 @@ class VectorStore:
                         PointStruct(
                             id=doc_id, 
                             vector={
-                                "dense": new_dense_vector,
-                                "sparse": rest.SparseVector(
-                                    indices=new_sparse_vector.indices.tolist(),
-                                    values=new_sparse_vector.values.tolist()
-                                )
+                                **self._dense_vectors(new_dense_vector),
+                                "sparse": new_sparse_vector,
                             }, 
                             payload=metadata
                         )
@@ -1189,6 +2391,7 @@ class VectorStore:
                 ),
             )
 
+            self._index_names([(doc_id, metadata)])
             self.logger.debug(f"Updated document with ID: {doc_id}")
             return doc_id
 
@@ -1197,25 +2400,40 @@ class VectorStore:
             raise
 
     async def similarity_search(
-        self, query_text: str, k: int = 4, filter: Optional[Dict[str, Any]] = None
+        self,
+        query_text: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        collapse_to_parents: bool = False,
+        payload_fields: Optional[List[str]] = None,
+        max_snippet_chars: Optional[int] = None,
     ) -> List[Document]:
-        """Search for similar documents using Hybrid Search (Dense + Sparse)."""
+        """
+        Search for similar documents using Hybrid Search (Dense + Sparse).
+
+        Chunked documents come back as individual chunk hits (with parent_id and
+        char_start/char_end in metadata). With collapse_to_parents=True, hits are
+        grouped per parent and the full parent documents are returned instead.
+
+        payload_fields limits the metadata keys Qdrant returns, and max_snippet_chars
+        trims page_content; snippets up to SNIPPET_PAYLOAD_CHARS are served from the
+        stored page_snippet so the full text is never transferred.
+        """
+        await self._flush_pending_writes()
         try:
             # Convert the filter dict to Qdrant's filter format
             qdrant_filter = self._build_qdrant_filter(filter)
+            requested_k, requested_fields = k, payload_fields
+            if collapse_to_parents:
+                k = k * 4  # Over-fetch so enough distinct parents survive grouping
+                if payload_fields is not None:
+                    payload_fields = [*payload_fields, "parent_id", "char_start", "char_end", "id"]
+            with_payload = self._payload_selector(payload_fields, max_snippet_chars)
 
             loop = asyncio.get_running_loop()
 
-            # Get DENSE embedding for query
-            query_dense_vector = await loop.run_in_executor(
-                None, self.embeddings.embed_query, query_text
-            )
-            
-            # Get SPARSE embedding for query
-            query_sparse_vector_gen = await loop.run_in_executor(
-                None, lambda: list(self.sparse_embedding_model.embed([query_text]))
-            )
-            query_sparse_vector = query_sparse_vector_gen[0]
+            # Get DENSE and SPARSE embeddings for query (cached, deduplicated)
+            query_dense_vector, query_sparse_vector = await self._embed_query(query_text)
 
             # Perform Hybrid Search using Prefetch (for RRF or simple fusion)
             # We will use a simple fusion approach: search both and combine results
@@ -1238,25 +2456,12 @@ class VectorStore:
                     None,
                     lambda: self.qdrant_client.query_points(
                         collection_name=self.collection_name,
-                        prefetch=[
-                            rest.Prefetch(
-                                query=query_dense_vector,
-                                using="dense",
-                                limit=k,
-                                filter=qdrant_filter,
-                            ),
-                            rest.Prefetch(
-                                query=rest.SparseVector(
-                                    indices=query_sparse_vector.indices.tolist(),
-                                    values=query_sparse_vector.values.tolist(),
-                                ),
-                                using="sparse",
-                                limit=k,
-                                filter=qdrant_filter,
-                            ),
-                        ],
+                        prefetch=self._hybrid_prefetch(
+                            query_dense_vector, query_sparse_vector, k, qdrant_filter
+                        ),
                         query=rest.FusionQuery(fusion=rest.Fusion.RRF), # Reciprocal Rank Fusion
                         limit=k,
+                        with_payload=with_payload,
                     ).points
                 )
             except AttributeError:
@@ -1268,34 +2473,183 @@ class VectorStore:
                         collection_name=self.collection_name,
                         query_vector=rest.NamedVector(
                             name="dense",
-                            vector=query_dense_vector
+                            vector=self._reduce_dense(query_dense_vector)
                         ),
                         limit=k,
                         query_filter=qdrant_filter,
+                        with_payload=with_payload,
                     ),
                 )
+            await self._fill_missing_snippets(search_result, max_snippet_chars)
 
             # Convert results to Documents
-            documents = []
-            for scored_point in search_result:
-                if hasattr(scored_point, "payload") and scored_point.payload:
-                    # Extract page_content and metadata from payload
-                    payload = scored_point.payload
-                    page_content = payload.pop("page_content", "")
-                    metadata = payload
-
-                    documents.append(
-                        Document(page_content=page_content, metadata=metadata)
-                    )
+            documents = self._points_to_documents(search_result, max_snippet_chars)
 
+            if collapse_to_parents:
+                return await self._collapse_to_parents(
+                    documents, requested_k, requested_fields, max_snippet_chars
+                )
             return documents
 
         except Exception as e:
             self.logger.error(f"Error in similarity_search: {str(e)}")
             raise
 
+    async def search_many(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        payload_fields: Optional[List[str]] = None,
+        max_snippet_chars: Optional[int] = None,
+    ) -> List[List[Document]]:
+        """
+        Runs several hybrid searches at once and returns one result list per query, in input order.
+
+        All uncached queries are embedded with a single dense and a single sparse call,
+        and the searches go to Qdrant as one batch request.
+        """
+        if not queries:
+            return []
+        await self._flush_pending_writes()
+        try:
+            qdrant_filter = self._build_qdrant_filter(filter)
+            with_payload = self._payload_selector(payload_fields, max_snippet_chars)
+            embedded = await self._embed_queries(queries)
+            loop = asyncio.get_running_loop()
+
+            try:
+                responses = await loop.run_in_executor(
+                    None,
+                    lambda: self.qdrant_client.query_batch_points(
+                        collection_name=self.collection_name,
+                        requests=[
+                            rest.QueryRequest(
+                                prefetch=self._hybrid_prefetch(
+                                    dense, sparse, k, qdrant_filter
+                                ),
+                                query=rest.FusionQuery(fusion=rest.Fusion.RRF),
+                                limit=k,
+                                with_payload=with_payload,
+                            )
+                            for dense, sparse in embedded
+                        ],
+                    ),
+                )
+                results = [response.points for response in responses]
+            except AttributeError:
+                self.logger.warning("Qdrant client might be outdated. Falling back to Dense-only batch search.")
+                results = await loop.run_in_executor(
+                    None,
+                    lambda: self.qdrant_client.search_batch(
+                        collection_name=self.collection_name,
+                        requests=[
+                            rest.SearchRequest(
+                                vector=rest.NamedVector(
+                                    name="dense", vector=self._reduce_dense(dense)
+                                ),
+                                limit=k,
+                                filter=qdrant_filter,
+                                with_payload=with_payload,
+                            )
+                            for dense, _ in embedded
+                        ],
+                    ),
+                )
+
+            # One retrieve covers legacy points missing page_snippet across all queries
+            await self._fill_missing_snippets(
+                [point for points in results for point in points], max_snippet_chars
+            )
+            return [self._points_to_documents(points, max_snippet_chars) for points in results]
+
+        except Exception as e:
+            self.logger.error(f"Error in search_many: {str(e)}")
+            raise
+
     # ... (rest of the file remains unchanged, including _build_qdrant_filter and others)
 
+    async def _flush_pending_writes(self):
+        if self.before_read is None:
+            return
+        try:
+            await self.before_read()
+        except Exception as e:
+            # A failed flush keeps its updates queued; serve the read from the current index
+            self.logger.warning(f"Could not flush pending writes before read: {e}")
+
+    async def update_many_in_knowledge_base(self, updates: List[tuple]):
+        """
+        Batched update_in_knowledge_base for (doc_id, new_content, new_metadata) tuples.
+
+        Existing payloads are fetched with one retrieve (no vectors, since the content
+        is being replaced), all plain texts are embedded with one dense and one sparse
+        call and written with one upsert. Chunked documents go through the chunk index,
+        and points that don't exist yet or metadata-only updates use the single-item path.
+        """
+        if not updates:
+            return
+        loop = asyncio.get_running_loop()
+        points = await loop.run_in_executor(
+            None,
+            lambda: self.qdrant_client.retrieve(
+                collection_name=self.collection_name,
+                ids=[doc_id for doc_id, _, _ in updates],
+                with_payload=True,
+                with_vectors=False,
+            ),
+        )
+        existing = {str(point.id): point.payload or {} for point in points}
+
+        plain = []
+        for doc_id, new_content, new_metadata in updates:
+            payload = existing.get(point_key(doc_id))
+            if payload is None or new_content is None:
+                await self.update_in_knowledge_base(doc_id, new_content, new_metadata)
+                continue
+            payload = dict(payload)
+            for key, value in (new_metadata or {}).items():
+                if value is None:
+                    payload.pop(key, None)
+                else:
+                    payload[key] = value
+            payload["user_id"] = self.user_id
+            payload["project_id"] = self.project_id
+            if payload.get("chunked") or payload.get("type") in CHUNKED_CONTENT_TYPES:
+                for key in ("page_content", "page_snippet", "content_hash"):
+                    payload.pop(key, None)
+                await self._upsert_chunked_document(doc_id, new_content, payload)
+                continue
+            payload["page_content"] = new_content
+            payload["page_snippet"] = new_content[:SNIPPET_PAYLOAD_CHARS]
+            payload["content_hash"] = content_hash(new_content)
+            plain.append((doc_id, new_content, payload))
+
+        if plain:
+            texts = [text for _, text, _ in plain]
+            dense_vectors, sparse_vectors = await asyncio.gather(
+                loop.run_in_executor(None, self._embed_dense_cached, texts),
+                loop.run_in_executor(None, self._embed_sparse_cached, texts),
+            )
+            await loop.run_in_executor(
+                None,
+                lambda: self.qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=[
+                        PointStruct(
+                            id=doc_id,
+                            vector={**self._dense_vectors(dense), "sparse": sparse},
+                            payload=payload,
+                        )
+                        for (doc_id, _, payload), dense, sparse in zip(
+                            plain, dense_vectors, sparse_vectors
+                        )
+                    ],
+                ),
+            )
+            self._index_names([(doc_id, payload) for doc_id, _, payload in plain])
+        self.logger.debug(f"Batch-updated {len(updates)} documents ({len(plain)} re-embedded together)")
+
     async def update_in_knowledge_base(
         self, doc_id: str, new_content: str = None, new_metadata: Dict[str, Any] = None
     ):
@@ -1312,6 +2666,7 @@ class VectorStore:
             # Prepare update data
             current_metadata = {}
             current_dense_vector = None
+            current_dense_full_vector = None
             current_sparse_vector = None
 
             # Try to get existing point data
@@ -1331,6 +2686,7 @@ class VectorStore:
                     vectors = points[0].vector
                     if isinstance(vectors, dict):
                         current_dense_vector = vectors.get("dense")
+                        current_dense_full_vector = vectors.get("dense_full")
                         current_sparse_vector = vectors.get("sparse")
                     else:
                         current_dense_vector = vectors # Fallback if not named yet
@@ -1349,35 +2705,53 @@ class VectorStore:
                     else:
                         current_metadata[key] = value
 
+            # Chunked documents (and long-form types being re-saved) go through the chunk index
+            if current_metadata.get("chunked") or (
+                new_content and current_metadata.get("type") in CHUNKED_CONTENT_TYPES
+            ):
+                content = new_content or current_metadata.get("page_content", "")
+                current_metadata.pop("page_content", None)
+                current_metadata.pop("page_snippet", None)
+                current_metadata.pop("content_hash", None)
+                await self._upsert_chunked_document(doc_id, content, current_metadata)
+                self.logger.info(f"Successfully updated chunked document with ID: {doc_id}")
+                return True
+
             # Get vectors - either from new content or use existing
-            dense_vector_to_use = None
+            dense_vectors_to_use = None
             sparse_vector_to_use = None
             
             if new_content:
                 # Compute new embeddings
-                dense_vector_to_use = await loop.run_in_executor(
-                    None, lambda: self.embeddings.embed_documents([new_content])[0]
+                dense_vectors_to_use = self._dense_vectors(
+                    await loop.run_in_executor(
+                        None, lambda: self._embed_dense_cached([new_content])[0]
+                    )
                 )
-                sparse_gen = await loop.run_in_executor(
-                    None, lambda: list(self.sparse_embedding_model.embed([new_content]))
+                sparse_vector_to_use = await loop.run_in_executor(
+                    None, lambda: self._embed_sparse_cached([new_content])[0]
                 )
-                sparse_vector_to_use = sparse_gen[0]
                 
                 current_metadata["page_content"] = new_content
+                current_metadata["page_snippet"] = new_content[:SNIPPET_PAYLOAD_CHARS]
+                current_metadata["content_hash"] = content_hash(new_content)
             elif current_dense_vector is not None:
                 # Use existing vectors if no new content
-                dense_vector_to_use = current_dense_vector
+                dense_vectors_to_use = {"dense": current_dense_vector}
+                if current_dense_full_vector is not None:
+                    dense_vectors_to_use["dense_full"] = current_dense_full_vector
                 sparse_vector_to_use = current_sparse_vector
             else:
                 # Fallback: generate from metadata
                 fallback_text = json.dumps(current_metadata)
-                dense_vector_to_use = await loop.run_in_executor(
-                    None, lambda: self.embeddings.embed_documents([fallback_text])[0]
+                dense_vectors_to_use = self._dense_vectors(
+                    await loop.run_in_executor(
+                        None, lambda: self._embed_dense_cached([fallback_text])[0]
+                    )
                 )
-                sparse_gen = await loop.run_in_executor(
-                    None, lambda: list(self.sparse_embedding_model.embed([fallback_text]))
+                sparse_vector_to_use = await loop.run_in_executor(
+                    None, lambda: self._embed_sparse_cached([fallback_text])[0]
                 )
-                sparse_vector_to_use = sparse_gen[0]
                 
                 self.logger.warning(
                     f"Generated fallback vector for doc {doc_id} using metadata as content"
@@ -1399,7 +2773,7 @@ class VectorStore:
             point_to_upsert = rest.PointStruct(
                 id=doc_id, 
                 vector={
-                    "dense": dense_vector_to_use,
+                    **dense_vectors_to_use,
                     "sparse": final_sparse_vector
                 }, 
                 payload=current_metadata
@@ -1415,6 +2789,7 @@ class VectorStore:
                 ),
             )
 
+            self._index_names([(doc_id, current_metadata)])
             self.logger.info(f"Successfully updated document with ID: {doc_id}")
             return True  # Return success indicator
 
@@ -1426,10 +2801,10 @@ class VectorStore:
     def close(self):
         """Properly close the vector store connections"""
         try:
-            # Close Qdrant client connection if possible
-            if hasattr(self, "qdrant_client"):
-                if hasattr(self.qdrant_client, "close"):
-                    self.qdrant_client.close()
+            # Release our handle; the shared Qdrant client stays open for other projects
+            if getattr(self, "qdrant_client", None) is not None:
+                qdrant_registry.release(self.logical_collection_name)
+                self.qdrant_client = None
 
             # Also clean up the embedding model if possible
             if hasattr(self, "embeddings") and hasattr(self.embeddings, "embeddings"):
@@ -1449,10 +2824,7 @@ class VectorStore:
                 f"Attempting to delete entire Qdrant collection: {self.collection_name}"
             )
             await asyncio.get_running_loop().run_in_executor(
-                None,
-                lambda: self.qdrant_client.delete_collection(
-                    collection_name=self.collection_name, timeout=60  # Add timeout
-                ),
+                None, lambda: qdrant_registry.drop_collection(self.logical_collection_name)
             )
             self.logger.info(
                 f"Successfully deleted Qdrant collection: {self.collection_name}"
@@ -1478,7 +2850,10 @@ class VectorStore:
                     ),
                     FieldCondition(key="id", match=MatchValue(value=item_id)),
                     FieldCondition(key="type", match=MatchValue(value=item_type)),
-                ]
+                ],
+                must_not=[
+                    FieldCondition(key="point_kind", match=MatchValue(value="chunk"))
+                ],
             )
 
             # Get matching points
@@ -1522,10 +2897,7 @@ class VectorStore:
             # Delete the collection
             try:
                 await asyncio.get_running_loop().run_in_executor(
-                    None,
-                    lambda: self.qdrant_client.delete_collection(
-                        collection_name=self.collection_name
-                    ),
+                    None, lambda: qdrant_registry.drop_collection(self.logical_collection_name)
                 )
                 self.logger.debug("Existing collection deleted successfully")
             except Exception as e:
@@ -1536,13 +2908,14 @@ class VectorStore:
             # Create new collection
             await asyncio.get_running_loop().run_in_executor(
                 None,
-                lambda: self.qdrant_client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.embedding_size, distance=Distance.COSINE
-                    ),
+                lambda: qdrant_registry.create_collection(
+                    self.collection_name,
+                    self.embedding_size,
+                    self.rescore_size,
                 ),
             )
+            self._name_index = None
+            self._rebuild_langchain_wrapper()
             self.logger.debug("New collection created successfully")
 
             # Removed backup restoration logic
@@ -104,6 +104,7 @@ const openaiModels = [
 // Embedding Models List - Object structure for consistency
 const embeddingModels = [
   { id: "models/gemini-embedding-001", name: "Google Text Embedding 001" },
+  { id: "fastembed/BAAI/bge-small-en-v1.5", name: "BGE Small v1.5 (Local, Offline)" },
 ];
 
 // Define the form schema using Zod